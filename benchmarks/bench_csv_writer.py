@@ -0,0 +1,102 @@
+"""
+Compares the pandas CSV path with the typed CSVEncoder on synthetic Firebird-like rows.
+
+Both writers receive the same ``fetchmany``-sized batches and write to a temporary file, so the
+numbers only cover encoding and writing. The encoder observes every batch for the column-wide
+formats, as the batched export does, and writes the same bytes as pandas. The pandas path is what execute_query_to_csv did before
+CSVEncoder: a DataFrame per batch and ``to_csv``.
+
+Usage: python -m benchmarks.bench_csv_writer [--rows 10000 1000000 10000000] [--batch-size 10000]
+"""
+import argparse
+import datetime
+import decimal
+import os
+import tempfile
+import time
+
+from firebird.CSVEncoder import CSVEncoder
+
+DESCRIPTION = [
+    ('ID', int, 11, 4, 0, 0, False),
+    ('CUSTOMER', str, 60, 60, 0, 0, True),
+    ('AMOUNT', decimal.Decimal, 20, 8, 18, -2, True),
+    ('RATIO', float, 17, 8, 0, 0, True),
+    ('INVOICE_DATE', datetime.date, 10, 4, 0, 0, True),
+    ('UPDATED_AT', datetime.datetime, 22, 8, 0, 0, True),
+    ('NOTES', str, 200, 200, 0, 0, True),
+]
+
+
+def make_batch(batch_size):
+    base_time = datetime.datetime(2024, 1, 1, 8, 0, 0)
+    batch = []
+    for i in range(batch_size):
+        batch.append((
+            i,
+            f"Customer {i % 997}",
+            decimal.Decimal(i % 100000) / 100,
+            (i % 1000) / 7,
+            datetime.date(2024, 1 + i % 12, 1 + i % 28),
+            base_time + datetime.timedelta(seconds=i),
+            None if i % 5 else f'Note "{i}", with comma',
+        ))
+    return batch
+
+
+def batches(total_rows, batch):
+    remaining = total_rows
+    while remaining > 0:
+        yield batch[:remaining]
+        remaining -= len(batch)
+
+
+def write_with_pandas(path, total_rows, batch):
+    import pandas as pd
+    columns = [desc[0] for desc in DESCRIPTION]
+    with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+        pd.DataFrame(columns=columns).to_csv(csv_file, index=False)
+        for rows in batches(total_rows, batch):
+            pd.DataFrame(rows, columns=columns).to_csv(csv_file, index=False, header=False)
+
+
+def write_with_encoder(path, total_rows, batch):
+    encoder = CSVEncoder(DESCRIPTION)
+    with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+        csv_writer = encoder.writer(csv_file)
+        encoder.write_header(csv_writer)
+        for rows in batches(total_rows, batch):
+            encoder.observe(rows)
+            encoder.write_rows(csv_writer, rows)
+
+
+def measure(writer, path, total_rows, batch):
+    start_time = time.perf_counter()
+    writer(path, total_rows, batch)
+    return time.perf_counter() - start_time
+
+
+def run(row_counts, batch_size):
+    batch = make_batch(batch_size)
+    import_start = time.perf_counter()
+    import pandas  # noqa: F401
+    print(f"pandas import: {time.perf_counter() - import_start:.2f} s")
+    print(f"{'rows':>10} {'pandas s':>10} {'encoder s':>10} {'pandas rows/s':>14} {'encoder rows/s':>15} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pandas_path = os.path.join(tmp_dir, "pandas.csv")
+        encoder_path = os.path.join(tmp_dir, "encoder.csv")
+        for total_rows in row_counts:
+            pandas_time = measure(write_with_pandas, pandas_path, total_rows, batch)
+            encoder_time = measure(write_with_encoder, encoder_path, total_rows, batch)
+            print(f"{total_rows:>10} {pandas_time:>10.2f} {encoder_time:>10.2f} {total_rows / pandas_time:>14,.0f} "
+                  f"{total_rows / encoder_time:>15,.0f} {pandas_time / encoder_time:>7.2f}x")
+            os.remove(pandas_path)
+            os.remove(encoder_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+    run(args.rows, args.batch_size)
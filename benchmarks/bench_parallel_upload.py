@@ -0,0 +1,49 @@
+"""
+Compares single-channel and parallel multi-channel uploads against a local SFTP stand-in.
+
+Usage: python -m benchmarks.bench_parallel_upload [--size-mb 64] [--latency-ms 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.sftp_stub_server import StubSFTPServer
+from sftp.SFTPHandler import SFTPHandler
+
+
+def run(size_mb, latency_ms, chunk_mb, parallelism_levels):
+    with tempfile.TemporaryDirectory() as local_dir, tempfile.TemporaryDirectory() as remote_dir:
+        local_path = os.path.join(local_dir, "extract.csv")
+        with open(local_path, "wb") as local_file:
+            for _ in range(size_mb):
+                local_file.write(os.urandom(1024 * 1024))
+
+        with StubSFTPServer(remote_dir, latency=latency_ms / 1000) as server:
+            handler = SFTPHandler("127.0.0.1", server.username, server.password, port=server.port)
+            handler.connect()
+            try:
+                print(f"{size_mb} MB file, {latency_ms} ms per write request, {chunk_mb} MB chunks")
+                baseline = None
+                for parallelism in parallelism_levels:
+                    remote_path = f"/extract_{parallelism}.csv"
+                    start_time = time.perf_counter()
+                    handler.upload_file(local_path, remote_path, parallelism=parallelism,
+                                        chunk_size=chunk_mb * 1024 * 1024)
+                    elapsed = time.perf_counter() - start_time
+                    assert os.path.getsize(os.path.join(remote_dir, remote_path.lstrip("/"))) == size_mb * 1024 * 1024
+                    baseline = baseline or elapsed
+                    print(f"parallelism={parallelism:<3} {elapsed:8.2f} s  {size_mb / elapsed:8.1f} MB/s  "
+                          f"x{baseline / elapsed:.2f}")
+            finally:
+                handler.close_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--chunk-mb", type=int, default=4)
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    run(args.size_mb, args.latency_ms, args.chunk_mb, args.parallelism)
@@ -0,0 +1,128 @@
+"""
+Stress test of the SQLite metadata store: many job threads finishing at the same time.
+
+Every simulated completion writes what ``job`` writes: the task status and a task_runs row.
+Three setups are compared:
+
+- per-call: a new connection per completion in rollback-journal mode, as main.py did before
+- shared WAL: one long-lived WAL connection shared by all threads, one commit per write
+- shared WAL batched: the same connection with queued writes flushed together
+
+Usage: python -m benchmarks.bench_sqlite_store [--jobs 500] [--threads 64] [--tasks 100]
+"""
+import argparse
+import concurrent.futures
+import importlib.util
+import os
+import tempfile
+import threading
+import time
+
+from db.SQLiteHandler import SQLiteHandler
+from utils.metrics import RunMetrics
+
+_spec = importlib.util.spec_from_file_location(
+    "create_db", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create-db.py"))
+create_db = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(create_db)
+
+
+def prepare(database_path, tasks):
+    create_db.create_database(database_path)
+    handler = SQLiteHandler(database_path, journal_mode="DELETE")
+    handler.connect()
+    task_ids = [handler.insert_task(f"report_{index}", "SELECT * FROM employees", "report.csv",
+                                    "/upload/report.csv", "sftp.example.com", "user", "secret", "0 * * * *")
+                for index in range(tasks)]
+    handler.close()
+    return task_ids
+
+
+def completion_record(task_id):
+    run = RunMetrics(task_id, "report")
+    run.rows, run.bytes = 1000, 65536
+    run.finish("completed")
+    return run.as_record()
+
+
+def per_call(database_path):
+    def complete(task_id):
+        # Equivalente al código anterior: conexión nueva, journal por defecto y timeout de 5 segundos
+        handler = SQLiteHandler(database_path, journal_mode="DELETE", synchronous="FULL", busy_timeout=5.0)
+        handler.connect()
+        try:
+            handler.update_task_status(task_id, "completed")
+            handler.insert_task_run(completion_record(task_id))
+        finally:
+            handler.close()
+    return complete, None
+
+
+def shared_wal(database_path):
+    handler = SQLiteHandler(database_path)
+    handler.connect()
+
+    def complete(task_id):
+        handler.update_task_status(task_id, "completed")
+        handler.insert_task_run(completion_record(task_id))
+    return complete, handler
+
+
+def shared_wal_batched(database_path):
+    handler = SQLiteHandler(database_path, flush_interval=0.2)
+    handler.connect()
+
+    def complete(task_id):
+        handler.queue_task_status(task_id, "completed")
+        handler.queue_task_run(completion_record(task_id))
+    return complete, handler
+
+
+def run_setup(name, setup, jobs, threads, tasks):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path = os.path.join(tmp_dir, "scheduled_tasks.db")
+        task_ids = prepare(database_path, tasks)
+        complete, handler = setup(database_path)
+        errors = []
+        errors_lock = threading.Lock()
+        start_barrier = threading.Barrier(threads)
+
+        def worker(job_index):
+            if job_index < threads:
+                start_barrier.wait()
+            try:
+                complete(task_ids[job_index % len(task_ids)])
+            except Exception as e:
+                with errors_lock:
+                    errors.append(str(e))
+
+        start_time = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, range(jobs)))
+        if handler:
+            handler.close()
+        elapsed = time.perf_counter() - start_time
+
+        check = SQLiteHandler(database_path)
+        check.connect()
+        stored = check.connection.execute("SELECT COUNT(*) FROM task_runs").fetchone()[0]
+        check.close()
+        locked = sum("locked" in error for error in errors)
+        print(f"{name:<20} {elapsed:7.2f} s  {jobs / elapsed:9.0f} completions/s  "
+              f"{stored:>6} runs stored  {len(errors):>4} errors ({locked} 'database is locked')")
+
+
+def run(jobs, threads, tasks):
+    print(f"{jobs} job completions from {threads} threads over {tasks} tasks")
+    for name, setup in (("per-call", per_call), ("shared WAL", shared_wal),
+                        ("shared WAL batched", shared_wal_batched)):
+        run_setup(name, setup, jobs, threads, tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--tasks", type=int, default=100)
+    args = parser.parse_args()
+    run(args.jobs, args.threads, args.tasks)
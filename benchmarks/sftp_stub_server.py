@@ -0,0 +1,130 @@
+"""
+In-process SFTP server backed by a local directory, used as a stand-in for partner hosts
+in the benchmarks. An optional per-request delay emulates a high-latency link.
+"""
+import os
+import socket
+import threading
+import time
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, ServerInterface
+from paramiko.sftp import SFTP_OK
+
+
+class _Server(ServerInterface):
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.username, self.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _Handle(SFTPHandle):
+    latency = 0.0
+
+    def write(self, offset, data):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().write(offset, data)
+
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        if attr.st_size is not None:
+            self.writefile.truncate(attr.st_size)
+        return SFTP_OK
+
+
+class _SFTPInterface(SFTPServerInterface):
+    root = None
+    latency = 0.0
+
+    def _path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def open(self, path, flags, attr):
+        fd = os.open(self._path(path), flags, 0o644)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = _Handle(flags)
+        handle.latency = self.latency
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def stat(self, path):
+        return SFTPAttributes.from_stat(os.stat(self._path(path)))
+
+    lstat = stat
+
+    def remove(self, path):
+        os.remove(self._path(path))
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        os.rename(self._path(oldpath), self._path(newpath))
+        return SFTP_OK
+
+    posix_rename = rename
+
+    def canonicalize(self, path):
+        return "/" + path.lstrip("/")
+
+
+class StubSFTPServer:
+    """
+    Local SFTP server listening on 127.0.0.1 on a random port.
+
+    :param root: Directory where uploaded files are stored
+    :param latency: Seconds slept before every write request is served
+    """
+
+    def __init__(self, root, latency=0.0, username="bench", password="bench"):
+        self.root = root
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self._transports = []
+
+    def __enter__(self):
+        self.socket.listen(16)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.socket.close()
+        for transport in self._transports:
+            transport.close()
+
+    def _accept(self):
+        interface = type("Interface", (_SFTPInterface,), {"root": self.root, "latency": self.latency})
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, interface)
+            transport.start_server(server=_Server(self.username, self.password))
+            self._transports.append(transport)
@@ -0,0 +1,200 @@
+"""
+Command line entry point.
+
+    python -m cli run                    Runs the scheduler as a headless service
+    python -m cli gui                    Runs the scheduler with the Tkinter interface
+    python -m cli add --name ... --query ... --output-file ... --cron "0 * * * *"
+    python -m cli list [--status error] [--disabled]
+    python -m cli run-now TASK_ID [--force]
+    python -m cli disable TASK_ID / python -m cli enable TASK_ID
+
+Each command imports only what it uses, so ``run`` starts without tkinter and ``list`` without the
+Firebird and SFTP code paths being exercised. Tasks added, disabled or enabled here are picked up by a
+running service on its next reload (TASK_RELOAD_INTERVAL).
+"""
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+
+def run_service(args):
+    import service
+
+    stop = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+
+    service.start_scheduler()
+    logging.info("Scheduler running without interface. Press Ctrl+C to stop.")
+    try:
+        while not stop.wait(1):
+            pass
+    finally:
+        logging.info("Stopping the scheduler, waiting for running tasks to finish.")
+        service.stop_scheduler(wait=True)
+    return 0
+
+
+def run_gui(args):
+    import main
+    import service
+
+    service.start_scheduler()
+    try:
+        main.open_gui()
+    finally:
+        service.stop_scheduler(wait=False)
+    return 0
+
+
+def add_task(args):
+    service = _quiet_service()
+
+    try:
+        destinations = service.parse_destinations("\n".join(args.destination))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.format not in service.OUTPUT_FORMATS:
+        print(f"Unsupported format: {args.format}", file=sys.stderr)
+        return 2
+    if args.executor not in service.EXECUTORS:
+        print(f"Unsupported executor: {args.executor}", file=sys.stderr)
+        return 2
+    if len(args.cron.split()) != 5:
+        print("The cron expression must have five fields.", file=sys.stderr)
+        return 2
+    if (args.watermark_column and args.partition_column
+            and args.watermark_column.upper() != args.partition_column.upper()):
+        print("An incremental task can only be partitioned by its watermark column.", file=sys.stderr)
+        return 2
+
+    task_id = service.save_task_to_db({
+        "name": args.name,
+        "query": args.query,
+        "output_file": args.output_file,
+        "remote_path": args.remote_path,
+        "sftp_host": args.sftp_host,
+        "sftp_user": args.sftp_user,
+        "sftp_password": args.sftp_password,
+        "cron_expression": args.cron,
+        "output_format": args.format,
+        "output_codec": args.codec,
+        "codec_level": args.codec_level,
+        "executor": args.executor,
+        "watermark_column": args.watermark_column,
+        "partition_column": args.partition_column,
+        "partitions": args.partitions,
+        "destinations": destinations,
+        "part_max_rows": args.part_max_rows,
+        "part_max_bytes": args.part_max_mb * 1024 * 1024 if args.part_max_mb else None,
+        "force_upload": args.force_upload,
+        "enabled": not args.disabled
+    }, schedule=False)
+    print(task_id)
+    return 0
+
+
+def list_tasks(args):
+    service = _quiet_service()
+
+    enabled = None if args.all else not args.disabled
+    columns = ("id", "task_name", "enabled", "status", "cron_expression")
+    print(f"{'ID':>6}  {'ENABLED':<7}  {'STATUS':<10}  {'CRON':<16}  NAME")
+    service.metadata_store.connect()
+    for task in service.metadata_store.iter_tasks(page_size=service.task_page_size, columns=columns,
+                                                  status=args.status, enabled=enabled):
+        print(f"{task['id']:>6}  {'yes' if task['enabled'] else 'no':<7}  {task['status'] or '':<10}  "
+              f"{task['cron_expression'] or '':<16}  {task['task_name']}")
+    return 0
+
+
+def run_task_now(args):
+    import service
+
+    if not service.run_task_now(args.task_id, force_upload=args.force):
+        print(f"Task {args.task_id} does not exist.", file=sys.stderr)
+        return 1
+    service.metadata_store.connect()
+    status = service.metadata_store.get_task(args.task_id)["status"]
+    print(status)
+    return 0 if status == "completed" else 1
+
+
+def set_enabled(args):
+    service = _quiet_service()
+
+    service.metadata_store.connect()
+    if not service.metadata_store.set_task_enabled(args.task_id, args.command == "enable"):
+        print(f"Task {args.task_id} does not exist.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _quiet_service():
+    # Los comandos que imprimen resultados solo muestran advertencias y errores del log
+    import service
+
+    logging.getLogger().setLevel(logging.WARNING)
+    return service
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Firebird to SFTP task scheduler.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("run", help="run the scheduler without interface").set_defaults(handler=run_service)
+    commands.add_parser("gui", help="run the scheduler with the Tkinter interface").set_defaults(handler=run_gui)
+
+    add = commands.add_parser("add", help="add a task")
+    add.add_argument("--name", required=True)
+    add.add_argument("--query", required=True)
+    add.add_argument("--output-file", required=True)
+    add.add_argument("--cron", required=True, help='cron expression, e.g. "0 6 * * *"')
+    add.add_argument("--remote-path")
+    add.add_argument("--sftp-host")
+    add.add_argument("--sftp-user")
+    add.add_argument("--sftp-password")
+    add.add_argument("--format", default="csv")
+    add.add_argument("--codec", default="none")
+    add.add_argument("--codec-level", type=int)
+    add.add_argument("--executor", default="default")
+    add.add_argument("--watermark-column")
+    add.add_argument("--partition-column")
+    add.add_argument("--partitions", type=int, default=1)
+    add.add_argument("--part-max-rows", type=int, help="split the CSV output into parts of this many rows")
+    add.add_argument("--part-max-mb", type=int, help="split the CSV output into parts of about this size")
+    add.add_argument("--force-upload", action="store_true", help="upload on every run, even if the output did not change")
+    add.add_argument("--destination", action="append", default=[],
+                     help="extra destination as host[:port],user,password,remote_path (repeatable)")
+    add.add_argument("--disabled", action="store_true", help="add the task without scheduling it")
+    add.set_defaults(handler=add_task)
+
+    list_parser = commands.add_parser("list", help="list the tasks")
+    list_parser.add_argument("--status")
+    visibility = list_parser.add_mutually_exclusive_group()
+    visibility.add_argument("--disabled", action="store_true", help="only disabled tasks")
+    visibility.add_argument("--all", action="store_true", help="enabled and disabled tasks")
+    list_parser.set_defaults(handler=list_tasks)
+
+    run_now = commands.add_parser("run-now", help="run a task once, now")
+    run_now.add_argument("task_id", type=int)
+    run_now.add_argument("--force", action="store_true", help="upload even if the output did not change")
+    run_now.set_defaults(handler=run_task_now)
+
+    for name, help_text in (("disable", "stop running a task"), ("enable", "run a disabled task again")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("task_id", type=int)
+        command.set_defaults(handler=set_enabled)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,78 @@
 import sqlite3
 import logging
 
+# Columns added to 'scheduled_tasks' after its first release, so existing databases can be upgraded
+SCHEDULED_TASKS_MIGRATIONS = [
+    ("output_codec", "TEXT DEFAULT 'none'"),
+    ("codec_level", "INTEGER DEFAULT NULL"),
+    ("output_format", "TEXT DEFAULT 'csv'"),
+    ("executor", "TEXT DEFAULT 'default'"),
+    ("watermark_column", "TEXT DEFAULT NULL"),
+    ("last_watermark", "TEXT DEFAULT NULL"),
+    ("partition_column", "TEXT DEFAULT NULL"),
+    ("partitions", "INTEGER DEFAULT 1"),
+    ("enabled", "INTEGER DEFAULT 1"),
+    ("definition_version", "INTEGER DEFAULT 0"),
+    ("updated_at", "TIMESTAMP DEFAULT NULL"),
+    ("fetch_batch_size", "INTEGER DEFAULT NULL"),
+    ("part_max_rows", "INTEGER DEFAULT NULL"),
+    ("part_max_bytes", "INTEGER DEFAULT NULL"),
+    ("force_upload", "INTEGER DEFAULT 0"),
+    ("last_content_hash", "TEXT DEFAULT NULL"),
+]
+
+# Columns added to 'task_runs' after its first release
+TASK_RUNS_MIGRATIONS = [
+    ("content_hash", "TEXT DEFAULT NULL"),
+]
+
+# Columns that define how a task runs; changing any of them makes the running scheduler reload the task
+TASK_DEFINITION_COLUMNS = [
+    "task_name", "query", "output_file", "remote_path", "sftp_host", "sftp_user", "sftp_password",
+    "cron_expression", "output_codec", "codec_level", "output_format", "executor", "watermark_column",
+    "partition_column", "partitions", "enabled", "part_max_rows", "part_max_bytes", "force_upload",
+]
+
+
+def add_missing_columns(cursor, table_name, columns):
+    """
+    Adds the given columns to an existing table when they are not present yet.
+
+    :param cursor: Cursor of an open SQLite connection
+    :param table_name: Name of the table to upgrade
+    :param columns: List of (column name, column definition) tuples
+    """
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for column_name, definition in columns:
+        if column_name not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}")
+            logging.info(f"Column '{column_name}' added to table '{table_name}'.")
+
+
+def create_definition_triggers(cursor):
+    """
+    (Re)creates the triggers that number the changes of the task definitions, so the list of
+    watched columns stays in sync with TASK_DEFINITION_COLUMNS on existing databases.
+
+    :param cursor: Cursor of an open SQLite connection
+    """
+    next_version = "UPDATE table_versions SET version = version + 1 WHERE table_name = 'task_definitions';"
+    current_version = "(SELECT version FROM table_versions WHERE table_name = 'task_definitions')"
+    stamp_task = (f"UPDATE scheduled_tasks SET definition_version = {current_version}, "
+                  f"updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;")
+    triggers = {
+        "scheduled_tasks_definition_insert": ("AFTER INSERT", f"{next_version} {stamp_task}"),
+        "scheduled_tasks_definition_update": (f"AFTER UPDATE OF {', '.join(TASK_DEFINITION_COLUMNS)}",
+                                              f"{next_version} {stamp_task}"),
+        "scheduled_tasks_definition_delete": ("AFTER DELETE", f"{next_version} INSERT OR REPLACE INTO task_tombstones "
+                                                              f"(task_id, definition_version) VALUES (OLD.id, {current_version});"),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} ON scheduled_tasks BEGIN {body} END")
+
+
 def create_database(database_path):
     """
     Creates an SQLite database and initializes the required tables.
@@ -27,12 +99,123 @@ def create_database(database_path):
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             status TEXT DEFAULT 'pending',
             last_execution TIMESTAMP DEFAULT NULL,
-            next_execution TIMESTAMP DEFAULT NULL
+            next_execution TIMESTAMP DEFAULT NULL,
+            output_codec TEXT DEFAULT 'none',
+            codec_level INTEGER DEFAULT NULL,
+            output_format TEXT DEFAULT 'csv',
+            executor TEXT DEFAULT 'default',
+            watermark_column TEXT DEFAULT NULL,
+            last_watermark TEXT DEFAULT NULL,
+            partition_column TEXT DEFAULT NULL,
+            partitions INTEGER DEFAULT 1,
+            enabled INTEGER DEFAULT 1,
+            definition_version INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NULL,
+            fetch_batch_size INTEGER DEFAULT NULL,
+            part_max_rows INTEGER DEFAULT NULL,
+            part_max_bytes INTEGER DEFAULT NULL,
+            force_upload INTEGER DEFAULT 0,
+            last_content_hash TEXT DEFAULT NULL
         );
         """
         cursor.execute(create_table_query)
+        add_missing_columns(cursor, "scheduled_tasks", SCHEDULED_TASKS_MIGRATIONS)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_tasks_status_id ON scheduled_tasks (status, id)")
+
+        # Change counter of scheduled_tasks, so readers can skip reloading the tasks when nothing changed
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('scheduled_tasks', 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS scheduled_tasks_version_{event.lower()} AFTER {event} ON scheduled_tasks
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = 'scheduled_tasks';
+            END;
+            """)
+
+        # Definition changes are numbered with a second counter. Each task keeps the number of its last
+        # change and deleted tasks leave a tombstone, so the scheduler only reads what changed since its
+        # last reload
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('task_definitions', 0)")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_tombstones (
+            task_id INTEGER PRIMARY KEY,
+            definition_version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_tasks_definition_version "
+                       "ON scheduled_tasks (definition_version)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_tombstones_definition_version "
+                       "ON task_tombstones (definition_version)")
+        create_definition_triggers(cursor)
+
+        # Create the 'upload_checkpoints' table used to resume interrupted uploads
+        create_checkpoints_query = """
+        CREATE TABLE IF NOT EXISTS upload_checkpoints (
+            task_id INTEGER NOT NULL,
+            remote_path TEXT NOT NULL,
+            offset INTEGER NOT NULL DEFAULT 0,
+            prefix_hash TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (task_id, remote_path)
+        );
+        """
+        cursor.execute(create_checkpoints_query)
+
+        # Create the 'task_destinations' table with the extra SFTP destinations of each task
+        create_destinations_query = """
+        CREATE TABLE IF NOT EXISTS task_destinations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            sftp_host TEXT NOT NULL,
+            sftp_port INTEGER DEFAULT NULL,
+            sftp_user TEXT,
+            sftp_password TEXT,
+            remote_path TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            duration_seconds REAL DEFAULT NULL,
+            last_error TEXT DEFAULT NULL,
+            last_execution TIMESTAMP DEFAULT NULL
+        );
+        """
+        cursor.execute(create_destinations_query)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_destinations_task_id ON task_destinations (task_id)")
+
+        # Create the 'task_runs' table with the timings and throughput of every job run
+        create_runs_query = """
+        CREATE TABLE IF NOT EXISTS task_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            task_name TEXT,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            status TEXT NOT NULL,
+            duration_seconds REAL,
+            rows INTEGER DEFAULT 0,
+            bytes INTEGER DEFAULT 0,
+            rows_per_second REAL,
+            stages TEXT,
+            error TEXT,
+            content_hash TEXT DEFAULT NULL
+        );
+        """
+        cursor.execute(create_runs_query)
+        add_missing_columns(cursor, "task_runs", TASK_RUNS_MIGRATIONS)
+        # The history queries filter by task and time window; status and duration are included so
+        # the failure-rate and percentile queries are answered from the index alone
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_runs_task_id_started_at "
+                       "ON task_runs (task_id, started_at, status, duration_seconds)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_runs_status_started_at ON task_runs (status, started_at)")
         connection.commit()
-        logging.info("Database and table 'scheduled_tasks' created successfully.")
+        logging.info("Database and tables 'scheduled_tasks', 'upload_checkpoints', 'task_destinations', 'task_runs', "
+                     "'table_versions', 'task_tombstones' created successfully.")
 
         # Close the connection
         cursor.close()
@@ -41,8 +224,10 @@ def create_database(database_path):
         logging.error(f"Error creating the database: {e}")
         raise
 
-# Define the path to the SQLite database file
-database_path = "scheduled_tasks.db"
+if __name__ == "__main__":
+    # Define the path to the SQLite database file
+    database_path = "scheduled_tasks.db"
+
+    # Create the database and table
+    create_database(database_path)
 
-# Create the database and table
-create_database(database_path)
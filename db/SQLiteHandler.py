@@ -1,32 +1,103 @@
+import datetime
+import functools
 import logging
+import math
+import os
 import sqlite3
+import threading
+import weakref
 
 from utils.errors import SQLiteConnectionError, SQLiteQueryError
 
 
+# Columnas de scheduled_tasks que devuelve get_tasks
+TASK_COLUMNS = (
+    "id", "task_name", "query", "output_file", "remote_path", "sftp_host", "sftp_user", "sftp_password",
+    "cron_expression", "created_at", "status", "output_codec", "codec_level", "output_format", "executor",
+    "watermark_column", "last_watermark", "partition_column", "partitions", "enabled", "definition_version", "updated_at",
+    "fetch_batch_size", "part_max_rows", "part_max_bytes", "force_upload"
+)
+
+# Columnas opcionales de task_runs que pueden faltar en los registros
+_RUN_DEFAULTS = {"error": None, "content_hash": None}
+
+
+def _synchronized(method):
+    # Una sola conexión se comparte entre hilos: cada operación (sentencias + commit) se serializa
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class SQLiteHandler:
-    def __init__(self, database_path):
+    def __init__(self, database_path, journal_mode="WAL", synchronous="NORMAL", busy_timeout=30.0,
+                 flush_interval=None):
         """
         Initializes the SQLite connection handler.
 
+        One handler can be shared by every thread of a process: its connection is long-lived and each
+        operation holds ``lock``. WAL journaling lets readers work while a job writes, and the busy
+        timeout makes writers from other processes wait instead of failing with "database is locked".
+
         :param database_path: Path to the SQLite database file
+        :param journal_mode: SQLite journal mode
+        :param synchronous: SQLite synchronous setting; NORMAL is durable across crashes of the process in WAL mode
+        :param busy_timeout: Seconds to wait for a lock held by another connection
+        :param flush_interval: Seconds between flushes of the queued writes; None writes them on ``flush`` or ``close``
         """
         self.database_path = database_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.flush_interval = flush_interval
         self.connection = None
+        self.lock = threading.RLock()
+
+        self._pid = None
+        self._pending_statuses = []
+        self._pending_runs = []
+        self._flusher_stop = None
 
+        # Un proceso hijo (executor "processpool") no debe heredar la conexión, el lock ni las escrituras pendientes
+        reset_after_fork = weakref.WeakMethod(self._reset_after_fork)
+        os.register_at_fork(after_in_child=lambda: reset_after_fork() and reset_after_fork()())
+
+    def _reset_after_fork(self):
+        self.lock = threading.RLock()
+        self.connection = None
+        self._pid = None
+        self._pending_statuses = []
+        self._pending_runs = []
+        self._flusher_stop = None
+
+    @_synchronized
     def connect(self):
         """
-        Establishes a connection to the SQLite database.
+        Establishes a connection to the SQLite database. Does nothing if this process already has one,
+        so shared handlers can call it before every use.
         """
+        if self.connection and self._pid == os.getpid():
+            return
         try:
-            self.connection = sqlite3.connect(self.database_path)
+            self.connection = sqlite3.connect(self.database_path, timeout=self.busy_timeout,
+                                              check_same_thread=False)
+            self.connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self.connection.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._pid = os.getpid()
             logging.info("Successfully connected to SQLite.")
         except sqlite3.Error as e:
             logging.error(f"Error connecting to the database: {e}")
             raise SQLiteConnectionError(f"Error connecting to the database: {e}")
+        if self.flush_interval:
+            self._start_flusher()
 
+    @_synchronized
     def insert_task(self, task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_password,
-                    cron_expression):
+                    cron_expression, output_codec="none", codec_level=None, output_format="csv", executor="default",
+                    watermark_column=None, partition_column=None, partitions=1, enabled=True, part_max_rows=None,
+                    part_max_bytes=None, force_upload=False):
         """
         Inserts a scheduled task into the database.
 
@@ -37,6 +108,17 @@ class SQLiteHandler:
         :param sftp_host: SFTP host for the task
         :param sftp_user: SFTP user for the task
         :param cron_expression: Cron expression for the task's schedule
+        :param output_codec: Compression of the generated file (none, gzip or zstd)
+        :param codec_level: Compression level, or None for the codec default
+        :param output_format: Format of the generated file (csv, parquet or arrow)
+        :param executor: Scheduler executor the task runs on (default or processpool)
+        :param watermark_column: Column used for incremental extracts, or None to export the full result every run
+        :param partition_column: Column whose ranges are fetched in parallel, or None
+        :param partitions: Number of ranges fetched in parallel when ``partition_column`` is set
+        :param enabled: Whether the scheduler runs the task
+        :param part_max_rows: Rows per part file when the CSV output is split, or None
+        :param part_max_bytes: Bytes per part file when the CSV output is split, or None
+        :param force_upload: Upload the output on every run, even when it did not change since the last upload
         """
         try:
             if not self.connection:
@@ -45,10 +127,15 @@ class SQLiteHandler:
             cursor = self.connection.cursor()
             cursor.execute(
                 """
-                INSERT INTO scheduled_tasks (task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_password, cron_expression, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
+                INSERT INTO scheduled_tasks (task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_password, cron_expression, status,
+                                             output_codec, codec_level, output_format, executor, watermark_column,
+                                             partition_column, partitions, enabled, part_max_rows, part_max_bytes,
+                                             force_upload)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_password, cron_expression)
+                (task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_password, cron_expression,
+                 output_codec, codec_level, output_format, executor, watermark_column, partition_column, partitions,
+                 int(enabled), part_max_rows, part_max_bytes, int(force_upload))
             )
             self.connection.commit()
             cursor.close()
@@ -63,26 +150,63 @@ class SQLiteHandler:
             logging.error(f"General error inserting the task: {ex}")
             raise Exception(f"General error inserting the task: {ex}")
 
-    def get_tasks(self):
+    @_synchronized
+    def get_tasks(self, columns=None, status=None, exclude_status=None, enabled=None, after_id=None, limit=None):
         """
-        Fetches all scheduled tasks from the database.
+        Fetches scheduled tasks from the database, ordered by ID.
 
+        Large task lists are read page by page: pass the last ID of a page as ``after_id`` to get the
+        next one. Status filters use the (status, id) index.
+
+        :param columns: Columns to return (see ``TASK_COLUMNS``); all of them by default
+        :param status: Only return tasks with this status, or with any status of a list
+        :param exclude_status: Only return tasks whose status is not this one
+        :param enabled: Only return enabled (True) or disabled (False) tasks
+        :param after_id: Only return tasks with an ID greater than this one
+        :param limit: Maximum number of tasks to return
         :return: A list of dictionaries representing tasks
+        :raises ValueError: If an unknown column is requested
         """
         try:
             if not self.connection:
                 raise SQLiteConnectionError("No connection established with the database.")
 
-            cursor = self.connection.cursor()
-            query = "SELECT id, task_name, query, output_file, remote_path, sftp_host, sftp_user,sftp_password, cron_expression, created_at, status FROM scheduled_tasks"
-            cursor.execute(query)
+            columns = list(columns or TASK_COLUMNS)
+            unknown_columns = set(columns) - set(TASK_COLUMNS)
+            if unknown_columns:
+                raise ValueError(f"Unknown task columns: {', '.join(sorted(unknown_columns))}")
+            if "id" not in columns:
+                columns.insert(0, "id")
 
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
+            conditions, params = [], []
+            if status is not None:
+                statuses = [status] if isinstance(status, str) else list(status)
+                conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+                params.extend(statuses)
+            if exclude_status is not None:
+                # Dos rangos en lugar de != para que SQLite pueda usar el índice de status
+                conditions.append("(status < ? OR status > ? OR status IS NULL)")
+                params.extend([exclude_status, exclude_status])
+            if enabled is not None:
+                conditions.append("enabled = ?" if enabled else "enabled != ?")
+                params.append(1)
+            if after_id is not None:
+                conditions.append("id > ?")
+                params.append(after_id)
 
-            tasks = [dict(zip(columns, row)) for row in rows]
+            query = f"SELECT {', '.join(columns)} FROM scheduled_tasks"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY id"
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
 
-            logging.info(f"Fetched {len(tasks)} tasks from the database.")
+            cursor = self.connection.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            tasks = [dict(zip(columns, row)) for row in rows]
+            logging.debug(f"Fetched {len(tasks)} tasks from the database.")
 
             cursor.close()
             return tasks
@@ -92,10 +216,141 @@ class SQLiteHandler:
         except sqlite3.Error as e:
             logging.error(f"Error fetching tasks: {e}")
             raise SQLiteQueryError(f"Error fetching tasks: {e}")
-        except Exception as ex:
-            logging.error(f"General error fetching tasks: {ex}")
-            raise Exception(f"General error fetching tasks: {ex}")
 
+    def iter_tasks(self, page_size=1000, **filters):
+        """
+        Yields the scheduled tasks one page at a time, so the lock is only held while each page is read.
+
+        :param page_size: Number of tasks read per query
+        :param filters: Same arguments as ``get_tasks`` except ``after_id`` and ``limit``
+        """
+        after_id = None
+        while True:
+            page = self.get_tasks(after_id=after_id, limit=page_size, **filters)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+    @_synchronized
+    def get_task(self, task_id):
+        """
+        Fetches one scheduled task.
+
+        :param task_id: ID of the task
+        :return: Dictionary representing the task, or None if it does not exist
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(f"SELECT {', '.join(TASK_COLUMNS)} FROM scheduled_tasks WHERE id = ?", (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            return dict(zip(TASK_COLUMNS, row)) if row else None
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching task: {e}")
+            raise SQLiteQueryError(f"Error fetching task: {e}")
+
+    @_synchronized
+    def set_task_enabled(self, task_id, enabled):
+        """
+        Enables or disables a task. A running scheduler picks the change up on its next reload.
+
+        :param task_id: ID of the task
+        :param enabled: True to run the task on its schedule, False to stop running it
+        :return: True if the task exists
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("UPDATE scheduled_tasks SET enabled = ? WHERE id = ?", (int(enabled), task_id))
+            self.connection.commit()
+            updated = cursor.rowcount > 0
+            cursor.close()
+            return updated
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error updating task: {e}")
+            raise SQLiteQueryError(f"Error updating task: {e}")
+
+    @_synchronized
+    def get_tasks_version(self, definitions_only=False):
+        """
+        Returns a counter that increases with every insert, update or delete in scheduled_tasks.
+        Callers can compare it with the last value they saw and skip reloading the tasks.
+
+        :param definitions_only: Count only the changes to the task definitions, not status updates
+        :return: Current version of the scheduled_tasks table
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT version FROM table_versions WHERE table_name = ?",
+                           ("task_definitions" if definitions_only else "scheduled_tasks",))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else 0
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching tasks version: {e}")
+            raise SQLiteQueryError(f"Error fetching tasks version: {e}")
+
+    @_synchronized
+    def get_task_changes(self, since_version):
+        """
+        Fetches the task definitions changed after a given definition version.
+
+        The current version is read first and used as the upper bound, so a change committed while
+        this runs is reported in the next call instead of being half-read.
+
+        :param since_version: Last definition version the caller has applied
+        :return: Tuple ``(version, changed tasks, deleted task IDs)``
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            row = cursor.execute("SELECT version FROM table_versions WHERE table_name = 'task_definitions'").fetchone()
+            version = row[0] if row else 0
+            if version <= since_version:
+                cursor.close()
+                return version, [], []
+
+            cursor.execute(
+                f"SELECT {', '.join(TASK_COLUMNS)} FROM scheduled_tasks "
+                "WHERE definition_version > ? AND definition_version <= ? ORDER BY definition_version",
+                (since_version, version)
+            )
+            changed_tasks = [dict(zip(TASK_COLUMNS, row)) for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT task_id FROM task_tombstones WHERE definition_version > ? AND definition_version <= ?",
+                (since_version, version)
+            )
+            deleted_ids = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            return version, changed_tasks, deleted_ids
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching task changes: {e}")
+            raise SQLiteQueryError(f"Error fetching task changes: {e}")
+
+    @_synchronized
     def update_task_status(self, task_id, status):
         try:
             cursor = self.connection.cursor()
@@ -109,10 +364,655 @@ class SQLiteHandler:
             logging.error(f"Error updating task status: {e}")
             raise
 
+    @_synchronized
+    def get_watermark(self, task_id):
+        """
+        Fetches the last watermark exported by an incremental task.
+
+        :param task_id: ID of the task
+        :return: Stored watermark text, or None if the task has not exported anything yet
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT last_watermark FROM scheduled_tasks WHERE id = ?", (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching watermark: {e}")
+            raise SQLiteQueryError(f"Error fetching watermark: {e}")
+
+    @_synchronized
+    def update_watermark(self, task_id, watermark):
+        """
+        Stores the highest watermark of the last delta that was uploaded successfully.
+
+        :param task_id: ID of the task
+        :param watermark: Watermark text, as produced by ``utils.watermark.encode_watermark``
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("UPDATE scheduled_tasks SET last_watermark = ? WHERE id = ?", (watermark, task_id))
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error updating watermark: {e}")
+            raise SQLiteQueryError(f"Error updating watermark: {e}")
+
+    @_synchronized
+    def get_fetch_batch_size(self, task_id):
+        """
+        Fetches the batch size learned by the last successful export of a task.
+
+        :param task_id: ID of the task
+        :return: Rows per fetch, or None if the task has not learned one yet
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT fetch_batch_size FROM scheduled_tasks WHERE id = ?", (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching batch size: {e}")
+            raise SQLiteQueryError(f"Error fetching batch size: {e}")
+
+    @_synchronized
+    def update_fetch_batch_size(self, task_id, batch_size):
+        """
+        Stores the batch size the next export of a task starts from. It is not part of the task
+        definition, so it does not make the scheduler reload the task.
+
+        :param task_id: ID of the task
+        :param batch_size: Rows per fetch
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("UPDATE scheduled_tasks SET fetch_batch_size = ? WHERE id = ?", (batch_size, task_id))
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error updating batch size: {e}")
+            raise SQLiteQueryError(f"Error updating batch size: {e}")
+
+    @_synchronized
+    def get_content_hash(self, task_id):
+        """
+        Fetches the content hash of the last output a task uploaded.
+
+        :param task_id: ID of the task
+        :return: Hex hash, or None if nothing has been uploaded since the hash was introduced
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT last_content_hash FROM scheduled_tasks WHERE id = ?", (task_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching content hash: {e}")
+            raise SQLiteQueryError(f"Error fetching content hash: {e}")
+
+    @_synchronized
+    def update_content_hash(self, task_id, content_hash):
+        """
+        Stores the content hash of an output once it is on every destination. It is not part of the
+        task definition, so it does not make the scheduler reload the task.
+
+        :param task_id: ID of the task
+        :param content_hash: Hex hash, or None so the next run uploads whatever it produces
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute("UPDATE scheduled_tasks SET last_content_hash = ? WHERE id = ?", (content_hash, task_id))
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error updating content hash: {e}")
+            raise SQLiteQueryError(f"Error updating content hash: {e}")
+
+    @_synchronized
+    def add_destination(self, task_id, sftp_host, sftp_user, sftp_password, remote_path, sftp_port=None):
+        """
+        Adds an extra SFTP destination to a task. The generated file is uploaded to the task's own
+        destination and to every extra destination concurrently.
+
+        :param task_id: ID of the task
+        :param sftp_host: SFTP host of the destination
+        :param sftp_user: SFTP user of the destination
+        :param sftp_password: SFTP password of the destination
+        :param remote_path: Remote path of the destination
+        :param sftp_port: SFTP port, or None to use SFTP_PORT
+        :return: ID of the new destination
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO task_destinations (task_id, sftp_host, sftp_port, sftp_user, sftp_password, remote_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (task_id, sftp_host, sftp_port, sftp_user, sftp_password, remote_path)
+            )
+            self.connection.commit()
+            cursor.close()
+            return cursor.lastrowid
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error inserting destination: {e}")
+            raise SQLiteQueryError(f"Error inserting destination: {e}")
+
+    @_synchronized
+    def get_destinations(self, task_id):
+        """
+        Fetches the extra SFTP destinations of a task.
+
+        :param task_id: ID of the task
+        :return: A list of dictionaries representing destinations
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT id, task_id, sftp_host, sftp_port, sftp_user, sftp_password, remote_path, status, attempts, "
+                "duration_seconds, last_error, last_execution FROM task_destinations WHERE task_id = ? ORDER BY id",
+                (task_id,)
+            )
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+            cursor.close()
+            return [dict(zip(columns, row)) for row in rows]
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching destinations: {e}")
+            raise SQLiteQueryError(f"Error fetching destinations: {e}")
+
+    @_synchronized
+    def update_destination_status(self, destination_id, status, attempts, duration_seconds, last_error=None):
+        """
+        Records the outcome of the last upload to a destination.
+
+        :param destination_id: ID of the destination
+        :param status: ``completed`` or ``error``
+        :param attempts: Number of upload attempts made
+        :param duration_seconds: Time spent on the upload, retries included
+        :param last_error: Message of the last error, or None
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                """
+                UPDATE task_destinations
+                SET status = ?, attempts = ?, duration_seconds = ?, last_error = ?, last_execution = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (status, attempts, duration_seconds, last_error, destination_id)
+            )
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error updating destination status: {e}")
+            raise SQLiteQueryError(f"Error updating destination status: {e}")
+
+    @_synchronized
+    def insert_task_run(self, run):
+        """
+        Stores the metrics of a finished job run in the task_runs table.
+
+        :param run: Dictionary with the task_runs columns, as returned by ``RunMetrics.as_record``
+        :return: ID of the new run
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO task_runs (task_id, task_name, started_at, finished_at, status, duration_seconds,
+                                       rows, bytes, rows_per_second, stages, error, content_hash)
+                VALUES (:task_id, :task_name, :started_at, :finished_at, :status, :duration_seconds,
+                        :rows, :bytes, :rows_per_second, :stages, :error, :content_hash)
+                """,
+                dict(_RUN_DEFAULTS, **run)
+            )
+            self.connection.commit()
+            run_id = cursor.lastrowid
+            cursor.close()
+            return run_id
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error inserting task run: {e}")
+            raise SQLiteQueryError(f"Error inserting task run: {e}")
+
+    @_synchronized
+    def get_last_runs(self, task_id, limit=20):
+        """
+        Fetches the most recent runs of a task, newest first.
+
+        :param task_id: ID of the task
+        :param limit: Maximum number of runs to return
+        :return: A list of dictionaries representing runs
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT id, task_id, task_name, started_at, finished_at, status, duration_seconds, rows, bytes, "
+                "rows_per_second, stages, error, content_hash FROM task_runs WHERE task_id = ? "
+                "ORDER BY started_at DESC, id DESC LIMIT ?",
+                (task_id, limit)
+            )
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+            cursor.close()
+            return [dict(zip(columns, row)) for row in rows]
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching task runs: {e}")
+            raise SQLiteQueryError(f"Error fetching task runs: {e}")
+
+    @_synchronized
+    def get_failure_rate(self, task_id, since=None):
+        """
+        Computes the share of failed runs of a task.
+
+        :param task_id: ID of the task
+        :param since: Only runs started at or after this datetime are counted; None counts all runs
+        :return: Dictionary with ``runs``, ``failures`` and ``failure_rate`` (0.0 when there are no runs)
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(status = 'error'), 0) FROM task_runs "
+                "WHERE task_id = ? AND started_at >= ?",
+                (task_id, _timestamp(since))
+            )
+            runs, failures = cursor.fetchone()
+            cursor.close()
+            return {"runs": runs, "failures": failures, "failure_rate": failures / runs if runs else 0.0}
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error computing failure rate: {e}")
+            raise SQLiteQueryError(f"Error computing failure rate: {e}")
+
+    @_synchronized
+    def get_duration_percentile(self, task_id, percentile=0.95, since=None, status="completed"):
+        """
+        Computes a percentile of the run duration of a task (nearest-rank method).
+
+        Both steps read only the (task_id, started_at) index, so the cost depends on the runs of the
+        task inside the window and not on the size of the table.
+
+        :param task_id: ID of the task
+        :param percentile: Percentile between 0 and 1, 0.95 by default
+        :param since: Only runs started at or after this datetime are used; None uses all runs
+        :param status: Only runs with this status are used; None uses every run
+        :return: Duration in seconds, or None if there are no runs
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            conditions = "task_id = ? AND started_at >= ? AND duration_seconds IS NOT NULL"
+            params = [task_id, _timestamp(since)]
+            if status:
+                conditions += " AND status = ?"
+                params.append(status)
+
+            cursor = self.connection.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM task_runs WHERE {conditions}", params)
+            runs = cursor.fetchone()[0]
+            if not runs:
+                cursor.close()
+                return None
+            rank = min(max(math.ceil(percentile * runs), 1), runs)
+            cursor.execute(
+                f"SELECT duration_seconds FROM task_runs WHERE {conditions} "
+                "ORDER BY duration_seconds LIMIT 1 OFFSET ?",
+                params + [rank - 1]
+            )
+            duration = cursor.fetchone()[0]
+            cursor.close()
+            return duration
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error computing duration percentile: {e}")
+            raise SQLiteQueryError(f"Error computing duration percentile: {e}")
+
+    def purge_task_runs(self, retention_days, keep_last=0, batch_size=5000):
+        """
+        Deletes runs older than the retention period, in small batches so job threads are not
+        blocked behind one long write: the shared lock is taken for each batch and released between
+        batches.
+
+        :param retention_days: Runs started more than this many days ago are deleted
+        :param keep_last: Number of most recent runs of each task kept regardless of their age
+        :param batch_size: Maximum number of rows deleted per transaction
+        :return: Number of deleted runs
+        """
+        try:
+            cutoff = _timestamp(datetime.datetime.now() - datetime.timedelta(days=retention_days))
+            deleted = 0
+            with self.lock:
+                self._check_connection()
+                task_ids = [row[0] for row in self.connection.execute("SELECT DISTINCT task_id FROM task_runs")]
+            for task_id in task_ids:
+                task_cutoff = cutoff
+                if keep_last:
+                    with self.lock:
+                        self._check_connection()
+                        # Las ejecuciones más recientes de cada tarea se conservan aunque sean antiguas
+                        row = self.connection.execute(
+                            "SELECT started_at FROM task_runs WHERE task_id = ? ORDER BY started_at DESC LIMIT 1 OFFSET ?",
+                            (task_id, keep_last - 1)
+                        ).fetchone()
+                    if row is None:
+                        continue
+                    task_cutoff = min(cutoff, row[0])
+                # Cada lote elige sus filas con el índice (task_id, started_at): los ids no se cargan en memoria
+                while True:
+                    with self.lock:
+                        self._check_connection()
+                        cursor = self.connection.execute(
+                            "DELETE FROM task_runs WHERE id IN "
+                            "(SELECT id FROM task_runs WHERE task_id = ? AND started_at < ? LIMIT ?)",
+                            (task_id, task_cutoff, batch_size)
+                        )
+                        self.connection.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < batch_size:
+                        break
+            if deleted:
+                logging.info(f"{deleted} task runs older than {retention_days} days deleted.")
+            return deleted
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error purging task runs: {e}")
+            raise SQLiteQueryError(f"Error purging task runs: {e}")
+
+    def compact(self, min_free_ratio=0.2):
+        """
+        Rebuilds the database file when enough of it is free pages left by deleted rows, and
+        refreshes the query planner statistics.
+
+        The work runs on a connection of its own, without the shared lock, so job threads keep
+        queueing and flushing their writes; SQLite makes them wait on the busy timeout while VACUUM
+        holds the file.
+
+        :param min_free_ratio: Share of free pages that triggers a VACUUM
+        :return: True if the database was vacuumed
+        """
+        try:
+            self._check_connection()
+            connection = sqlite3.connect(self.database_path, timeout=self.busy_timeout)
+            try:
+                page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+                free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+                vacuumed = bool(page_count) and free_pages / page_count >= min_free_ratio
+                if vacuumed:
+                    connection.execute("VACUUM")
+                    logging.info(f"Database compacted: {free_pages} of {page_count} pages released.")
+                connection.execute("PRAGMA optimize")
+            finally:
+                connection.close()
+            return vacuumed
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error compacting the database: {e}")
+            raise SQLiteQueryError(f"Error compacting the database: {e}")
+
+    @_synchronized
+    def get_upload_checkpoint(self, task_id, remote_path):
+        """
+        Fetches the progress recorded for an interrupted upload.
+
+        :param task_id: ID of the task that owns the upload
+        :param remote_path: Final remote path of the upload
+        :return: Dictionary with ``offset`` and ``prefix_hash``, or None if there is no checkpoint
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT offset, prefix_hash FROM upload_checkpoints WHERE task_id = ? AND remote_path = ?",
+                (task_id, remote_path)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+            return {"offset": row[0], "prefix_hash": row[1]} if row else None
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching upload checkpoint: {e}")
+            raise SQLiteQueryError(f"Error fetching upload checkpoint: {e}")
+
+    @_synchronized
+    def save_upload_checkpoint(self, task_id, remote_path, offset, prefix_hash):
+        """
+        Records how many bytes of an upload the server has confirmed.
+
+        :param task_id: ID of the task that owns the upload
+        :param remote_path: Final remote path of the upload
+        :param offset: Number of bytes written to the temporary remote file
+        :param prefix_hash: SHA-256 hex digest of the first ``offset`` bytes of the local file
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO upload_checkpoints (task_id, remote_path, offset, prefix_hash, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (task_id, remote_path)
+                DO UPDATE SET offset = excluded.offset, prefix_hash = excluded.prefix_hash, updated_at = CURRENT_TIMESTAMP
+                """,
+                (task_id, remote_path, offset, prefix_hash)
+            )
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error saving upload checkpoint: {e}")
+            raise SQLiteQueryError(f"Error saving upload checkpoint: {e}")
+
+    @_synchronized
+    def delete_upload_checkpoint(self, task_id, remote_path):
+        """
+        Removes the checkpoint of an upload once it has completed.
+
+        :param task_id: ID of the task that owns the upload
+        :param remote_path: Final remote path of the upload
+        """
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "DELETE FROM upload_checkpoints WHERE task_id = ? AND remote_path = ?",
+                (task_id, remote_path)
+            )
+            self.connection.commit()
+            cursor.close()
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting upload checkpoint: {e}")
+            raise SQLiteQueryError(f"Error deleting upload checkpoint: {e}")
+
+    def queue_task_status(self, task_id, status):
+        """
+        Queues a task status update, written with the other queued writes in one transaction.
+        """
+        with self.lock:
+            self._pending_statuses.append((status, task_id))
+
+    def queue_task_run(self, run):
+        """
+        Queues a finished run for the task_runs table, written with the other queued writes in one transaction.
+
+        :param run: Dictionary with the task_runs columns, as returned by ``RunMetrics.as_record``
+        """
+        with self.lock:
+            self._pending_runs.append(run)
+
+    @_synchronized
+    def flush(self):
+        """
+        Writes the queued status updates and runs in a single transaction.
+
+        :return: Number of queued writes stored
+        """
+        if not self._pending_statuses and not self._pending_runs:
+            return 0
+        try:
+            if not self.connection:
+                raise SQLiteConnectionError("No connection established with the database.")
+
+            statuses, runs = self._pending_statuses, self._pending_runs
+            cursor = self.connection.cursor()
+            cursor.executemany(
+                "UPDATE scheduled_tasks SET status = ?, last_execution = CURRENT_TIMESTAMP WHERE id = ?",
+                statuses
+            )
+            cursor.executemany(
+                """
+                INSERT INTO task_runs (task_id, task_name, started_at, finished_at, status, duration_seconds,
+                                       rows, bytes, rows_per_second, stages, error, content_hash)
+                VALUES (:task_id, :task_name, :started_at, :finished_at, :status, :duration_seconds,
+                        :rows, :bytes, :rows_per_second, :stages, :error, :content_hash)
+                """,
+                [dict(_RUN_DEFAULTS, **run) for run in runs]
+            )
+            self.connection.commit()
+            cursor.close()
+            self._pending_statuses, self._pending_runs = [], []
+            return len(statuses) + len(runs)
+        except SQLiteConnectionError as e:
+            logging.error(f"Error Connection: {e}")
+            raise
+        except sqlite3.Error as e:
+            # Las escrituras pendientes se conservan para el siguiente intento
+            self.connection.rollback()
+            logging.error(f"Error flushing queued writes: {e}")
+            raise SQLiteQueryError(f"Error flushing queued writes: {e}")
+
+    def _check_connection(self):
+        if not self.connection:
+            raise SQLiteConnectionError("No connection established with the database.")
+
+    def _start_flusher(self):
+        if self._flusher_stop:
+            self._flusher_stop.set()
+        stop = self._flusher_stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logging.error(f"Error writing queued SQLite updates: {e}")
+
+        threading.Thread(target=run, name="sqlite-flusher", daemon=True).start()
+
+    @_synchronized
     def close(self):
         """
-        Closes the connection to the SQLite database.
+        Writes the queued updates and closes the connection to the SQLite database.
         """
+        if self._flusher_stop:
+            self._flusher_stop.set()
+            self._flusher_stop = None
         if self.connection:
-            self.connection.close()
+            try:
+                self.flush()
+            finally:
+                self.connection.close()
+                self.connection = None
             logging.info("Connection closed.")
+
+
+def _timestamp(value):
+    # task_runs guarda las fechas como texto "YYYY-MM-DD HH:MM:SS", que se compara en orden cronológico
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return str(value)
@@ -0,0 +1,90 @@
+import logging
+import sys
+import threading
+import time
+
+# Filas que se miden de cada lote para estimar el tamaño en memoria de una fila
+_SAMPLE_ROWS = 20
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses the ``fetchmany`` batch size of an export from what it observes while fetching.
+
+    Each batch is timed and a sample of its rows is measured. The size grows while batches come back
+    faster than ``target_seconds`` (so narrow rows and a fast network use few round trips) and shrinks
+    when they take longer, and it never exceeds what fits in ``max_batch_bytes`` for the observed row
+    width. The final ``size`` is meant to be stored and used as ``initial_size`` of the next run.
+    Safe to share between the threads of a partitioned export.
+    """
+
+    def __init__(self, initial_size, min_size=500, max_size=200000, max_batch_bytes=64 * 1024 * 1024,
+                 target_seconds=0.5):
+        """
+        :param initial_size: Batch size of the first fetch, usually the size learned by the previous run
+        :param min_size: Smallest batch size
+        :param max_size: Largest batch size
+        :param max_batch_bytes: Upper bound of the estimated memory of one batch
+        :param target_seconds: Fetch time per batch the size converges to
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_batch_bytes = max_batch_bytes
+        self.target_seconds = target_seconds
+        self.row_bytes = None
+        self.size = self._clamp(initial_size or min_size)
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def observe(self, rows, seconds, requested_size=None):
+        """
+        Records a fetched batch and adjusts the size of the next one.
+
+        :param rows: Rows returned by ``fetchmany``
+        :param seconds: Time the fetch took
+        :param requested_size: Size the batch was fetched with; the current size by default
+        """
+        if not rows:
+            return
+        sample = rows[:_SAMPLE_ROWS]
+        row_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample) / len(sample)
+        with self._lock:
+            self.batches += 1
+            # Media móvil para que una fila atípica no cambie el tamaño de golpe
+            self.row_bytes = row_bytes if self.row_bytes is None else 0.8 * self.row_bytes + 0.2 * row_bytes
+            # Un lote incompleto es el último: su tiempo no dice nada del tamaño pedido
+            if len(rows) >= (requested_size or self.size):
+                if seconds < self.target_seconds / 2:
+                    self.size = self._clamp(self.size * 2)
+                elif seconds > self.target_seconds * 2:
+                    self.size = self._clamp(self.size // 2)
+                elif seconds > 0:
+                    self.size = self._clamp(int(self.size * self.target_seconds / seconds))
+            else:
+                self.size = self._clamp(self.size)
+
+    def fetch(self, cursor, timings=None):
+        """
+        Fetches the next batch from ``cursor`` with the current size and observes it.
+
+        :param timings: Dictionary whose ``fetch`` entry accumulates the time spent
+        :return: The fetched rows; an empty list when the cursor is exhausted
+        """
+        requested_size = self.size
+        stage_start = time.perf_counter()
+        rows = cursor.fetchmany(requested_size)
+        elapsed = time.perf_counter() - stage_start
+        if timings is not None:
+            timings["fetch"] = timings.get("fetch", 0.0) + elapsed
+        self.observe(rows, elapsed, requested_size)
+        return rows
+
+    def log_summary(self, name):
+        logging.info(f"Batch size of {name} after {self.batches} batches: {self.size} rows "
+                     f"(~{self.row_bytes or 0:.0f} bytes per row).")
+
+    def _clamp(self, size):
+        upper = self.max_size
+        if self.row_bytes:
+            upper = min(upper, int(self.max_batch_bytes / self.row_bytes))
+        return max(self.min_size, min(upper, int(size)))
@@ -0,0 +1,190 @@
+import datetime
+import decimal
+import logging
+
+# Column formats a task can produce besides CSV
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Arrow exports require the pyarrow package: pip install pyarrow")
+    return pyarrow
+
+
+def arrow_type(desc):
+    """
+    Maps a ``cursor.description`` entry of fdb to an Arrow type.
+
+    :param desc: Tuple ``(name, type_code, display_size, internal_size, precision, scale, null_ok)``
+    :return: Arrow DataType, or None when the description carries no type information
+    """
+    pa = _pyarrow()
+    if len(desc) < 7:
+        return None
+    _, type_code, display_size, internal_size, precision, scale, _ = desc
+
+    if type_code is bool:
+        return pa.bool_()
+    if type_code is int:
+        return {2: pa.int16(), 4: pa.int32()}.get(internal_size, pa.int64())
+    if type_code is float:
+        return pa.float32() if internal_size == 4 else pa.float64()
+    if type_code is decimal.Decimal:
+        # fdb informa la escala en negativo, como Firebird (NUMERIC(10,2) -> -2)
+        return pa.decimal128(precision or 18, abs(scale or 0))
+    if type_code is datetime.datetime:
+        return pa.timestamp("us")
+    if type_code is datetime.date:
+        return pa.date32()
+    if type_code is datetime.time:
+        return pa.time64("us")
+    if type_code is str and display_size == 0:
+        # BLOB: la escala contiene el subtipo (1 = texto, el resto binario)
+        return pa.string() if scale == 1 else pa.binary()
+    return pa.string()
+
+
+class ArrowWriter:
+    """
+    Writes fdb row batches to a Parquet or Arrow IPC file, one row group / record batch at a time,
+    so memory is bounded by the size of a batch.
+    """
+
+    def __init__(self, output_file, description, output_format="parquet", compression=None,
+                 compression_level=None):
+        """
+        :param output_file: Path of the file to write
+        :param description: ``cursor.description`` of the executed query
+        :param output_format: ``parquet`` or ``arrow``
+        :param compression: Codec name (``none``, ``gzip``, ``zstd``); None uses the format default
+        :param compression_level: Compression level, or None for the codec default
+        """
+        if output_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'. Expected one of: {', '.join(COLUMNAR_FORMATS)}.")
+        self.pa = _pyarrow()
+        self.output_file = output_file
+        self.output_format = output_format
+        self.compression = compression
+        self.compression_level = compression_level
+        self.columns = [desc[0] for desc in description]
+        self.types = [arrow_type(desc) for desc in description]
+        self._writer = None
+        self.rows = 0
+
+    def write_batch(self, rows):
+        """
+        Appends a batch of row tuples as a new row group (Parquet) or record batch (Arrow IPC).
+        """
+        if not rows:
+            return
+        pa = self.pa
+        values = list(zip(*rows))
+        if any(column_type is None for column_type in self.types):
+            # Sin tipos en la descripción: se infieren del primer lote y se fijan para el resto
+            self.types = [column_type or self._infer_type(column) for column_type, column in zip(self.types, values)]
+        arrays = [pa.array(column, type=column_type) for column, column_type in zip(values, self.types)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self._schema())
+        self._ensure_writer()
+        if self.output_format == "parquet":
+            self._writer.write_batch(batch, row_group_size=len(rows))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(rows)
+
+    def write_arrow(self, data):
+        """
+        Appends an Arrow RecordBatch or Table that already has the writer's schema.
+        """
+        self._ensure_writer()
+        if self.output_format == "parquet":
+            table = data if isinstance(data, self.pa.Table) else self.pa.Table.from_batches([data])
+            self._writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        else:
+            self._writer.write(data)
+        self.rows += data.num_rows
+
+    def close(self):
+        """
+        Writes the file footer. A file with only the schema is produced if no rows were written.
+        """
+        if self.types and any(column_type is None for column_type in self.types):
+            self.types = [column_type or self.pa.string() for column_type in self.types]
+        self._ensure_writer()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _infer_type(self, column):
+        inferred = self.pa.array(column).type
+        return self.pa.string() if self.pa.types.is_null(inferred) else inferred
+
+    def _schema(self):
+        return self.pa.schema([self.pa.field(name, column_type) for name, column_type in zip(self.columns, self.types)])
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        pa = self.pa
+        if self.output_format == "parquet":
+            compression = self.compression if self.compression not in (None, "none") else "snappy"
+            self._writer = pa.parquet.ParquetWriter(
+                self.output_file, self._schema(), compression=compression,
+                compression_level=self.compression_level, use_dictionary=True
+            )
+        else:
+            # Arrow IPC solo admite lz4 y zstd como compresión de buffers
+            compression = None
+            if self.compression not in (None, "none"):
+                if self.compression == "gzip":
+                    logging.warning("Arrow IPC does not support gzip; using zstd instead.")
+                compression = pa.Codec("zstd", compression_level=self.compression_level)
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            self._writer = pa.ipc.new_file(self.output_file, self._schema(), options=options)
+
+
+def merge_files(part_files, output_file, output_format, compression=None, compression_level=None):
+    """
+    Concatenates Parquet or Arrow IPC files with the same schema into ``output_file``, in order,
+    one row group / record batch at a time.
+
+    :param part_files: Paths of the partial files, in the order their rows must appear
+    :param output_file: Path of the merged file
+    :param output_format: ``parquet`` or ``arrow``
+    :param compression: Codec name, as in ArrowWriter
+    :param compression_level: Compression level, or None for the codec default
+    :return: Number of rows written
+    """
+    pa = _pyarrow()
+    rows = 0
+    writer = None
+    try:
+        for part_file in part_files:
+            if output_format == "parquet":
+                part = pa.parquet.ParquetFile(part_file)
+                batches = (part.read_row_group(index) for index in range(part.num_row_groups))
+                schema = part.schema_arrow
+            else:
+                part = pa.ipc.open_file(part_file)
+                batches = (part.get_batch(index) for index in range(part.num_record_batches))
+                schema = part.schema
+            if writer is None:
+                writer = ArrowWriter(output_file, [(name,) for name in schema.names], output_format, compression,
+                                     compression_level)
+                writer.types = list(schema.types)
+            for batch in batches:
+                writer.write_arrow(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+            rows = writer.rows
+    return rows
+
@@ -0,0 +1,190 @@
+import base64
+import codecs
+import functools
+import logging
+import tempfile
+
+import fdb
+
+# Encodings a binary BLOB can be written with in text outputs
+BINARY_ENCODINGS = ("none", "base64", "hex", "text")
+
+# BLOBs larger than this are returned by fdb as BlobReader instead of being materialized (fdb's default)
+BLOB_STREAM_THRESHOLD = 64 * 1024
+
+# Bytes read from a BlobReader per call; a multiple of 3 so every base64 chunk can be encoded on its own
+BLOB_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def is_blob(desc):
+    """
+    :param desc: ``cursor.description`` entry of fdb
+    :return: Whether the column is a BLOB (fdb reports them as ``str`` with a display size of 0)
+    """
+    return len(desc) > 5 and desc[1] is str and desc[2] == 0
+
+
+def is_text_blob(desc):
+    # BLOB: la escala contiene el subtipo (1 = texto, el resto binario)
+    return is_blob(desc) and desc[5] == 1
+
+
+def validate_binary_encoding(binary_encoding):
+    binary_encoding = (binary_encoding or "none").lower()
+    if binary_encoding not in BINARY_ENCODINGS:
+        raise ValueError(f"Unsupported binary encoding '{binary_encoding}'. Expected one of: {', '.join(BINARY_ENCODINGS)}.")
+    return binary_encoding
+
+
+class BlobEncoder:
+    """
+    Turns BLOB values into text for CSV outputs.
+
+    BLOBs up to ``stream_threshold`` bytes arrive materialized (``bytes``, or ``str`` when the connection
+    has a charset) and are converted whole. Larger ones arrive as ``fdb.BlobReader`` and are copied to
+    the output in chunks of ``chunk_size`` bytes, so memory does not depend on the size of the BLOB.
+
+    Text BLOBs are decoded with ``charset``. Binary BLOBs are written as ``base64``, ``hex`` or, with
+    ``none``, as the ``repr`` of the bytes (``b'...'``), which is what ``DataFrame.to_csv`` wrote. With
+    ``text`` they are decoded with ``charset`` replacing invalid bytes, for legacy databases that keep
+    text in SUB_TYPE 0 BLOBs; a warning is logged once per column when a byte is replaced.
+    """
+
+    def __init__(self, binary_encoding="none", charset="utf-8", chunk_size=BLOB_CHUNK_SIZE,
+                 stream_threshold=BLOB_STREAM_THRESHOLD):
+        """
+        :param binary_encoding: ``none``, ``base64``, ``hex`` or ``text``
+        :param charset: Charset of the BLOB contents
+        :param chunk_size: Bytes read from a BlobReader per call
+        :param stream_threshold: Size in bytes above which fdb returns a BLOB as BlobReader; -1
+            materializes every BLOB whatever its size
+        """
+        if stream_threshold < -1:
+            raise ValueError(f"Invalid BLOB stream threshold {stream_threshold}. Expected -1 or a size in bytes.")
+        self.binary_encoding = validate_binary_encoding(binary_encoding)
+        self.charset = charset
+        # Múltiplo de 3 para que cada trozo en base64 no necesite relleno intermedio
+        self.chunk_size = max(3, chunk_size - chunk_size % 3)
+        self.stream_threshold = stream_threshold
+        self._replaced_columns = set()
+
+    def quoted(self, is_text):
+        """
+        :return: Whether encoded values can contain CSV special characters and have to be quoted
+        """
+        return is_text or self.binary_encoding in ("none", "text")
+
+    def to_text(self, value, is_text, column=None):
+        """
+        Converts a materialized BLOB value.
+
+        :param value: ``bytes`` or ``str``
+        :param is_text: Whether the column is a text BLOB
+        :param column: Name of the column, for the warning about replaced bytes
+        :return: Text to write in the output
+        """
+        if isinstance(value, str):
+            return value
+        if is_text:
+            return value.decode(self.charset)
+        if self.binary_encoding == "base64":
+            return base64.b64encode(value).decode("ascii")
+        if self.binary_encoding == "hex":
+            return value.hex()
+        if self.binary_encoding == "text":
+            return self._check_replaced(value.decode(self.charset, errors="replace"), column)
+        return repr(value)
+
+    def chunks(self, reader, column=None):
+        """
+        Reads a BlobReader in chunks and closes it.
+
+        :param column: Name of the column, for the warning about replaced bytes
+        :return: Generator of text chunks; joined they equal ``to_text`` of the whole value
+        """
+        if not reader.is_text and self.binary_encoding == "none":
+            return self._repr_chunks(reader)
+        return self._decoded_chunks(reader, column)
+
+    def _decoded_chunks(self, reader, column):
+        is_text = reader.is_text
+        decoder = None
+        if is_text or self.binary_encoding == "text":
+            decoder = codecs.getincrementaldecoder(self.charset)(errors="strict" if is_text else "replace")
+        try:
+            while True:
+                chunk = reader.read(self.chunk_size)
+                if not chunk:
+                    break
+                if isinstance(chunk, str):
+                    # fdb ya decodificó el trozo con el charset de la conexión
+                    yield chunk
+                elif is_text:
+                    yield decoder.decode(chunk)
+                elif decoder:
+                    yield self._check_replaced(decoder.decode(chunk), column)
+                elif self.binary_encoding == "base64":
+                    yield base64.b64encode(chunk).decode("ascii")
+                else:
+                    yield chunk.hex()
+            if decoder:
+                yield self._check_replaced(decoder.decode(b"", final=True), column)
+        finally:
+            reader.close()
+
+    def _repr_chunks(self, reader):
+        # repr() elige las comillas según el valor entero: se copia a un temporal antes de escribir nada
+        with tempfile.SpooledTemporaryFile(max_size=self.chunk_size) as spool:
+            has_single_quote = has_double_quote = False
+            try:
+                for chunk in iter(functools.partial(reader.read, self.chunk_size), b""):
+                    has_single_quote = has_single_quote or b"'" in chunk
+                    has_double_quote = has_double_quote or b'"' in chunk
+                    spool.write(chunk)
+            finally:
+                reader.close()
+            quote = '"' if has_single_quote and not has_double_quote else "'"
+            spool.seek(0)
+            yield "b" + quote
+            for chunk in iter(functools.partial(spool.read, self.chunk_size), b""):
+                text = repr(chunk)
+                # Un trozo con ' y sin " sale entre comillas dobles; dentro del valor entero la ' va escapada
+                yield text[2:-1].replace("'", "\\'") if text[1] != quote else text[2:-1]
+            yield quote
+
+    def _check_replaced(self, text, column):
+        # U+FFFD marca los bytes que no se pudieron decodificar; se avisa una vez por columna
+        if "\ufffd" in text and column not in self._replaced_columns:
+            self._replaced_columns.add(column)
+            logging.warning(f"BLOB column {column} has bytes that are not valid {self.charset}. "
+                            f"They were replaced with U+FFFD; use base64 or hex to keep binary data intact.")
+        return text
+
+    def read(self, reader):
+        """
+        Reads a whole BlobReader, for outputs that need the value at once (Parquet, Arrow).
+
+        :return: ``bytes`` for binary BLOBs, ``str`` or ``bytes`` for text BLOBs as fdb returns them
+        """
+        try:
+            return reader.read()
+        finally:
+            reader.close()
+
+    def materialize(self, rows, blob_columns):
+        """
+        Replaces the BlobReaders of a batch with their contents. Returns the batch unchanged when it
+        has none.
+
+        :param blob_columns: Indexes of the BLOB columns
+        """
+        if not any(isinstance(row[index], fdb.BlobReader) for row in rows for index in blob_columns):
+            return rows
+        materialized_rows = []
+        for row in rows:
+            row = list(row)
+            for index in blob_columns:
+                if isinstance(row[index], fdb.BlobReader):
+                    row[index] = self.read(row[index])
+            materialized_rows.append(tuple(row))
+        return materialized_rows
@@ -0,0 +1,192 @@
+import csv
+import io
+import os
+
+import functools
+import tempfile
+
+import fdb
+
+from firebird.BlobEncoder import BlobEncoder, is_blob, is_text_blob
+from firebird.ColumnFormats import ColumnFormats
+
+
+def _format_float(value):
+    # pandas escribe NaN como campo vacío
+    return "" if value != value else value
+
+
+class CSVEncoder:
+    """
+    Encodes fdb rows as CSV without going through pandas.
+
+    The output is what ``DataFrame.to_csv(index=False)`` produced for the same rows: minimal
+    quoting, ``os.linesep`` line endings and empty fields for NULLs. Values that the csv module
+    already renders like pandas (strings, decimals, dates, times) are written as they come; a
+    formatter is chosen once per column from ``cursor.description`` only for the types that need
+    one, and rows are only rebuilt when at least one column has a formatter.
+
+    pandas gives integer and timestamp columns a format derived from all their values (see
+    ``ColumnFormats``), so the rows must go through ``observe`` before they are written. A CSV
+    written in batches may have to be rewritten when a later batch widens a column.
+
+    With ``column_formats=False`` every value is formatted on its own instead, for streams whose
+    bytes cannot be rewritten: integer columns with NULLs stay integers (pandas writes ``1.0``) and
+    timestamps are written with ``str()``, keeping their own fractional seconds.
+
+    BLOB columns are converted to text by a BlobEncoder. Large BLOBs, which fdb returns as
+    ``BlobReader``, are copied to the output stream in chunks. Their text is quoted with the same
+    minimal quoting as the rest of the fields, so a BLOB is written the same way whatever its size.
+    """
+
+    def __init__(self, description, lineterminator=os.linesep, column_formats=True, blob_encoder=None):
+        """
+        :param description: ``cursor.description`` of the executed query
+        :param lineterminator: Line ending, ``os.linesep`` like pandas by default
+        :param column_formats: Whether integer and timestamp columns get the column-wide formats of
+            pandas, or each value is written on its own
+        :param blob_encoder: BlobEncoder for the BLOB columns; one with the defaults if not given
+        """
+        self.columns = [desc[0] for desc in description]
+        self.blob_columns = [index for index, desc in enumerate(description) if is_blob(desc)]
+        self.blob_encoder = (blob_encoder or BlobEncoder()) if self.blob_columns else None
+        self.formatters = [self._blob_formatter(desc[0], is_text_blob(desc)) if is_blob(desc) else self._formatter_for(desc)
+                           for desc in description]
+        self.lineterminator = lineterminator
+        self.formats = ColumnFormats(description) if column_formats else None
+        self._formatted_columns = [(index, formatter) for index, formatter in enumerate(self.formatters) if formatter]
+        self._buffer = io.StringIO()
+        self._writer = self.writer(self._buffer)
+        self._field_buffer = io.StringIO()
+        # Con el mismo fin de línea que las filas, que decide qué campos se entrecomillan
+        self._field_writer = self.writer(self._field_buffer)
+        # Caracteres por los que csv.writer entrecomilla un campo con este fin de línea
+        self._special_characters = [char for char in {",", '"', "\r", "\n"} | set(lineterminator)
+                                    if self._field(char) != char]
+
+    @staticmethod
+    def _formatter_for(desc):
+        type_code = desc[1] if len(desc) > 1 else None
+        if type_code is float:
+            return _format_float
+        return None
+
+    def _blob_formatter(self, column, is_text):
+        def format_blob(value):
+            # Los BlobReader se escriben por trozos en write_rows
+            if isinstance(value, fdb.BlobReader):
+                return value
+            return self.blob_encoder.to_text(value, is_text, column)
+        return format_blob
+
+    def writer(self, stream):
+        """
+        :return: A csv writer on ``stream`` configured like the encoder
+        """
+        return csv.writer(stream, lineterminator=self.lineterminator)
+
+    def observe(self, rows):
+        """
+        Widens the column formats so they cover ``rows``.
+
+        :return: Whether any column widened, so rows written before have to be rewritten
+        """
+        return self.formats.observe(rows) if self.formats else False
+
+    def format_rows(self, rows):
+        """
+        Applies the column formatters to a batch of rows. Returns the batch unchanged when no
+        column needs formatting.
+        """
+        formatted_columns = self._formatted_columns
+        if self.formats:
+            formatted_columns = formatted_columns + self.formats.formatters()
+        if not formatted_columns:
+            return rows
+        formatted_rows = []
+        for row in rows:
+            row = list(row)
+            for index, formatter in formatted_columns:
+                value = row[index]
+                if value is not None:
+                    row[index] = formatter(value)
+            formatted_rows.append(row)
+        return formatted_rows
+
+    def write_header(self, stream_writer):
+        stream_writer.writerow(self.columns)
+
+    def write_rows(self, stream_writer, rows, stream=None):
+        """
+        :param stream: Stream under ``stream_writer``; BLOBs that arrive as BlobReader are copied to it
+            in chunks. Without it they are read whole
+        """
+        rows = self.format_rows(rows)
+        if not self.blob_columns:
+            stream_writer.writerows(rows)
+            return
+        for row in rows:
+            if not any(isinstance(row[index], fdb.BlobReader) for index in self.blob_columns):
+                stream_writer.writerow(row)
+            elif stream is None:
+                stream_writer.writerow(["".join(self.blob_encoder.chunks(value, self.columns[index]))
+                                        if isinstance(value, fdb.BlobReader) else value
+                                        for index, value in enumerate(row)])
+            else:
+                self._write_streamed_row(stream, row)
+
+    def _write_streamed_row(self, stream, row):
+        for index, value in enumerate(row):
+            if index:
+                stream.write(",")
+            if isinstance(value, fdb.BlobReader):
+                self._write_blob(stream, value, self.columns[index])
+            else:
+                stream.write(self._field(value))
+        stream.write(self.lineterminator)
+
+    def _write_blob(self, stream, reader, column):
+        if not self.blob_encoder.quoted(reader.is_text):
+            # base64 y hex nunca contienen caracteres especiales
+            for chunk in self.blob_encoder.chunks(reader, column):
+                stream.write(chunk)
+            return
+        # Solo se sabe si hay que entrecomillar al final del BLOB: el texto se guarda mientras tanto en un
+        # archivo temporal, en memoria hasta chunk_size caracteres
+        with tempfile.SpooledTemporaryFile(max_size=self.blob_encoder.chunk_size, mode="w+", encoding="utf-8",
+                                           newline="") as spool:
+            quoted = False
+            for chunk in self.blob_encoder.chunks(reader, column):
+                quoted = quoted or any(char in chunk for char in self._special_characters)
+                spool.write(chunk)
+            spool.seek(0)
+            if quoted:
+                stream.write('"')
+            for chunk in iter(functools.partial(spool.read, self.blob_encoder.chunk_size), ""):
+                stream.write(chunk.replace('"', '""') if quoted else chunk)
+            if quoted:
+                stream.write('"')
+
+    def _field(self, value):
+        # Un campo suelto con el mismo entrecomillado que le daría csv.writer dentro de la fila
+        if value is None or value == "":
+            return ""
+        self._field_buffer.seek(0)
+        self._field_buffer.truncate()
+        self._field_writer.writerow([value])
+        return self._field_buffer.getvalue()[:-len(self.lineterminator)]
+
+    def encode(self, rows, header=False):
+        """
+        Encodes a batch of rows.
+
+        :param rows: Sequence of row tuples
+        :param header: Whether to emit the header line before the rows
+        :return: CSV text
+        """
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if header:
+            self.write_header(self._writer)
+        self.write_rows(self._writer, rows, self._buffer)
+        return self._buffer.getvalue()
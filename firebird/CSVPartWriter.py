@@ -0,0 +1,147 @@
+import datetime
+import io
+import json
+import logging
+import os
+import posixpath
+
+from utils.hashing import open_hashed_output
+
+
+def part_path(path, index, remote=False):
+    """
+    Name of a part file: ``part-0001`` goes before the extensions, so ``report.csv.gz`` becomes
+    ``report.part-0001.csv.gz``.
+
+    :param index: Part number, starting at 1
+    :param remote: Whether the path is a remote (POSIX) path
+    """
+    path_module = posixpath if remote else os.path
+    directory, name = path_module.split(path)
+    stem, dot, extensions = name.partition(".")
+    return path_module.join(directory, f"{stem}.part-{index:04d}{dot}{extensions}") if path else path
+
+
+def manifest_path(path, remote=False):
+    """
+    Name of the manifest of a split output: ``report.csv.gz`` becomes ``report.manifest.json``.
+
+    :param remote: Whether the path is a remote (POSIX) path
+    """
+    path_module = posixpath if remote else os.path
+    directory, name = path_module.split(path)
+    return path_module.join(directory, f"{name.partition('.')[0]}.manifest.json") if path else path
+
+
+def write_manifest(path, parts, extra=None):
+    """
+    Writes the JSON manifest of a split output: file names, rows, sizes and SHA-256 checksums of
+    the parts, in order.
+
+    :param parts: Part dictionaries returned by ``CSVPartWriter.close``
+    :param extra: Additional top-level entries
+    :return: ``path``
+    """
+    manifest = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": sum(part["rows"] for part in parts),
+        "bytes": sum(part["bytes"] for part in parts),
+        "parts": [{"name": os.path.basename(part["path"]), "rows": part["rows"], "bytes": part["bytes"],
+                   "sha256": part["sha256"]} for part in parts]
+    }
+    manifest.update(extra or {})
+    with open(path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return path
+
+
+class CSVPartWriter:
+    """
+    Writes CSV rows to a sequence of part files, starting a new part when the current one reaches
+    ``max_rows`` rows or ``max_bytes`` bytes on disk. Every part has the header, so it can be loaded
+    on its own.
+
+    The row limit is exact; the byte limit is checked after each write, and compressed outputs only
+    grow when the compressor flushes, so a part can go over it by about one batch.
+    """
+
+    def __init__(self, output_file, encoder, codec="none", codec_level=None, max_rows=None, max_bytes=None,
+                 include_header=True, on_part=None):
+        """
+        :param output_file: Name the part files are derived from (see ``part_path``)
+        :param encoder: CSVEncoder of the query
+        :param codec: Output compression of every part
+        :param codec_level: Compression level, or None for the codec default
+        :param max_rows: Rows per part, or None for no row limit
+        :param max_bytes: Bytes per part, or None for no size limit
+        :param include_header: Whether every part starts with the header line
+        :param on_part: Called with the dictionary of each part as soon as the part file is closed
+        """
+        self.output_file = output_file
+        self.encoder = encoder
+        self.codec = codec
+        self.codec_level = codec_level
+        self.max_rows = max_rows or None
+        self.max_bytes = max_bytes or None
+        self.include_header = include_header
+        self.on_part = on_part
+        self.parts = []
+        self.rows = 0
+        self._part = None
+
+    def write_rows(self, rows):
+        """
+        Appends a batch of rows, splitting it between parts when a limit is reached inside it.
+        """
+        while rows:
+            if self._part is None:
+                self._open_part()
+            count = len(rows)
+            if self.max_rows:
+                count = min(count, self.max_rows - self._part["rows"])
+            self.encoder.write_rows(self._csv_writer, rows[:count], self._text)
+            self._part["rows"] += count
+            self.rows += count
+            rows = rows[count:]
+            if (self.max_rows and self._part["rows"] >= self.max_rows) or \
+                    (self.max_bytes and self._file.bytes >= self.max_bytes):
+                self._close_part()
+
+    def close(self):
+        """
+        Closes the last part. A query without rows still produces one part with the header.
+
+        :return: List of part dictionaries with ``index``, ``path``, ``rows``, ``bytes`` and ``sha256``
+        """
+        if self._part is None and not self.parts:
+            self._open_part()
+        if self._part is not None:
+            self._close_part()
+        return self.parts
+
+    def discard(self):
+        """
+        Closes the part being written without reporting it, after a failed export.
+        """
+        if self._part is not None:
+            self._text.close()
+            self._part = None
+
+    def _open_part(self):
+        index = len(self.parts) + 1
+        path = part_path(self.output_file, index)
+        output, self._file = open_hashed_output(path, self.codec, self.codec_level)
+        self._text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        self._csv_writer = self.encoder.writer(self._text)
+        if self.include_header:
+            self.encoder.write_header(self._csv_writer)
+        self._part = {"index": index, "path": path, "rows": 0}
+
+    def _close_part(self):
+        self._text.close()
+        part = dict(self._part, bytes=self._file.bytes, sha256=self._file.hasher.hexdigest())
+        self.parts.append(part)
+        self._part = None
+        logging.info(f"Part {part['path']} written: {part['rows']} rows, {part['bytes']} bytes.")
+        if self.on_part:
+            self.on_part(part)
@@ -0,0 +1,150 @@
+import copy
+import csv
+import datetime
+import functools
+import os
+
+# Rango de datetime64[ns]: con un valor fuera de él pandas deja la columna como object y escribe str() de cada valor
+TIMESTAMP_MIN = datetime.datetime(1677, 9, 21, 0, 12, 43, 145225)
+TIMESTAMP_MAX = datetime.datetime(2262, 4, 11, 23, 47, 16, 854775)
+
+# Límite de tamaño de campo del lector csv al reescribir: el de por defecto (128 KB) no admite BLOB grandes
+CSV_FIELD_SIZE_LIMIT = 2 ** 31 - 1
+
+# Formatos de una columna entera, del más estrecho al más ancho
+INTEGER, FLOAT = 0, 1
+# Formatos de una columna de marcas de tiempo, del más estrecho al más ancho
+DATE_ONLY, SECONDS, MILLISECONDS, MICROSECONDS, OBJECT = 0, 1, 2, 3, 4
+
+
+def _integer_level(values):
+    return FLOAT if None in values else INTEGER
+
+
+def _timestamp_level(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return DATE_ONLY
+    if min(values) < TIMESTAMP_MIN or max(values) > TIMESTAMP_MAX:
+        return OBJECT
+    microseconds = {value.microsecond for value in values}
+    if any(microsecond % 1000 for microsecond in microseconds):
+        return MICROSECONDS
+    if microseconds != {0}:
+        return MILLISECONDS
+    if any(value.hour or value.minute or value.second for value in values):
+        return SECONDS
+    return DATE_ONLY
+
+
+def _format_integer(value, level):
+    # pandas convierte a float64 las columnas enteras con algún NULL
+    return repr(float(value)) if level == FLOAT else str(value)
+
+
+def _format_timestamp(value, level):
+    if level == OBJECT:
+        return str(value)
+    if level == DATE_ONLY:
+        return value.date().isoformat()
+    if level == SECONDS:
+        return value.isoformat(' ', 'seconds')
+    if level == MILLISECONDS:
+        return value.isoformat(' ', 'milliseconds')
+    return value.isoformat(' ', 'microseconds')
+
+
+# Por tipo: nivel de un lote de valores, formateador, parser del texto escrito y el nivel en el que
+# el csv ya escribe el valor como pandas, sin formateador
+_KINDS = {
+    int: (_integer_level, _format_integer, float, INTEGER),
+    datetime.datetime: (_timestamp_level, _format_timestamp, datetime.datetime.fromisoformat, SECONDS)
+}
+
+
+class ColumnFormats:
+    """
+    Column-wide formats that ``DataFrame.to_csv`` derives from all the values of a column.
+
+    pandas writes an integer column as floats (``1.0``) as soon as it has a NULL, and gives a timestamp
+    column one shared precision: only the date when every value is at midnight, otherwise seconds,
+    milliseconds or microseconds, or ``str()`` of each value when one falls outside the range of
+    ``datetime64[ns]``. A CSV written batch by batch only knows the rows fetched so far, so the formats
+    start narrow and widen as rows arrive; ``reformat`` brings rows written before a column widened to
+    the format of the whole result.
+
+    The kind of every column is taken once from ``cursor.description``; the other columns are written
+    value by value and are left as they come.
+    """
+
+    def __init__(self, description):
+        """
+        :param description: ``cursor.description`` of the executed query
+        """
+        type_codes = [desc[1] if len(desc) > 1 else None for desc in description]
+        self._columns = [(index, _KINDS[type_code]) for index, type_code in enumerate(type_codes)
+                         if type_code in _KINDS]
+        self.levels = [0] * len(description)
+
+    def observe(self, rows):
+        """
+        Widens the formats so they cover ``rows``.
+
+        :return: Whether any column widened
+        """
+        widened = False
+        if not rows:
+            return widened
+        for index, (level_of, _, _, _) in self._columns:
+            level = level_of([row[index] for row in rows])
+            if level > self.levels[index]:
+                self.levels[index] = level
+                widened = True
+        return widened
+
+    @staticmethod
+    def widest(parts):
+        """
+        :param parts: ColumnFormats of the parts of one file, each written on its own
+        :return: ColumnFormats covering the rows of every part
+        """
+        widest = copy.copy(parts[0])
+        widest.levels = [max(levels) for levels in zip(*(part.levels for part in parts))]
+        return widest
+
+    def formatters(self):
+        """
+        :return: ``(index, formatter)`` of the integer and timestamp columns, each formatter writing
+            a value with the current format of its column
+        """
+        return [(index, functools.partial(format_value, level=self.levels[index]))
+                for index, (_, format_value, _, plain_level) in self._columns
+                if self.levels[index] != plain_level]
+
+    def reformat(self, source, target, has_header=True, lineterminator=os.linesep):
+        """
+        Copies CSV text from ``source`` to ``target``, rewriting the integer and timestamp fields with
+        the current formats. Fields written with a narrower format are parsed back without loss, so
+        the result is the same as writing every row with the current formats. One row is held in
+        memory at a time, BLOB fields included.
+
+        :param source: Text stream opened with ``newline=''``
+        :param target: Text stream opened with ``newline=''``
+        :param has_header: Whether the first line is the header, which is copied as it is
+        :param lineterminator: Line ending of the written rows
+        """
+        csv.field_size_limit(max(csv.field_size_limit(), CSV_FIELD_SIZE_LIMIT))
+        reader = csv.reader(source)
+        writer = csv.writer(target, lineterminator=lineterminator)
+        if has_header:
+            header = next(reader, None)
+            if header is not None:
+                writer.writerow(header)
+        # Las columnas que siguen en el formato más estrecho no han cambiado
+        widened = [(index, format_value, parse) for index, (_, format_value, parse, _) in self._columns
+                   if self.levels[index]]
+        for row in reader:
+            for index, format_value, parse in widened:
+                if row[index]:
+                    row[index] = format_value(parse(row[index]), self.levels[index])
+            writer.writerow(row)
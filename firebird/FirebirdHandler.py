@@ -1,10 +1,25 @@
+import io
 import logging
+import os
+import time
 import traceback
 
 import fdb
-import pandas as pd
 
+from firebird.AdaptiveBatchSizer import AdaptiveBatchSizer
+from firebird.ArrowWriter import ArrowWriter
+from firebird.BlobEncoder import BlobEncoder, is_blob
+from firebird.CSVEncoder import CSVEncoder
+from firebird.CSVPartWriter import CSVPartWriter
+from utils.compression import open_input, validate_codec
 from utils.errors import FirebirdConnectionError, FirebirdQueryError
+from utils.hashing import open_hashed_output
+
+# Rows per fetchmany when an export has to stream and no batch size was given
+DEFAULT_BATCH_SIZE = 10000
+
+# Transacción snapshot de solo lectura: lecturas consistentes sin bloquear a los escritores
+READ_ONLY_SNAPSHOT = bytes([fdb.isc_tpb_version3, fdb.isc_tpb_read, fdb.isc_tpb_wait, fdb.isc_tpb_concurrency])
 
 
 class FirebirdHandler:
@@ -24,6 +39,14 @@ class FirebirdHandler:
         self.user = user
         self.password = password
         self.connection = None
+        # Formatos de columna del último CSV exportado, para unir archivos parciales
+        self.column_formats = None
+        # Segundos de la última exportación por etapa: execute, fetch y write
+        self.timings = {}
+        # Archivos de la última exportación dividida en partes
+        self.parts = []
+        # SHA-256 del último CSV exportado, calculado mientras se escribe
+        self.content_hash = None
 
     def connect(self):
         """
@@ -42,15 +65,68 @@ class FirebirdHandler:
             logging.error(f"Error connecting to the database: {e}")
             raise FirebirdConnectionError(f"Error connecting to the database: {e}")
 
-    def execute_query_to_csv(self, query, output_file):
+    def ping(self):
+        """
+        Checks that the connection is still usable with a trivial round trip.
+
+        :return: True if the server answered, False otherwise
+        """
+        if not self.connection:
+            return False
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT 1 FROM RDB$DATABASE")
+            cursor.fetchone()
+            cursor.close()
+            self.connection.rollback()
+            return True
+        except fdb.DatabaseError as e:
+            logging.warning(f"Firebird connection is not usable: {e}")
+            return False
+
+    def begin_read_only_snapshot(self):
+        """
+        Starts a read-only snapshot transaction, so every query of this connection sees the
+        database as it was at this moment. It ends when the connection is rolled back, which the
+        pool does when the connection is released.
+        """
+        try:
+            if not self.connection:
+                raise FirebirdConnectionError("No connection established with the database.")
+            self.connection.begin(tpb=READ_ONLY_SNAPSHOT)
+        except fdb.DatabaseError as e:
+            logging.error(f"Error al iniciar la transacción de solo lectura: {e}")
+            raise FirebirdQueryError(f"Error al iniciar la transacción de solo lectura: {e}")
+
+    def execute_query_to_csv(self, query, output_file, batch_size=None, codec="none", codec_level=None, params=None,
+                             include_header=True, blob_encoder=None, part_max_rows=None, part_max_bytes=None,
+                             on_part=None):
         """
         Executes a query on the Firebird database and saves the results to a CSV file.
         Instrumentado para medir el tiempo de ejecución y registrar información relevante.
 
         :param query: SQL query to execute
         :param output_file: Name of the CSV file to save the results
+        :param batch_size: If given, rows are fetched with ``fetchmany`` in batches of this size and
+            appended to the CSV as they arrive, so memory stays bounded by the batch size. An
+            AdaptiveBatchSizer chooses the size of every batch instead
+        :param codec: Output compression (``none``, ``gzip`` or ``zstd``). Compressed exports are
+            always written in batches, so the uncompressed CSV never exists in memory or on disk
+        :param codec_level: Compression level, or None for the codec default
+        :param params: Values for the ``?`` placeholders of the query
+        :param include_header: Whether to write the header line; partial outputs that are appended
+            to another file leave it out. The SHA-256 of the written file is left in ``content_hash``
+        :param blob_encoder: BlobEncoder that writes the BLOB columns; BLOBs larger than its
+            ``stream_threshold`` are copied to the file in chunks
+        :param part_max_rows: If given, the output is split into part files of at most this many rows
+            (see ``CSVPartWriter``) instead of writing ``output_file``
+        :param part_max_bytes: If given, a new part file is started once the current one reaches this size
+        :param on_part: Called with each finished part (``index``, ``path``, ``rows``, ``bytes``,
+            ``sha256``) while the next ones are still being fetched
+        :return: Number of exported rows
         """
-        import time
+        # Un codec no válido se rechaza antes de abrir el cursor y ejecutar la consulta
+        codec = validate_codec(codec)
         try:
             start_time = time.time()
             if not self.connection:
@@ -61,25 +137,137 @@ class FirebirdHandler:
 
             logging.info(f"Ejecutando consulta: {query}")
             # Ejecutar la consulta
-            cursor.execute(query)
-
-            # Obtener resultados y nombres de columnas
-            rows = cursor.fetchall()
-            num_rows = len(rows)
-            columns = [desc[0] for desc in cursor.description]
+            self.timings = {"execute": 0.0, "fetch": 0.0, "write": 0.0}
+            stage_start = time.perf_counter()
+            self._execute(cursor, query, params)
+            self.timings["execute"] = time.perf_counter() - stage_start
+            blob_encoder = blob_encoder or BlobEncoder()
+            self._stream_large_blobs(cursor, blob_encoder)
 
-            # Crear un DataFrame con los resultados
-            df = pd.DataFrame(rows, columns=columns)
+            self.content_hash = None
+            split = bool(part_max_rows or part_max_bytes)
+            if (codec != "none" or split) and not batch_size:
+                batch_size = DEFAULT_BATCH_SIZE
 
-            # Guardar el DataFrame en un archivo CSV
-            df.to_csv(output_file, index=False, encoding='utf-8')
+            # Las partes se suben en cuanto se cierran y no se pueden reescribir: cada valor se formatea por sí solo
+            encoder = CSVEncoder(cursor.description, column_formats=not split, blob_encoder=blob_encoder)
+            self.column_formats = encoder.formats
+            if split:
+                part_writer = CSVPartWriter(output_file, encoder, codec, codec_level, part_max_rows, part_max_bytes,
+                                            include_header, on_part)
+                self.parts = self._write_csv_parts(cursor, part_writer, batch_size, self.timings)
+                num_rows = part_writer.rows
+            elif batch_size:
+                # Modo streaming: la memoria queda acotada al tamaño del lote
+                num_rows, self.content_hash = self._write_csv_in_batches(cursor, encoder, output_file, batch_size, codec,
+                                                                         codec_level, include_header, self.timings)
+            else:
+                # Obtener resultados y guardarlos en un archivo CSV
+                stage_start = time.perf_counter()
+                rows = cursor.fetchall()
+                self.timings["fetch"] = time.perf_counter() - stage_start
+                num_rows = len(rows)
+                stage_start = time.perf_counter()
+                # Todas las filas están en memoria: las columnas toman su formato final antes de escribir
+                encoder.observe(rows)
+                output, hashing_writer = open_hashed_output(output_file)
+                with io.TextIOWrapper(output, encoding='utf-8', newline='') as csv_file:
+                    csv_writer = encoder.writer(csv_file)
+                    if include_header:
+                        encoder.write_header(csv_writer)
+                    encoder.write_rows(csv_writer, rows, csv_file)
+                self.timings["write"] = time.perf_counter() - stage_start
+                self.content_hash = hashing_writer.hasher.hexdigest()
 
             elapsed_time = time.time() - start_time
             logging.info(
-                f"Consulta ejecutada y resultados guardados en {output_file} en {elapsed_time:.2f} segundos. Filas obtenidas: {num_rows}")
+                f"Consulta ejecutada y resultados guardados en {output_file} en {elapsed_time:.2f} segundos. Filas exportadas: {num_rows}")
 
             # Cerrar el cursor
             cursor.close()
+            return num_rows
+        except FirebirdConnectionError as e:
+            traceback.print_exc()
+            logging.error(f"Error de conexión: {e}")
+            raise
+        except fdb.DatabaseError as e:
+            traceback.print_exc()
+            logging.error(f"Error al ejecutar la consulta: {e}")
+            raise FirebirdQueryError(f"Error al ejecutar la consulta: {e}")
+        except Exception as ex:
+            traceback.print_exc()
+            logging.error(f"Error general al procesar la consulta: {ex}")
+            raise Exception(f"Error general al procesar la consulta: {ex}")
+
+    def execute_query_to_parquet(self, query, output_file, batch_size=None, compression=None, compression_level=None,
+                                 params=None):
+        """
+        Executes a query and saves the results to a Parquet file with typed, dictionary-encoded
+        columns. Every fetched batch becomes a row group, so memory is bounded by ``batch_size``.
+
+        :param query: SQL query to execute
+        :param output_file: Name of the Parquet file to save the results
+        :param batch_size: Rows per ``fetchmany`` and per row group, or an AdaptiveBatchSizer
+        :param compression: ``none``, ``gzip`` or ``zstd``; None uses snappy
+        :param compression_level: Compression level, or None for the codec default
+        :param params: Values for the ``?`` placeholders of the query
+        :return: Number of exported rows
+        """
+        return self._execute_query_to_columnar(query, output_file, "parquet", batch_size, compression, compression_level,
+                                               params)
+
+    def execute_query_to_arrow(self, query, output_file, batch_size=None, compression=None, compression_level=None,
+                               params=None):
+        """
+        Executes a query and saves the results to an Arrow IPC file, one record batch per fetch.
+
+        :param query: SQL query to execute
+        :param output_file: Name of the Arrow file to save the results
+        :param batch_size: Rows per ``fetchmany`` and per record batch, or an AdaptiveBatchSizer
+        :param compression: ``none`` or ``zstd`` (``gzip`` falls back to zstd)
+        :param compression_level: Compression level, or None for the codec default
+        :param params: Values for the ``?`` placeholders of the query
+        :return: Number of exported rows
+        """
+        return self._execute_query_to_columnar(query, output_file, "arrow", batch_size, compression, compression_level,
+                                               params)
+
+    def _execute_query_to_columnar(self, query, output_file, output_format, batch_size, compression, compression_level,
+                                   params=None):
+        try:
+            start_time = time.time()
+            if not self.connection:
+                raise FirebirdConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            logging.info(f"Ejecutando consulta: {query}")
+            self.timings = {"execute": 0.0, "fetch": 0.0, "write": 0.0}
+            stage_start = time.perf_counter()
+            self._execute(cursor, query, params)
+            self.timings["execute"] = time.perf_counter() - stage_start
+            blob_encoder = BlobEncoder()
+            self._stream_large_blobs(cursor, blob_encoder)
+            blob_columns = [index for index, desc in enumerate(cursor.description) if is_blob(desc)]
+
+            with ArrowWriter(output_file, cursor.description, output_format, compression, compression_level) as writer:
+                while True:
+                    rows = self._fetch_batch(cursor, batch_size or DEFAULT_BATCH_SIZE, self.timings)
+                    if not rows:
+                        break
+                    stage_start = time.perf_counter()
+                    if blob_columns:
+                        # Parquet y Arrow necesitan cada valor completo: los BLOB grandes se leen de uno en uno
+                        rows = blob_encoder.materialize(rows, blob_columns)
+                    writer.write_batch(rows)
+                    self.timings["write"] += time.perf_counter() - stage_start
+            num_rows = writer.rows
+
+            elapsed_time = time.time() - start_time
+            logging.info(
+                f"Consulta ejecutada y resultados guardados en {output_file} ({output_format}) en {elapsed_time:.2f} segundos. Filas exportadas: {num_rows}")
+
+            cursor.close()
+            return num_rows
         except FirebirdConnectionError as e:
             traceback.print_exc()
             logging.error(f"Error de conexión: {e}")
@@ -93,6 +281,221 @@ class FirebirdHandler:
             logging.error(f"Error general al procesar la consulta: {ex}")
             raise Exception(f"Error general al procesar la consulta: {ex}")
 
+    def execute_fetchone(self, query, params=None):
+        """
+        Executes a query and returns its first row, such as the result of an aggregate.
+
+        :param query: SQL query to execute
+        :param params: Values for the ``?`` placeholders of the query
+        :return: Tuple with the first row, or None if there are no rows
+        """
+        try:
+            if not self.connection:
+                raise FirebirdConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            logging.info(f"Ejecutando consulta: {query}")
+            self._execute(cursor, query, params)
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+        except FirebirdConnectionError as e:
+            logging.error(f"Error de conexión: {e}")
+            raise
+        except fdb.DatabaseError as e:
+            traceback.print_exc()
+            logging.error(f"Error al ejecutar la consulta: {e}")
+            raise FirebirdQueryError(f"Error al ejecutar la consulta: {e}")
+
+    def execute_scalar(self, query, params=None):
+        """
+        Executes a query that returns a single value.
+
+        :param query: SQL query to execute
+        :param params: Values for the ``?`` placeholders of the query
+        :return: First column of the first row, or None if there are no rows
+        """
+        row = self.execute_fetchone(query, params)
+        return row[0] if row else None
+
+    def execute_query_batches(self, query, batch_size, params=None, blob_encoder=None):
+        """
+        Executes a query and returns its column names and a generator of ``fetchmany`` batches.
+
+        The query runs immediately; rows are fetched lazily as the generator is consumed and the
+        cursor is closed once it is exhausted or closed. BLOBs that fdb returns as BlobReader are
+        read while fetching, so the batches can be consumed from another thread.
+
+        :param query: SQL query to execute
+        :param batch_size: Number of rows fetched per round trip, or an AdaptiveBatchSizer
+        :param params: Values for the ``?`` placeholders of the query
+        :param blob_encoder: BlobEncoder whose ``stream_threshold`` applies to the BLOB columns
+        :return: Tuple ``(description, batches)`` where ``description`` is the cursor description
+        """
+        try:
+            if not self.connection:
+                raise FirebirdConnectionError("No connection established with the database.")
+
+            cursor = self.connection.cursor()
+            logging.info(f"Ejecutando consulta: {query}")
+            self.timings = {"execute": 0.0, "fetch": 0.0}
+            stage_start = time.perf_counter()
+            self._execute(cursor, query, params)
+            self.timings["execute"] = time.perf_counter() - stage_start
+            blob_encoder = blob_encoder or BlobEncoder()
+            self._stream_large_blobs(cursor, blob_encoder)
+            description = cursor.description
+        except FirebirdConnectionError as e:
+            logging.error(f"Error de conexión: {e}")
+            raise
+        except fdb.DatabaseError as e:
+            traceback.print_exc()
+            logging.error(f"Error al ejecutar la consulta: {e}")
+            raise FirebirdQueryError(f"Error al ejecutar la consulta: {e}")
+
+        timings = self.timings
+        blob_columns = [index for index, desc in enumerate(description) if is_blob(desc)]
+
+        def batches():
+            try:
+                while True:
+                    rows = FirebirdHandler._fetch_batch(cursor, batch_size, timings)
+                    if not rows:
+                        break
+                    yield blob_encoder.materialize(rows, blob_columns) if blob_columns else rows
+            except fdb.DatabaseError as e:
+                logging.error(f"Error al leer los resultados: {e}")
+                raise FirebirdQueryError(f"Error al leer los resultados: {e}")
+            finally:
+                cursor.close()
+
+        return description, batches()
+
+    @staticmethod
+    def _execute(cursor, query, params=None):
+        # Sin parámetros se llama igual que antes, para no cambiar el comportamiento de fdb
+        if params is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, params)
+
+    @staticmethod
+    def _stream_large_blobs(cursor, blob_encoder):
+        # fdb devuelve como BlobReader los BLOB mayores que el umbral en lugar de cargarlos en memoria
+        if any(is_blob(desc) for desc in cursor.description or ()):
+            cursor.set_stream_blob_treshold(blob_encoder.stream_threshold)
+
+    @staticmethod
+    def _fetch_batch(cursor, batch_size, timings):
+        """
+        Fetches the next batch of an executed cursor and adds the time spent to ``timings["fetch"]``.
+
+        :param batch_size: Number of rows, or an AdaptiveBatchSizer that chooses it and learns from the fetch
+        :return: The fetched rows; an empty list when the cursor is exhausted
+        """
+        if isinstance(batch_size, AdaptiveBatchSizer):
+            return batch_size.fetch(cursor, timings)
+        stage_start = time.perf_counter()
+        rows = cursor.fetchmany(batch_size)
+        timings["fetch"] = timings.get("fetch", 0.0) + time.perf_counter() - stage_start
+        return rows
+
+    @staticmethod
+    def _write_csv_parts(cursor, part_writer, batch_size, timings):
+        """
+        Writes the rows of an executed cursor to the part files of ``part_writer``.
+
+        :return: List of the written parts
+        """
+        try:
+            while True:
+                rows = FirebirdHandler._fetch_batch(cursor, batch_size, timings)
+                if not rows:
+                    break
+                stage_start = time.perf_counter()
+                part_writer.write_rows(rows)
+                timings["write"] = timings.get("write", 0.0) + time.perf_counter() - stage_start
+            return part_writer.close()
+        except Exception:
+            part_writer.discard()
+            raise
+
+    @staticmethod
+    def _write_csv_in_batches(cursor, encoder, output_file, batch_size, codec="none", codec_level=None,
+                              include_header=True, timings=None):
+        """
+        Writes the rows of an executed cursor to a CSV file, one ``fetchmany`` batch at a time.
+
+        The output is the same as writing the whole result set with ``DataFrame.to_csv``. pandas
+        chooses the format of integer and timestamp columns from all their values (see
+        ``ColumnFormats``), so those columns keep one format across batches. When a later batch widens
+        a column, for example the first NULL of an integer column, the rows already written are
+        rewritten once at the end, one row at a time.
+
+        :param cursor: Cursor on which the query has already been executed
+        :param encoder: CSVEncoder built from the cursor description
+        :param output_file: Name of the CSV file to save the results
+        :param batch_size: Number of rows fetched per round trip, or an AdaptiveBatchSizer
+        :param codec: Output compression, applied to each batch as it is written
+        :param codec_level: Compression level, or None for the codec default
+        :param include_header: Whether to write the header line
+        :param timings: Dictionary whose ``fetch`` and ``write`` entries accumulate the time spent
+        :return: Tuple ``(rows, content_hash)`` with the number of exported rows and the SHA-256 of the
+            file on disk, taken while it is written or, if it had to be rewritten, while it is rewritten
+        """
+        timings = timings if timings is not None else {}
+        num_rows = 0
+        reformat = False
+        output, hashing_writer = open_hashed_output(output_file, codec, codec_level)
+        with io.TextIOWrapper(output, encoding='utf-8', newline='') as csv_file:
+            csv_writer = encoder.writer(csv_file)
+            # La cabecera se escribe aunque la consulta no devuelva filas, igual que con fetchall
+            if include_header:
+                encoder.write_header(csv_writer)
+            while True:
+                rows = FirebirdHandler._fetch_batch(cursor, batch_size, timings)
+                if not rows:
+                    break
+                stage_start = time.perf_counter()
+                # Si el formato de una columna se ensancha, las filas ya escritas se reescriben al final
+                reformat = encoder.observe(rows) and num_rows > 0 or reformat
+                encoder.write_rows(csv_writer, rows, csv_file)
+                timings["write"] = timings.get("write", 0.0) + time.perf_counter() - stage_start
+                num_rows += len(rows)
+                logging.debug(f"Lote de {len(rows)} filas escrito en {output_file}. Total: {num_rows}")
+        content_hash = hashing_writer.hasher.hexdigest()
+        if reformat:
+            stage_start = time.perf_counter()
+            content_hash = FirebirdHandler.reformat_csv(output_file, encoder.formats, codec, codec_level, include_header)
+            timings["write"] = timings.get("write", 0.0) + time.perf_counter() - stage_start
+        return num_rows, content_hash
+
+    @staticmethod
+    def reformat_csv(output_file, formats, codec="none", codec_level=None, has_header=True):
+        """
+        Rewrites a CSV written in batches, or one part of a partitioned export, with the final
+        column formats.
+
+        :param output_file: Name of the CSV file
+        :param formats: ColumnFormats that saw every row of the file
+        :param codec: Compression of the file, kept in the rewritten one
+        :param codec_level: Compression level, or None for the codec default
+        :param has_header: Whether the file starts with the header line
+        :return: SHA-256 of the rewritten file
+        """
+        tmp_file = f"{output_file}.tmp"
+        try:
+            with io.TextIOWrapper(open_input(output_file, codec), encoding='utf-8', newline='') as source:
+                output, hashing_writer = open_hashed_output(tmp_file, codec, codec_level)
+                with io.TextIOWrapper(output, encoding='utf-8', newline='') as target:
+                    formats.reformat(source, target, has_header)
+            os.replace(tmp_file, output_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        logging.info(f"{output_file} reescrito con el formato final de sus columnas.")
+        return hashing_writer.hasher.hexdigest()
+
     def insert_task(self, task_name, query, output_file, remote_path, sftp_host, sftp_user, cron_expression):
         """
         Inserts a scheduled task into the database.
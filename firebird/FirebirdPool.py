@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+import fdb
+
+from firebird.FirebirdHandler import FirebirdHandler
+from utils.errors import FirebirdConnectionError
+
+
+class FirebirdPool:
+    """
+    Thread-safe pool of connected FirebirdHandler instances shared by the scheduled jobs.
+    """
+
+    def __init__(self, host, port, database, user, password, max_size=5, idle_timeout=300,
+                 acquire_timeout=60, connect_retries=2):
+        """
+        Initializes the pool. Connections are opened lazily, on the first borrow that needs them.
+
+        :param host: Firebird server address
+        :param port: Firebird server port
+        :param database: Full path to the database
+        :param user: Database user
+        :param password: Database password
+        :param max_size: Maximum number of open connections (idle plus borrowed)
+        :param idle_timeout: Seconds an idle connection is kept before it is closed
+        :param acquire_timeout: Seconds to wait for a free connection before giving up
+        :param connect_retries: Extra connection attempts after a FirebirdConnectionError
+        """
+        self.config = {
+            "host": host,
+            "port": port,
+            "database": database,
+            "user": user,
+            "password": password
+        }
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.connect_retries = connect_retries
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (handler, last_used), el más reciente a la derecha
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self._inherited = []
+
+        # Un proceso hijo creado con fork no debe usar las conexiones ni el lock del padre
+        reset_after_fork = weakref.WeakMethod(self._reset_after_fork)
+        os.register_at_fork(after_in_child=lambda: reset_after_fork() and reset_after_fork()())
+
+    def _reset_after_fork(self):
+        # Las conexiones heredadas son del padre: se guardan sin usarlas, porque cerrarlas lo desconectaría a él
+        self._inherited.extend(handler for handler, _ in self._idle)
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def acquire(self):
+        """
+        Borrows a connected handler, reusing an idle one when possible.
+
+        Idle connections are health-checked before being handed out and transparently replaced
+        if the server dropped them.
+
+        :return: A connected FirebirdHandler
+        """
+        start_time = time.monotonic()
+        waited = False
+        with self._lock:
+            self._evict_idle_locked()
+            while not self._idle and self._size >= self.max_size:
+                remaining = self.acquire_timeout - (time.monotonic() - start_time)
+                if remaining <= 0:
+                    raise FirebirdConnectionError(
+                        f"Timed out after {self.acquire_timeout}s waiting for a Firebird connection.")
+                waited = True
+                self._lock.wait(remaining)
+
+            if waited:
+                self.waits += 1
+                self.wait_time += time.monotonic() - start_time
+
+            if self._idle:
+                handler, _ = self._idle.pop()
+                reused = True
+            else:
+                handler = None
+                reused = False
+                # Se reserva el hueco antes de conectar para no superar max_size
+                self._size += 1
+
+        try:
+            if reused and handler.ping():
+                with self._lock:
+                    self.hits += 1
+                return handler
+
+            if reused:
+                logging.info("Pooled Firebird connection is dead. Reconnecting.")
+                self._close_quietly(handler)
+                with self._lock:
+                    self.reconnects += 1
+
+            with self._lock:
+                self.misses += 1
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, handler, discard=False):
+        """
+        Returns a borrowed handler to the pool.
+
+        :param handler: Handler obtained from ``acquire``
+        :param discard: Close the connection instead of keeping it, e.g. after a connection error
+        """
+        if not discard:
+            try:
+                # Termina la transacción abierta para que el siguiente uso vea datos actuales
+                handler.connection.rollback()
+            except (fdb.DatabaseError, AttributeError) as e:
+                logging.warning(f"Discarding Firebird connection that failed to roll back: {e}")
+                discard = True
+
+        with self._lock:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((handler, time.monotonic()))
+            self._lock.notify()
+
+        if discard:
+            self._close_quietly(handler)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that borrows a handler and returns it to the pool afterwards.
+
+        A FirebirdConnectionError raised inside the block discards the connection, so the next
+        borrower gets a fresh one.
+        """
+        handler = self.acquire()
+        discard = False
+        try:
+            yield handler
+        except FirebirdConnectionError:
+            discard = True
+            raise
+        finally:
+            self.release(handler, discard=discard)
+
+    def evict_idle(self):
+        """
+        Closes connections that have been idle for longer than ``idle_timeout``.
+        """
+        with self._lock:
+            self._evict_idle_locked()
+
+    def stats(self):
+        """
+        Returns the pool metrics.
+
+        :return: Dictionary with pool size, hits, misses, waits and accumulated wait time
+        """
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reconnects": self.reconnects,
+                "evictions": self.evictions,
+                "waits": self.waits,
+                "wait_time": self.wait_time
+            }
+
+    def close(self):
+        """
+        Closes every idle connection. Borrowed connections are closed when released.
+        """
+        with self._lock:
+            idle = [handler for handler, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for handler in idle:
+            self._close_quietly(handler)
+        logging.info("Firebird connection pool closed.")
+
+    def _connect(self):
+        attempt = 0
+        while True:
+            handler = FirebirdHandler(**self.config)
+            try:
+                handler.connect()
+                return handler
+            except FirebirdConnectionError:
+                if attempt >= self.connect_retries:
+                    raise
+                attempt += 1
+                logging.warning(f"Retrying Firebird connection ({attempt}/{self.connect_retries}).")
+                time.sleep(min(2 ** attempt, 10))
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        # Los más antiguos están a la izquierda
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            handler, _ = self._idle.popleft()
+            self._size -= 1
+            self.evictions += 1
+            self._close_quietly(handler)
+            self._lock.notify()
+
+    @staticmethod
+    def _close_quietly(handler):
+        try:
+            handler.close()
+        except Exception as e:
+            logging.warning(f"Error closing Firebird connection: {e}")
@@ -0,0 +1,213 @@
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Literales entre comillas simples e identificadores entre comillas dobles, que no se normalizan
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(query):
+    """
+    Normalizes a query so equivalent spellings share a cache entry: whitespace is collapsed,
+    unquoted text is upper-cased (Firebird identifiers and keywords are case-insensitive) and a
+    trailing semicolon is dropped. Quoted literals and identifiers are kept as they are.
+    """
+    parts = _QUOTED.split(query.strip().rstrip(";").strip())
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r"\s+", " ", parts[index]).upper()
+    return "".join(parts)
+
+
+class QueryResultCache:
+    """
+    On-disk cache of exported query results, shared by the tasks that run the same SQL.
+
+    An entry is reused while it is younger than ``ttl``. The first task that misses runs the query
+    while later tasks with the same key wait on a per-key lock and then reuse its file. When the
+    cache grows beyond ``max_bytes`` the least recently used entries are deleted.
+
+    The locks and the entry index live in memory, so concurrent runs are only shared between the
+    threads of one process.
+    """
+
+    def __init__(self, cache_dir, ttl=300, max_bytes=1024 * 1024 * 1024):
+        """
+        Initializes the cache, picking up the files left in ``cache_dir`` by a previous run.
+
+        :param cache_dir: Directory where cached results are stored
+        :param ttl: Seconds a result is considered fresh
+        :param max_bytes: Maximum total size of the cached files
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, tareas que la esperan o la tienen]
+        self._entries = OrderedDict()  # key -> (path, created, size), el más reciente al final
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Un proceso hijo creado con fork no debe heredar los locks del padre, que pueden estar tomados
+        reset_after_fork = weakref.WeakMethod(self._reset_after_fork)
+        os.register_at_fork(after_in_child=lambda: reset_after_fork() and reset_after_fork()())
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(query, output_format="csv", codec="none", codec_level=None):
+        """
+        :return: Cache key of a query exported with the given format and compression
+        """
+        signature = "\0".join([normalize_sql(query), output_format, codec or "none", str(codec_level)])
+        return hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+    def fetch(self, key, output_file, produce):
+        """
+        Places a fresh result for ``key`` at ``output_file``, running ``produce`` only on a miss.
+
+        :param key: Key returned by ``make_key``
+        :param output_file: Path where the task expects its file
+        :param produce: Callable that writes the result to the path it receives
+        :return: True on a cache hit, False if the query was run
+        """
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                fresh = entry is not None and time.time() - entry[1] <= self.ttl and os.path.exists(entry[0])
+                if fresh:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+            if fresh:
+                logging.info(f"Query result cache hit for {output_file} (entry {key[:12]}).")
+                self._materialize(entry[0], output_file)
+                return True
+
+            cached_path = os.path.join(self.cache_dir, key + self._extension(output_file))
+            tmp_path = f"{cached_path}.{threading.get_ident()}.tmp"
+            try:
+                produce(tmp_path)
+                os.replace(tmp_path, cached_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            with self._lock:
+                self._entries[key] = (cached_path, time.time(), os.path.getsize(cached_path))
+                self._entries.move_to_end(key)
+            self._materialize(cached_path, output_file)
+
+        with self._lock:
+            self._evict_locked()
+        return False
+
+    def evict_expired(self):
+        """
+        Deletes the entries that are no longer fresh and any excess over ``max_bytes``.
+        """
+        with self._lock:
+            now = time.time()
+            for key, (_, created, _) in list(self._entries.items()):
+                if now - created > self.ttl and not self._in_use(key):
+                    self._remove_locked(key)
+            self._evict_locked()
+
+    def stats(self):
+        """
+        Returns the cache metrics.
+
+        :return: Dictionary with entries, cached bytes, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(size for _, _, size in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    @contextlib.contextmanager
+    def _key_lock(self, key):
+        # El lock de una clave se borra cuando ninguna tarea lo tiene ni lo espera
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[key]
+
+    def _in_use(self, key):
+        return key in self._key_locks
+
+    def _evict_locked(self):
+        total = sum(size for _, _, size in self._entries.values())
+        # Los menos usados están al principio
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if self._in_use(key):
+                continue
+            total -= self._entries[key][2]
+            self._remove_locked(key)
+
+    def _remove_locked(self, key):
+        path, _, _ = self._entries.pop(key)
+        self.evictions += 1
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not delete cached result {path}: {e}")
+
+    def _load_existing(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name.split(".", 1)[0], path, stat.st_size))
+        for created, key, path, size in sorted(files):
+            self._entries[key] = (path, created, size)
+
+    @staticmethod
+    def _extension(output_file):
+        # Conserva extensiones compuestas como .csv.gz
+        name = os.path.basename(output_file)
+        return name[name.index("."):] if "." in name else ""
+
+    @staticmethod
+    def _materialize(cached_path, output_file):
+        # Enlace duro cuando el sistema de archivos lo permite; si no, copia
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        try:
+            os.link(cached_path, output_file)
+        except OSError:
+            shutil.copyfile(cached_path, output_file)
@@ -1,170 +1,86 @@
 import logging
 import os
+import queue
 import re
+import threading
 import tkinter as tk
-import traceback
 from tkinter import messagebox
 from tkinter import ttk
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from dotenv import load_dotenv
-
-from db.SQLiteHandler import SQLiteHandler
-from firebird.FirebirdHandler import FirebirdHandler
-from sftp.SFTPHandler import SFTPHandler
-from utils.Logger import Logger
-
-Logger.setup_logging()
-# Load environment variables
-load_dotenv()
-
-# Firebird configuration
-firebird_config = {
-    "host": os.getenv("FIREBIRD_HOST"),
-    "port": int(os.getenv("FIREBIRD_PORT")),
-    "database": os.getenv("FIREBIRD_DATABASE"),
-    "user": os.getenv("FIREBIRD_USER"),
-    "password": os.getenv("FIREBIRD_PASSWORD")
-}
-
-database_path = "scheduled_tasks.db"
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-
-def save_task_to_db(task_details):
-    try:
-        db_handler = SQLiteHandler(database_path)
-        db_handler.connect()
-        task_id = db_handler.insert_task(
-            task_name=task_details["name"],
-            query=task_details["query"],
-            output_file=task_details["output_file"],
-            remote_path=task_details["remote_path"],
-            sftp_host=task_details["sftp_host"],
-            sftp_user=task_details["sftp_user"],
-            sftp_password=task_details["sftp_password"],
-            cron_expression=task_details["cron_expression"]
-        )
-        db_handler.close()
-
-        logging.info(f"Task '{task_details.get('task_name')}' inserted into database. Scheduling it now.")
-        task_details["id"] = task_id  # Asignar el ID generado por la base de datos
-        schedule_task(task_details)
-    except Exception as e:
-        traceback.print_exc()
-        logging.error(f"Error saving task to database: {e}")
-        raise
-
-def fetch_tasks_from_db():
-    try:
-        db_handler = SQLiteHandler(database_path)
-        db_handler.connect()
-        tasks = db_handler.get_tasks()
-        db_handler.close()
-        return tasks
-    except Exception as e:
-        logging.error(f"Error fetching tasks from database: {e}")
-        return []
-
-def job(task_id, task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_pass):
-    """
-    Job to run the process of fetching data, saving to a file, and uploading it.
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+
+from service import (
+    EXECUTORS,
+    OUTPUT_FORMATS,
+    fetch_tasks_from_db,
+    fetch_tasks_version,
+    metadata_store,
+    parse_destinations,
+    save_task_to_db,
+    scheduler,
+    start_scheduler,
+    stop_scheduler
+)
+from utils.compression import CODECS
+
+# Milliseconds between checks of the task list for changes (0 disables the automatic refresh)
+gui_refresh_interval = int(os.getenv("GUI_REFRESH_INTERVAL", 2000))
+# Treeview rows inserted, updated or deleted per step, so a large refresh does not freeze the window
+gui_rows_per_step = 500
+
+
+class DatabaseWorker:
     """
-    sftp_config = {
-        "host": sftp_host,
-        "username": sftp_user,
-        "password": sftp_pass,
-        "port": int(os.getenv("SFTP_PORT", 22))
-    }
+    Runs database calls on a background thread and hands their results back to the Tk main loop.
 
-    db_handler = FirebirdHandler(**firebird_config)
-    sftp_handler = SFTPHandler(**sftp_config)
-    sqlite_handler = SQLiteHandler(database_path)
-
-    try:
-        logging.info(f"Starting task {task_name} (ID: {task_id})")
-        db_handler.connect()
-        db_handler.execute_query_to_csv(query, output_file)
-        sftp_handler.connect()
-        sftp_handler.upload_file(output_file, remote_path)
-
-        # Update task status to "completed" on success
-        sqlite_handler.connect()
-        sqlite_handler.update_task_status(task_id, "completed")
-        logging.info(f"Task {task_name} executed successfully.")
-    except Exception as e:
-        # Update task status to "error" on failure
-        sqlite_handler.connect()
-        sqlite_handler.update_task_status(task_id, "error")
-        logging.error(f"Error executing task {task_name}: {e}")
-    finally:
-        db_handler.close()
-        sftp_handler.close_connection()
-        sqlite_handler.close()
-
-def schedule_task(task):
-    """
-    Schedule a task based on its cron expression, if not already scheduled.
+    Tk widgets may only be used from the main thread, so results are queued and delivered by a
+    callback polled with ``after``.
     """
-    logging.info(f"Attempting to schedule task: {task}")
-    cron_expression = task.get("cron_expression")
-    if cron_expression:
-        if scheduler.get_job(str(task["id"])):
-            logging.info(f"Task {task['task_name']} (ID: {task['id']}) is already scheduled. Skipping.")
-            return
 
-        try:
-            logging.info(f"Parsing cron expression: {cron_expression}")
-            cron_parts = cron_expression.split()
-            logging.info(f"Cron parts: {cron_parts}")
-
-            scheduler.add_job(
-                job,
-                trigger=CronTrigger(
-                    minute=cron_parts[0],
-                    hour=cron_parts[1],
-                    day=cron_parts[2],
-                    month=cron_parts[3],
-                    day_of_week=cron_parts[4]
-                ),
-                args=[
-                    task.get("id"),
-                    task.get("task_name"),
-                    task.get("query"),
-                    task.get("output_file"),
-                    task.get("remote_path"),
-                    task.get("sftp_host"),
-                    task.get("sftp_user"),
-                    task.get("sftp_password")
-                ],
-                id=str(task["id"]),
-                name=task.get("task_name"),
-                replace_existing=True
-            )
-            logging.info(f"Task {task.get('task_name')} scheduled successfully.")
-        except Exception as e:
-            traceback.print_exc()
-            logging.error(f"Error scheduling task {task.get('task_name')}: {e}")
-    else:
-        logging.info("No cron expression provided; skipping task scheduling.")
-
-
-def load_and_schedule_tasks():
-    """
-    Load tasks from the database and schedule only those that are not completed.
-    """
-    logging.info("Fetching tasks from the database to schedule them.")
-    tasks = fetch_tasks_from_db()
-    logging.info(f"Fetched {len(tasks)} tasks from the database.")
-
-    pending_tasks = [task for task in tasks if task.get("status") != "completed"]
-
-    logging.info(f"Scheduling {len(pending_tasks)} pending tasks.")
-    for task in pending_tasks:
-        logging.info(f"Scheduling task: {task['task_name']} (ID: {task['id']})")
-        schedule_task(task)
-    logging.info("All pending tasks have been scheduled.")
+    def __init__(self, root, poll_interval=50):
+        """
+        :param root: Tk root window
+        :param poll_interval: Milliseconds between checks of the result queue
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="gui-database", daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, call, on_done=None, on_error=None):
+        """
+        Queues ``call`` for the background thread. ``on_done(result)`` or ``on_error(exception)`` then
+        runs on the Tk main thread. Safe to call from any thread.
+        """
+        self._requests.put((call, on_done, on_error))
+
+    def stop(self):
+        self._requests.put(None)
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            call, on_done, on_error = request
+            try:
+                self._results.put((on_done, call()))
+            except Exception as e:
+                logging.error(f"Error in background database call: {e}")
+                self._results.put((on_error, e))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if callback:
+                callback(value)
+        self.root.after(self.poll_interval, self._poll)
 
 
 def open_gui():
@@ -187,6 +103,28 @@ def open_gui():
             if not re.match(cron_regex, cron_expression):
                 errors.append("Invalid cron expression format.")
 
+        codec_level = codec_level_entry.get()
+        if codec_level and not codec_level.lstrip("-").isdigit():
+            errors.append("Compression level must be an integer.")
+
+        partitions = partitions_entry.get()
+        if partitions and (not partitions.isdigit() or int(partitions) < 1):
+            errors.append("Partitions must be a positive integer.")
+
+        watermark_column = watermark_column_entry.get().strip()
+        partition_column = partition_column_entry.get().strip()
+        if watermark_column and partition_column and watermark_column.upper() != partition_column.upper():
+            errors.append("An incremental task can only be partitioned by its watermark column.")
+
+        for label, entry in (("Part max rows", part_max_rows_entry), ("Part max MB", part_max_mb_entry)):
+            if entry.get() and (not entry.get().isdigit() or int(entry.get()) < 1):
+                errors.append(f"{label} must be a positive integer.")
+
+        try:
+            parse_destinations(destinations_text.get("1.0", "end-1c"))
+        except ValueError as e:
+            errors.append(str(e))
+
         return errors
 
     def start_job():
@@ -204,6 +142,16 @@ def open_gui():
             sftp_user = sftp_user_entry.get()
             sftp_pass = sftp_pass_entry.get()
             cron_expression = cron_entry.get()
+            executor = executor_combo.get()
+            watermark_column = watermark_column_entry.get().strip()
+            destinations = parse_destinations(destinations_text.get("1.0", "end-1c"))
+            partition_column = partition_column_entry.get().strip()
+            partitions = int(partitions_entry.get()) if partitions_entry.get() else 1
+            output_format = output_format_combo.get()
+            output_codec = output_codec_combo.get()
+            codec_level = int(codec_level_entry.get()) if codec_level_entry.get() else None
+            part_max_rows = int(part_max_rows_entry.get()) if part_max_rows_entry.get() else None
+            part_max_bytes = int(part_max_mb_entry.get()) * 1024 * 1024 if part_max_mb_entry.get() else None
 
             task_details = {
                 "name": task_name,
@@ -214,25 +162,92 @@ def open_gui():
                 "sftp_user": sftp_user,
                 "sftp_password": sftp_pass,
                 "cron_expression": cron_expression,
+                "output_format": output_format,
+                "executor": executor,
+                "watermark_column": watermark_column,
+                "destinations": destinations,
+                "partition_column": partition_column,
+                "partitions": partitions,
+                "part_max_rows": part_max_rows,
+                "part_max_bytes": part_max_bytes,
+                "force_upload": force_upload_var.get(),
+                "output_codec": output_codec,
+                "codec_level": codec_level,
                 "status": "Scheduled"
             }
 
-            save_task_to_db(task_details)
-            update_task_list()
-
-            messagebox.showinfo("Success", "Job scheduled successfully.")
+            schedule_button.config(state=tk.DISABLED)
+            database_worker.submit(lambda: save_task_to_db(task_details), on_task_saved, on_task_save_error)
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {e}")
 
+    def on_task_saved(task_id):
+        schedule_button.config(state=tk.NORMAL)
+        update_task_list()
+        messagebox.showinfo("Success", "Job scheduled successfully.")
+
+    def on_task_save_error(error):
+        schedule_button.config(state=tk.NORMAL)
+        messagebox.showerror("Error", f"An error occurred: {error}")
+
+    shown_tasks = {"version": None, "rows": {}, "loading": False}
+
+    def load_task_rows(shown_version):
+        # Se ejecuta en el hilo de base de datos: solo se lee la lista si la tabla cambió
+        version = fetch_tasks_version()
+        if version is not None and version == shown_version:
+            return None
+        tasks = fetch_tasks_from_db(columns=("id", "task_name", "status"))
+        return version, {str(task["id"]): (task["id"], task["task_name"], task["status"]) for task in tasks}
+
     def update_task_list():
-        tasks = fetch_tasks_from_db()
-        for row in task_list.get_children():
-            task_list.delete(row)
-        for task in tasks:
-            task_list.insert("", "end", values=(task.get("id"), task.get("task_name"), task.get("status")))
+        if shown_tasks["loading"]:
+            return
+        shown_tasks["loading"] = True
+        version = shown_tasks["version"]
+        database_worker.submit(lambda: load_task_rows(version), apply_task_rows, lambda error: finish_loading())
+
+    def apply_task_rows(result):
+        if result is None:
+            finish_loading()
+            return
+        version, rows = result
+        shown_rows = shown_tasks["rows"]
+        # Solo se tocan las filas insertadas, modificadas o eliminadas, por tramos
+        changes = [("delete", row_id, None) for row_id in shown_rows.keys() - rows.keys()]
+        changes += [("insert" if row_id not in shown_rows else "update", row_id, values)
+                    for row_id, values in rows.items() if shown_rows.get(row_id) != values]
+        apply_changes(changes, 0, version, rows)
+
+    def apply_changes(changes, start, version, rows):
+        for action, row_id, values in changes[start:start + gui_rows_per_step]:
+            if action == "delete":
+                task_list.delete(row_id)
+            elif action == "insert":
+                task_list.insert("", "end", iid=row_id, values=values)
+            else:
+                task_list.item(row_id, values=values)
+        if start + gui_rows_per_step < len(changes):
+            root.after(1, apply_changes, changes, start + gui_rows_per_step, version, rows)
+            return
+        shown_tasks["version"], shown_tasks["rows"] = version, rows
+        finish_loading()
+
+    def finish_loading():
+        shown_tasks["loading"] = False
+
+    def auto_refresh():
+        update_task_list()
+        root.after(gui_refresh_interval, auto_refresh)
+
+    def on_job_finished(event):
+        # Lo llama el planificador desde su hilo: se escriben los estados pendientes y se refresca la lista
+        if event.job_id.isdigit():
+            database_worker.submit(metadata_store.flush, lambda _: update_task_list())
 
     root = tk.Tk()
     root.title("Scheduled Tasks Manager")
+    database_worker = DatabaseWorker(root)
 
     # Task configuration frame
     config_frame = tk.Frame(root)
@@ -270,7 +285,55 @@ def open_gui():
     cron_entry = tk.Entry(config_frame, width=50)
     cron_entry.grid(row=7, column=1, padx=10, pady=5)
 
-    tk.Button(config_frame, text="Schedule Task", command=start_job).grid(row=8, column=0, columnspan=2, pady=10)
+    tk.Label(config_frame, text="Format / Compression:").grid(row=8, column=0, padx=10, pady=5)
+    codec_frame = tk.Frame(config_frame)
+    codec_frame.grid(row=8, column=1, padx=10, pady=5, sticky="w")
+    output_format_combo = ttk.Combobox(codec_frame, values=OUTPUT_FORMATS, state="readonly", width=10)
+    output_format_combo.set("csv")
+    output_format_combo.pack(side=tk.LEFT, padx=(0, 5))
+    output_codec_combo = ttk.Combobox(codec_frame, values=CODECS, state="readonly", width=10)
+    output_codec_combo.set("none")
+    output_codec_combo.pack(side=tk.LEFT)
+    tk.Label(codec_frame, text="Level:").pack(side=tk.LEFT, padx=(10, 5))
+    codec_level_entry = tk.Entry(codec_frame, width=5)
+    codec_level_entry.pack(side=tk.LEFT)
+
+    tk.Label(config_frame, text="Executor:").grid(row=9, column=0, padx=10, pady=5)
+    executor_combo = ttk.Combobox(config_frame, values=EXECUTORS, state="readonly", width=12)
+    executor_combo.set("default")
+    executor_combo.grid(row=9, column=1, padx=10, pady=5, sticky="w")
+
+    tk.Label(config_frame, text="Watermark Column:").grid(row=10, column=0, padx=10, pady=5)
+    watermark_column_entry = tk.Entry(config_frame, width=50)
+    watermark_column_entry.grid(row=10, column=1, padx=10, pady=5)
+
+    tk.Label(config_frame, text="Extra Destinations:").grid(row=11, column=0, padx=10, pady=5)
+    destinations_text = tk.Text(config_frame, height=3, width=50)
+    destinations_text.grid(row=11, column=1, padx=10, pady=5)
+
+    tk.Label(config_frame, text="Partition Column / Ranges:").grid(row=12, column=0, padx=10, pady=5)
+    partition_frame = tk.Frame(config_frame)
+    partition_frame.grid(row=12, column=1, padx=10, pady=5, sticky="w")
+    partition_column_entry = tk.Entry(partition_frame, width=30)
+    partition_column_entry.pack(side=tk.LEFT, padx=(0, 5))
+    partitions_entry = tk.Entry(partition_frame, width=5)
+    partitions_entry.insert(0, "1")
+    partitions_entry.pack(side=tk.LEFT)
+
+    tk.Label(config_frame, text="Part Max Rows / MB:").grid(row=13, column=0, padx=10, pady=5)
+    part_frame = tk.Frame(config_frame)
+    part_frame.grid(row=13, column=1, padx=10, pady=5, sticky="w")
+    part_max_rows_entry = tk.Entry(part_frame, width=12)
+    part_max_rows_entry.pack(side=tk.LEFT, padx=(0, 5))
+    part_max_mb_entry = tk.Entry(part_frame, width=8)
+    part_max_mb_entry.pack(side=tk.LEFT)
+
+    force_upload_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(config_frame, text="Upload even if the output did not change",
+                   variable=force_upload_var).grid(row=14, column=1, padx=10, pady=5, sticky="w")
+
+    schedule_button = tk.Button(config_frame, text="Schedule Task", command=start_job)
+    schedule_button.grid(row=15, column=0, columnspan=2, pady=10)
 
     # Task list frame
     list_frame = tk.Frame(root)
@@ -288,12 +351,21 @@ def open_gui():
     refresh_button = tk.Button(root, text="Refresh", command=update_task_list)
     refresh_button.pack(pady=10)
 
-    update_task_list()
+    scheduler.add_listener(on_job_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    if gui_refresh_interval:
+        auto_refresh()
+    else:
+        update_task_list()
 
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        scheduler.remove_listener(on_job_finished)
+        database_worker.stop()
 
 if __name__ == "__main__":
-    Logger.setup_logging()
-    load_and_schedule_tasks()
-    scheduler.start()
-    open_gui()
+    start_scheduler()
+    try:
+        open_gui()
+    finally:
+        stop_scheduler(wait=False)
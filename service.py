@@ -0,0 +1,994 @@
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+from contextlib import contextmanager
+
+from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from dotenv import load_dotenv
+
+from db.SQLiteHandler import SQLiteHandler
+from firebird.AdaptiveBatchSizer import AdaptiveBatchSizer
+from firebird.ArrowWriter import COLUMNAR_FORMATS, merge_files
+from firebird.BlobEncoder import BLOB_STREAM_THRESHOLD, BlobEncoder
+from firebird.ColumnFormats import ColumnFormats
+from firebird.CSVEncoder import CSVEncoder
+from firebird.CSVPartWriter import manifest_path, part_path, write_manifest
+from firebird.FirebirdHandler import DEFAULT_BATCH_SIZE, FirebirdHandler
+from firebird.FirebirdPool import FirebirdPool
+from firebird.QueryResultCache import QueryResultCache
+from sftp.SFTPSessionCache import SFTPSessionCache
+from utils.Logger import Logger
+from utils.compression import Compressor, with_extension
+from utils.concurrency import KeyedLimiter
+from utils.errors import FirebirdQueryError
+from utils.hashing import HashingWriter, file_sha256
+from utils.metrics import MetricsRegistry, RunMetrics, start_metrics_server
+from utils.partitioning import bounds_query, partition_query, partition_ranges
+from utils.pipeline import run_pipeline
+from utils.watermark import decode_watermark, delta_path, encode_watermark, incremental_query, max_watermark_query
+
+Logger.setup_logging()
+# Load environment variables
+load_dotenv()
+
+# Firebird configuration
+firebird_config = {
+    "host": os.getenv("FIREBIRD_HOST"),
+    "port": int(os.getenv("FIREBIRD_PORT")),
+    "database": os.getenv("FIREBIRD_DATABASE"),
+    "user": os.getenv("FIREBIRD_USER"),
+    "password": os.getenv("FIREBIRD_PASSWORD")
+}
+
+# Rows fetched per round trip when exporting; 0 keeps the fetchall path
+fetch_batch_size = int(os.getenv("FIREBIRD_FETCH_BATCH_SIZE", 0))
+# Batch size chosen per task from the observed row width and fetch time, starting from the size the
+# previous run learned (FIREBIRD_FETCH_BATCH_SIZE is the starting point of tasks that have none yet).
+# Off by default when FIREBIRD_FETCH_BATCH_SIZE is 0, so that value keeps meaning fetchall
+adaptive_fetch = (os.getenv("FIREBIRD_ADAPTIVE_FETCH", "true" if fetch_batch_size else "false").lower()
+                  in ("1", "true", "yes"))
+adaptive_fetch_min_rows = int(os.getenv("FIREBIRD_FETCH_MIN_ROWS", 500))
+adaptive_fetch_max_rows = int(os.getenv("FIREBIRD_FETCH_MAX_ROWS", 200000))
+adaptive_fetch_max_bytes = int(os.getenv("FIREBIRD_FETCH_MAX_MB", 64)) * 1024 * 1024
+adaptive_fetch_target_seconds = float(os.getenv("FIREBIRD_FETCH_TARGET_SECONDS", 0.5))
+# BLOB columns in CSV outputs: charset of their contents and encoding of binary BLOBs (none, base64, hex or text).
+# BLOBs over BLOB_STREAM_THRESHOLD bytes are copied to the file in chunks of BLOB_CHUNK_SIZE bytes
+blob_encoder = BlobEncoder(
+    binary_encoding=os.getenv("BLOB_BINARY_ENCODING", "none"),
+    charset=os.getenv("BLOB_CHARSET", "utf-8"),
+    chunk_size=int(os.getenv("BLOB_CHUNK_SIZE", 192 * 1024)),
+    stream_threshold=int(os.getenv("BLOB_STREAM_THRESHOLD", BLOB_STREAM_THRESHOLD))
+)
+# Finished part files of split outputs uploaded at the same time while the next parts are fetched
+part_upload_workers = int(os.getenv("PART_UPLOAD_WORKERS", 2))
+# Fetch, CSV encoding and SFTP upload run concurrently, without a local copy of the file
+pipelined_upload = os.getenv("PIPELINED_UPLOAD", "false").lower() in ("1", "true", "yes")
+pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+
+# Firebird connections shared by every scheduled job
+firebird_pool = FirebirdPool(
+    max_size=int(os.getenv("FIREBIRD_POOL_SIZE", 5)),
+    idle_timeout=int(os.getenv("FIREBIRD_POOL_IDLE_TIMEOUT", 300)),
+    acquire_timeout=int(os.getenv("FIREBIRD_POOL_TIMEOUT", 60)),
+    **firebird_config
+)
+
+# Authenticated SFTP sessions reused across runs; a size of 0 disables the cache
+sftp_session_cache_size = int(os.getenv("SFTP_SESSION_CACHE_SIZE", 10))
+sftp_session_cache = SFTPSessionCache(
+    max_sessions=sftp_session_cache_size,
+    idle_timeout=int(os.getenv("SFTP_SESSION_IDLE_TIMEOUT", 300)),
+    keepalive_interval=int(os.getenv("SFTP_KEEPALIVE_INTERVAL", 30))
+) if sftp_session_cache_size > 0 else None
+# Channels used to upload large files in parallel ranges; 1 keeps a single sftp.put
+sftp_upload_parallelism = int(os.getenv("SFTP_UPLOAD_PARALLELISM", 1))
+sftp_upload_chunk_size = int(os.getenv("SFTP_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+# Upload through a .part file with progress checkpoints in SQLite, resuming on the next run
+sftp_resumable_uploads = os.getenv("SFTP_RESUMABLE_UPLOADS", "false").lower() in ("1", "true", "yes")
+sftp_default_port = int(os.getenv("SFTP_PORT", 22))
+# Uploads to the destinations of a task run concurrently; each one is retried on its own
+fanout_max_workers = int(os.getenv("FANOUT_MAX_WORKERS", 5))
+upload_retries = int(os.getenv("SFTP_UPLOAD_RETRIES", 2))
+upload_retry_delay = int(os.getenv("SFTP_UPLOAD_RETRY_DELAY", 5))
+
+# Exported results reused by tasks with the same SQL within QUERY_CACHE_TTL seconds; 0 disables the cache
+query_cache_ttl = int(os.getenv("QUERY_CACHE_TTL", 0))
+query_result_cache = QueryResultCache(
+    cache_dir=os.getenv("QUERY_CACHE_DIR", "query_cache"),
+    ttl=query_cache_ttl,
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_MB", 1024)) * 1024 * 1024
+) if query_cache_ttl > 0 else None
+
+# Per-run metrics exposed in the Prometheus text format on METRICS_PORT; 0 disables the endpoint
+metrics_port = int(os.getenv("METRICS_PORT", 0))
+metrics_registry = MetricsRegistry()
+metrics_registry.register_stats("firebird_pool", firebird_pool.stats)
+if sftp_session_cache:
+    metrics_registry.register_stats("sftp_session_cache", sftp_session_cache.stats)
+if query_result_cache:
+    metrics_registry.register_stats("query_cache", query_result_cache.stats)
+
+# Tasks read per query when loading or listing them
+task_page_size = int(os.getenv("TASK_PAGE_SIZE", 1000))
+# Seconds between reloads of the task definitions edited in the database (0 disables the reload)
+task_reload_interval = int(os.getenv("TASK_RELOAD_INTERVAL", 30))
+# Last definition version applied to the scheduler
+task_definitions_version = 0
+
+# Run history kept in task_runs: days of retention and minimum runs kept per task (0 = keep everything)
+task_runs_retention_days = int(os.getenv("TASK_RUNS_RETENTION_DAYS", 90))
+task_runs_keep_last = int(os.getenv("TASK_RUNS_KEEP_LAST", 100))
+
+# Output formats a task can produce
+OUTPUT_FORMATS = ("csv",) + COLUMNAR_FORMATS
+
+# Uploads running at the same time against one SFTP host; 0 disables the cap.
+# Concurrency against Firebird is capped by FIREBIRD_POOL_SIZE. Both caps live in this process:
+# they bound the thread pool executor only. processpool workers are started with spawn, so each one
+# imports this module again and builds its own pool, session cache and limiter
+sftp_host_limiter = KeyedLimiter(int(os.getenv("SFTP_MAX_CONCURRENT_PER_HOST", 4)))
+
+# Executors a task can run on
+EXECUTORS = ("default", "processpool")
+
+database_path = "scheduled_tasks.db"
+# Conexión SQLite compartida por todos los hilos del proceso (modo WAL). Los estados de las tareas y el
+# historial de ejecuciones se acumulan y se escriben juntos cada SQLITE_FLUSH_INTERVAL segundos
+metadata_store = SQLiteHandler(
+    database_path,
+    synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", 30)),
+    flush_interval=float(os.getenv("SQLITE_FLUSH_INTERVAL", 1)) or None
+)
+# Initialize scheduler: a thread pool for I/O-bound tasks and a process pool for CPU-heavy encoding
+scheduler = BackgroundScheduler(
+    executors={
+        "default": ThreadPoolExecutor(int(os.getenv("SCHEDULER_THREAD_POOL_SIZE", 10))),
+        # spawn: con fork los procesos heredarían las conexiones Firebird, las sesiones SFTP y los locks del padre
+        "processpool": ProcessPoolExecutor(int(os.getenv("SCHEDULER_PROCESS_POOL_SIZE", 2)),
+                                           pool_kwargs={"mp_context": multiprocessing.get_context("spawn")})
+    },
+    job_defaults={
+        "coalesce": os.getenv("SCHEDULER_COALESCE", "true").lower() in ("1", "true", "yes"),
+        "misfire_grace_time": int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", 300)),
+        "max_instances": int(os.getenv("SCHEDULER_MAX_INSTANCES", 1))
+    }
+)
+# Random delay in seconds added to each cron firing to spread out co-scheduled tasks
+scheduler_jitter = int(os.getenv("SCHEDULER_JITTER", 0)) or None
+
+def save_task_to_db(task_details, schedule=True):
+    """
+    Stores a new task and its extra destinations.
+
+    :param schedule: Also schedule the task in this process. The CLI leaves it to the running
+        service, which picks new tasks up on its next reload.
+    :return: ID of the new task
+    """
+    try:
+        db_handler = metadata_store
+        db_handler.connect()
+        task_id = db_handler.insert_task(
+            task_name=task_details["name"],
+            query=task_details["query"],
+            output_file=task_details["output_file"],
+            remote_path=task_details["remote_path"],
+            sftp_host=task_details["sftp_host"],
+            sftp_user=task_details["sftp_user"],
+            sftp_password=task_details["sftp_password"],
+            cron_expression=task_details["cron_expression"],
+            output_codec=task_details.get("output_codec", "none"),
+            codec_level=task_details.get("codec_level"),
+            output_format=task_details.get("output_format", "csv"),
+            executor=task_details.get("executor", "default"),
+            watermark_column=task_details.get("watermark_column") or None,
+            partition_column=task_details.get("partition_column") or None,
+            partitions=task_details.get("partitions") or 1,
+            enabled=task_details.get("enabled", True),
+            part_max_rows=task_details.get("part_max_rows") or None,
+            part_max_bytes=task_details.get("part_max_bytes") or None,
+            force_upload=task_details.get("force_upload", False)
+        )
+        for destination in task_details.get("destinations", []):
+            db_handler.add_destination(task_id, **destination)
+
+        logging.info(f"Task '{task_details.get('name')}' inserted into database.")
+        task_details["id"] = task_id  # Asignar el ID generado por la base de datos
+        if schedule and task_details.get("enabled", True):
+            schedule_task(task_details)
+        return task_id
+    except Exception as e:
+        traceback.print_exc()
+        logging.error(f"Error saving task to database: {e}")
+        raise
+
+def parse_destinations(text):
+    """
+    Parses the extra destinations typed in the GUI, one ``host,user,password,remote_path`` per line.
+    The host may carry a port as ``host:port``.
+
+    :return: List of destination dictionaries
+    :raises ValueError: If a line does not have the four fields
+    """
+    destinations = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        fields = [field.strip() for field in line.split(",", 3)]
+        if len(fields) != 4 or not fields[0] or not fields[3]:
+            raise ValueError(f"Destination line {line_number} must be: host,user,password,remote_path")
+        host, _, port = fields[0].partition(":")
+        if port and not port.isdigit():
+            raise ValueError(f"Destination line {line_number} has an invalid port.")
+        destinations.append({
+            "sftp_host": host,
+            "sftp_port": int(port) if port else None,
+            "sftp_user": fields[1],
+            "sftp_password": fields[2],
+            "remote_path": fields[3]
+        })
+    return destinations
+
+def fetch_tasks_from_db(**filters):
+    """
+    Reads the scheduled tasks page by page.
+
+    :param filters: Column projection and status filters accepted by ``SQLiteHandler.get_tasks``
+    """
+    try:
+        metadata_store.connect()
+        return list(metadata_store.iter_tasks(page_size=task_page_size, **filters))
+    except Exception as e:
+        logging.error(f"Error fetching tasks from database: {e}")
+        return []
+
+def fetch_tasks_version():
+    """
+    :return: Change counter of the scheduled tasks, or None if it cannot be read
+    """
+    try:
+        metadata_store.connect()
+        return metadata_store.get_tasks_version()
+    except Exception as e:
+        logging.error(f"Error fetching tasks version: {e}")
+        return None
+
+def export_and_upload_pipelined(db_handler, sftp_handler, query, remote_path, codec="none", codec_level=None,
+                                params=None, metrics=None, batch_sizer=None):
+    """
+    Streams the query result straight to the SFTP server.
+
+    Fetching, CSV encoding, compression and the remote write each run in their own thread,
+    connected by bounded queues, so memory stays bounded by a few batches and no local file
+    is written.
+
+    :return: Tuple ``(rows, uploaded bytes)``
+    """
+    metrics = metrics or RunMetrics(None, None)
+    description, batches = db_handler.execute_query_batches(query, batch_sizer or fetch_batch_size or DEFAULT_BATCH_SIZE,
+                                                            params, blob_encoder)
+    # Los bytes ya subidos no se pueden reescribir: cada valor se formatea por sí solo
+    encoder = CSVEncoder(description, column_formats=False, blob_encoder=blob_encoder)
+    compressor = Compressor(codec, codec_level)
+    exported_rows = 0
+
+    def encode(rows):
+        nonlocal exported_rows
+        header = exported_rows == 0
+        exported_rows += len(rows)
+        with metrics.stage("encode"):
+            return encoder.encode(rows, header=header).encode("utf-8")
+
+    def compress(data):
+        with metrics.stage("compress"):
+            return compressor.compress(data)
+
+    def upload(chunks):
+        def with_trailer():
+            yield from chunks
+            if exported_rows == 0:
+                # Sin filas: el archivo solo contiene la cabecera
+                yield compressor.compress(encoder.encode([], header=True).encode("utf-8"))
+            yield compressor.flush()
+        return sftp_handler.upload_stream(with_trailer(), remote_path)
+
+    sftp_handler.connect()
+    with metrics.stage("upload"):
+        uploaded_bytes = run_pipeline(batches, [encode, compress], upload, queue_size=pipeline_queue_size)
+    metrics.add_timings(db_handler.timings)
+    logging.info(f"Pipelined export finished: {exported_rows} rows, {uploaded_bytes} bytes sent to {remote_path}.")
+    return exported_rows, uploaded_bytes
+
+def upload_with_checkpoints(sftp_handler, task_id, local_path, remote_path, checkpoint_path=None):
+    """
+    Uploads a file resuming from the checkpoint left by a previous failed attempt, if any.
+
+    :param checkpoint_path: Name the checkpoint is stored under; defaults to ``remote_path``
+    """
+    checkpoint_path = checkpoint_path or remote_path
+    metadata_store.connect()
+    checkpoint = metadata_store.get_upload_checkpoint(task_id, checkpoint_path)
+
+    def save_checkpoint(offset, prefix_hash):
+        metadata_store.save_upload_checkpoint(task_id, checkpoint_path, offset, prefix_hash)
+
+    sftp_handler.upload_file_resumable(local_path, remote_path, checkpoint=checkpoint,
+                                       on_checkpoint=save_checkpoint)
+    metadata_store.delete_upload_checkpoint(task_id, checkpoint_path)
+
+def upload_to_destination(task_id, local_path, destination):
+    """
+    Uploads a file to one destination, retrying failed attempts with a growing delay.
+
+    :param destination: Dictionary with ``sftp_host``, ``sftp_port``, ``sftp_user``, ``sftp_password``,
+        ``remote_path`` and ``id`` (None for the task's own destination)
+    :return: Dictionary with ``status``, ``attempts``, ``duration_seconds`` and ``error``
+    """
+    host = destination["sftp_host"]
+    port = destination.get("sftp_port") or sftp_default_port
+    remote_path = destination["remote_path"]
+    # Los destinos extra guardan su checkpoint por host, por si comparten ruta remota
+    checkpoint_path = f"{host}:{port}:{remote_path}" if destination.get("id") else remote_path
+    from sftp.SFTPHandler import SFTPHandler  # paramiko solo se importa cuando hay algo que subir
+
+    sftp_handler = SFTPHandler(host, destination["sftp_user"], destination["sftp_password"], port=port,
+                               session_cache=sftp_session_cache)
+    start_time = time.monotonic()
+    error = None
+    attempts = 0
+    for attempts in range(1, upload_retries + 2):
+        try:
+            with sftp_host_limiter.limit_for((host, port)):
+                sftp_handler.connect()
+                if sftp_resumable_uploads:
+                    upload_with_checkpoints(sftp_handler, task_id, local_path, remote_path, checkpoint_path)
+                else:
+                    sftp_handler.upload_file(local_path, remote_path, parallelism=sftp_upload_parallelism,
+                                             chunk_size=sftp_upload_chunk_size)
+            error = None
+            break
+        except Exception as e:
+            error = str(e)
+            logging.warning(f"Upload to {host}:{remote_path} failed (attempt {attempts}): {e}")
+            if attempts <= upload_retries:
+                time.sleep(upload_retry_delay * attempts)
+        finally:
+            sftp_handler.close_connection()
+
+    return {
+        "status": "error" if error else "completed",
+        "attempts": attempts,
+        "duration_seconds": time.monotonic() - start_time,
+        "error": error
+    }
+
+def upload_to_destinations(task_id, local_path, destinations, sqlite_handler):
+    """
+    Uploads one generated file to every destination concurrently. Each outcome is recorded as soon
+    as it is known, so a slow destination does not delay the others.
+
+    :return: Number of destinations that failed
+    """
+    failures = 0
+    max_workers = max(1, min(len(destinations), fanout_max_workers))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout") as executor:
+        futures = {
+            executor.submit(upload_to_destination, task_id, local_path, destination): destination
+            for destination in destinations
+        }
+        for future in concurrent.futures.as_completed(futures):
+            destination = futures[future]
+            result = future.result()
+            logging.info(f"Upload to {destination['sftp_host']}:{destination['remote_path']} {result['status']} "
+                         f"after {result['attempts']} attempt(s) in {result['duration_seconds']:.2f} seconds.")
+            if result["status"] != "completed":
+                failures += 1
+            if destination.get("id"):
+                sqlite_handler.update_destination_status(destination["id"], result["status"], result["attempts"],
+                                                         result["duration_seconds"], result["error"])
+    return failures
+
+@contextmanager
+def borrow_connection(metrics=None):
+    """
+    Borrows a pooled Firebird connection, adding the time spent getting it to the ``connect`` stage.
+    """
+    start_time = time.perf_counter()
+    with firebird_pool.connection() as db_handler:
+        if metrics:
+            metrics.add("connect", time.perf_counter() - start_time)
+        yield db_handler
+
+def export_query(db_handler, query, output_file, output_format="csv", output_codec="none", codec_level=None,
+                 params=None, include_header=True, metrics=None, batch_sizer=None):
+    """
+    Writes the query result to a local file in the task's output format.
+
+    :param batch_sizer: AdaptiveBatchSizer that chooses the size of every fetch; without it
+        FIREBIRD_FETCH_BATCH_SIZE is used
+    """
+    batch_size = batch_sizer or fetch_batch_size or None
+    if output_format == "parquet":
+        rows = db_handler.execute_query_to_parquet(query, output_file, batch_size=batch_size,
+                                                   compression=output_codec, compression_level=codec_level,
+                                                   params=params)
+    elif output_format == "arrow":
+        rows = db_handler.execute_query_to_arrow(query, output_file, batch_size=batch_size,
+                                                 compression=output_codec, compression_level=codec_level,
+                                                 params=params)
+    else:
+        rows = db_handler.execute_query_to_csv(query, output_file, batch_size=batch_size,
+                                               codec=output_codec, codec_level=codec_level, params=params,
+                                               include_header=include_header, blob_encoder=blob_encoder)
+    if metrics:
+        metrics.add_timings(db_handler.timings)
+        metrics.content_hash = db_handler.content_hash if output_format == "csv" else None
+    return rows
+
+def export_partitioned(query, output_file, output_format="csv", output_codec="none", codec_level=None,
+                       params=None, partition_column=None, partitions=1, order_by=None, metrics=None,
+                       batch_sizer=None):
+    """
+    Exports a large result by splitting the query into ranges of ``partition_column`` that are
+    fetched in parallel, each on its own pooled connection inside a read-only snapshot
+    transaction. The partial files are merged into ``output_file`` in range order.
+
+    The bounds and the row count are read in the snapshot of the first range. Every other range
+    has its own snapshot, so the rows of all the parts are checked against that count and the
+    export fails when the data changed in between.
+
+    Compressed CSV parts are already valid gzip members / zstd frames, so they are merged by plain
+    concatenation; parts whose column formats are narrower than the whole result (see
+    ``ColumnFormats``) are rewritten first. Parquet and Arrow parts are rewritten batch by batch.
+
+    :param order_by: Column the result must be sorted by, for incremental tasks. Only the partition
+        column keeps its order across ranges
+    :return: Number of exported rows
+    :raises ValueError: If ``order_by`` is not the partition column
+    """
+    if order_by and order_by.strip().upper() != partition_column.strip().upper():
+        raise ValueError(f"An incremental task sorted by {order_by} can only be partitioned by that column, "
+                         f"not by {partition_column}.")
+
+    with borrow_connection(metrics) as first_handler:
+        # El primer rango se exporta en el mismo snapshot en el que se leen los límites
+        first_handler.begin_read_only_snapshot()
+        low, high, count = first_handler.execute_fetchone(bounds_query(query, partition_column), params)
+        try:
+            ranges = partition_ranges(low, high, partitions) if low is not None else []
+        except TypeError as e:
+            logging.warning(f"{e} Exporting without partitions.")
+            ranges = []
+        if len(ranges) < 2:
+            return export_query(first_handler, query, output_file, output_format, output_codec, codec_level, params,
+                                metrics=metrics, batch_sizer=batch_sizer)
+
+        part_files = [f"{output_file}.part{index}" for index in range(len(ranges))]
+
+        def export_range(index):
+            start, end = ranges[index]
+            range_query = partition_query(query, partition_column, index == 0, index == len(ranges) - 1,
+                                          ordered=bool(order_by))
+            range_params = tuple(params or ()) + (start, end)
+            if index == 0:
+                rows = export_query(first_handler, range_query, part_files[index], output_format, output_codec,
+                                    codec_level, range_params, metrics=metrics, batch_sizer=batch_sizer)
+                return rows, first_handler.column_formats
+            with borrow_connection(metrics) as db_handler:
+                db_handler.begin_read_only_snapshot()
+                rows = export_query(db_handler, range_query, part_files[index], output_format, output_codec,
+                                    codec_level, range_params, include_header=False, metrics=metrics,
+                                    batch_sizer=batch_sizer)
+                return rows, db_handler.column_formats
+
+        logging.info(f"Exporting {output_file} in {len(ranges)} ranges of {partition_column} from {low} to {high}.")
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(ranges),
+                                                       thread_name_prefix="partition") as executor:
+                rows_per_range, part_formats = zip(*executor.map(export_range, range(len(ranges))))
+            rows = sum(rows_per_range)
+            if rows != count:
+                raise FirebirdQueryError(f"Partitioned export of {output_file} returned {rows} rows, but the query had "
+                                         f"{count} when the export started. The data changed during the export.")
+            merge_start = time.perf_counter()
+            content_hash = None
+            if output_format == "csv":
+                # Cada parte elige el formato de sus columnas; las más estrechas se reescriben con el del total
+                formats = ColumnFormats.widest(part_formats)
+                for index, part_file in enumerate(part_files):
+                    if part_formats[index].levels != formats.levels:
+                        FirebirdHandler.reformat_csv(part_file, formats, output_codec, codec_level,
+                                                     has_header=index == 0)
+                # El hash del archivo unido se calcula durante la copia
+                with HashingWriter(open(output_file, "wb")) as merged:
+                    for part_file in part_files:
+                        with open(part_file, "rb") as part:
+                            shutil.copyfileobj(part, merged, 1024 * 1024)
+                    content_hash = merged.hasher.hexdigest()
+            else:
+                merge_files(part_files, output_file, output_format, output_codec, codec_level)
+            if metrics:
+                metrics.add("merge", time.perf_counter() - merge_start)
+                metrics.content_hash = content_hash
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+    logging.info(f"Partitioned export of {output_file} finished: {rows} rows.")
+    return rows
+
+def export_to_file(query, output_file, output_format="csv", output_codec="none", codec_level=None, params=None,
+                   partition_column=None, partitions=1, order_by=None, metrics=None, batch_sizer=None):
+    """
+    Writes the query result to ``output_file``, in parallel ranges when the task is partitioned.
+
+    :return: Number of exported rows
+    """
+    if partition_column and (partitions or 1) > 1:
+        return export_partitioned(query, output_file, output_format, output_codec, codec_level, params,
+                                  partition_column, partitions, order_by, metrics, batch_sizer)
+    with borrow_connection(metrics) as db_handler:
+        return export_query(db_handler, query, output_file, output_format, output_codec, codec_level, params,
+                            metrics=metrics, batch_sizer=batch_sizer)
+
+def export_cached(query, output_file, output_format="csv", output_codec="none", codec_level=None,
+                  partition_column=None, partitions=1, metrics=None, batch_sizer=None):
+    """
+    Writes the query result to ``output_file`` through the query result cache. Tasks with the same
+    SQL, format and compression that fire within the freshness window share a single execution,
+    and a Firebird connection is only borrowed on a miss.
+
+    :return: Number of exported rows, or 0 when the file came from the cache
+    """
+    exported_rows = 0
+
+    def produce(path):
+        nonlocal exported_rows
+        exported_rows = export_to_file(query, path, output_format, output_codec, codec_level,
+                                       partition_column=partition_column, partitions=partitions, metrics=metrics,
+                                       batch_sizer=batch_sizer)
+
+    cache_key = query_result_cache.make_key(query, output_format, output_codec, codec_level)
+    query_result_cache.fetch(cache_key, output_file, produce)
+    logging.debug(f"Query result cache stats: {query_result_cache.stats()}")
+    return exported_rows
+
+def fetch_batch_sizer(task_id):
+    """
+    Builds the batch sizer of a run, starting from the size learned by the previous run of the task.
+
+    :return: AdaptiveBatchSizer, or None when adaptive fetching is disabled
+    """
+    if not adaptive_fetch:
+        return None
+    learned_size = None
+    try:
+        metadata_store.connect()
+        learned_size = metadata_store.get_fetch_batch_size(task_id)
+    except Exception as e:
+        logging.warning(f"Could not read the batch size of task {task_id}: {e}")
+    return AdaptiveBatchSizer(learned_size or fetch_batch_size or DEFAULT_BATCH_SIZE,
+                              min_size=adaptive_fetch_min_rows, max_size=adaptive_fetch_max_rows,
+                              max_batch_bytes=adaptive_fetch_max_bytes, target_seconds=adaptive_fetch_target_seconds)
+
+def export_and_upload_parts(task_id, query, output_file, destinations, output_codec="none", codec_level=None,
+                            params=None, part_max_rows=None, part_max_bytes=None, metrics=None, batch_sizer=None):
+    """
+    Exports the query result as CSV part files (``report.part-0001.csv``, ...) and uploads each part
+    to every destination as soon as it is closed, while the next parts are still being fetched. A
+    failed upload is retried for that part only. The manifest (``report.manifest.json``) listing the
+    parts, their rows and SHA-256 checksums is uploaded last, once every part is on every destination,
+    so its presence tells the receiver that the output is complete.
+
+    :return: Tuple ``(rows, bytes)`` of all the parts
+    """
+    metrics = metrics or RunMetrics(None, None)
+
+    def destinations_for(path_of):
+        return [dict(destination, remote_path=path_of(destination["remote_path"])) for destination in destinations]
+
+    def upload_part(part):
+        with metrics.stage("upload"):
+            remote_part_path = lambda remote_path: part_path(remote_path, part["index"], remote=True)
+            return upload_to_destinations(task_id, part["path"], destinations_for(remote_part_path), metadata_store)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, part_upload_workers),
+                                               thread_name_prefix="part-upload") as executor:
+        uploads = []
+        with borrow_connection(metrics) as db_handler:
+            rows = db_handler.execute_query_to_csv(query, output_file, batch_size=batch_sizer or fetch_batch_size or None,
+                                                   codec=output_codec, codec_level=codec_level, params=params,
+                                                   blob_encoder=blob_encoder, part_max_rows=part_max_rows,
+                                                   part_max_bytes=part_max_bytes,
+                                                   on_part=lambda part: uploads.append(executor.submit(upload_part, part)))
+            metrics.add_timings(db_handler.timings)
+            parts = db_handler.parts
+        failures = sum(future.result() for future in uploads)
+    if failures:
+        raise Exception(f"Upload failed for {failures} part destination(s) of {len(parts)} parts.")
+
+    manifest_file = write_manifest(manifest_path(output_file), parts, {"task_id": task_id})
+    with metrics.stage("upload"):
+        remote_manifest_path = lambda remote_path: manifest_path(remote_path, remote=True)
+        failures = upload_to_destinations(task_id, manifest_file, destinations_for(remote_manifest_path), metadata_store)
+    if failures:
+        raise Exception(f"Manifest upload failed for {failures} of {len(destinations)} destinations.")
+    logging.info(f"Export of {output_file} in {len(parts)} parts finished: {rows} rows.")
+    return rows, sum(part["bytes"] for part in parts)
+
+def output_fingerprint(content_hash, output_format, output_codec, codec_level, destinations):
+    """
+    Combines the hash of a generated file with what decides where and how it is uploaded, so a
+    change of format, compression or destinations is never taken for an unchanged output.
+
+    :return: Hex SHA-256
+    """
+    targets = sorted((destination["sftp_host"], destination.get("sftp_port") or sftp_default_port,
+                      destination["remote_path"]) for destination in destinations)
+    signature = json.dumps([content_hash, output_format, output_codec, codec_level, targets])
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+def prepare_incremental(db_handler, task_id, query, watermark_column):
+    """
+    Builds the delta query of an incremental task.
+
+    The current highest watermark is read first and used as the upper bound of the delta, so the
+    stored watermark always matches what was exported.
+
+    :return: Tuple ``(query, params, new_watermark)``; ``new_watermark`` is None when there are no
+        rows past the stored watermark
+    """
+    metadata_store.connect()
+    last_watermark = metadata_store.get_watermark(task_id)
+
+    high_watermark = db_handler.execute_scalar(max_watermark_query(query, watermark_column))
+    new_watermark = encode_watermark(high_watermark)
+    if new_watermark is None or new_watermark == last_watermark:
+        return query, None, None
+
+    if last_watermark is None:
+        params = (high_watermark,)
+    else:
+        params = (decode_watermark(last_watermark), high_watermark)
+    logging.info(f"Incremental export of task {task_id}: {watermark_column} > {last_watermark} up to {new_watermark}.")
+    return incremental_query(query, watermark_column, last_watermark is not None), params, new_watermark
+
+def record_run(sqlite_handler, metrics):
+    """
+    Stores a finished run in the task_runs history and adds it to the metrics endpoint.
+    A failure here is logged and never changes the outcome of the run.
+    """
+    metrics_registry.observe(metrics)
+    stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in metrics.stages.items())
+    logging.info(f"Run of task {metrics.task_name}: {metrics.status} in {metrics.duration_seconds:.2f} seconds, "
+                 f"{metrics.rows} rows, {metrics.bytes} bytes, {metrics.rows_per_second:.0f} rows/s ({stages}).")
+    try:
+        sqlite_handler.connect()
+        sqlite_handler.queue_task_run(metrics.as_record())
+        if multiprocessing.parent_process() is not None:
+            # Los procesos del executor "processpool" pueden terminar sin vaciar la cola
+            sqlite_handler.flush()
+    except Exception as e:
+        logging.error(f"Error recording the run of task {metrics.task_name}: {e}")
+
+def maintain_run_history():
+    """
+    Deletes the runs past the retention period and compacts the database when that frees enough space.
+    """
+    try:
+        metadata_store.connect()
+        metadata_store.flush()
+        metadata_store.purge_task_runs(task_runs_retention_days, task_runs_keep_last)
+        metadata_store.compact()
+    except Exception as e:
+        logging.error(f"Error maintaining the run history: {e}")
+
+def job(task_id, task_name, query, output_file, remote_path, sftp_host, sftp_user, sftp_pass,
+        output_codec="none", codec_level=None, output_format="csv", watermark_column=None, partition_column=None,
+        partitions=1, part_max_rows=None, part_max_bytes=None, force_upload=False):
+    """
+    Job to run the process of fetching data, saving to a file, and uploading it.
+
+    Tasks with a watermark column only export the rows past the last uploaded watermark, into a
+    delta file named after the run time. Tasks with a partition column are fetched in parallel ranges.
+    CSV tasks with a part limit are split into part files that are uploaded while the export goes on.
+
+    The upload is skipped, and the run recorded as ``skipped``, when the output is identical to the
+    last one the task uploaded, unless ``force_upload`` is set. Incremental, pipelined and split
+    outputs are always uploaded.
+    """
+    output_format = output_format or "csv"
+    run_time = datetime.datetime.now()
+
+    def output_name(path, remote=False):
+        if watermark_column:
+            path = delta_path(path, run_time, remote=remote)
+        if output_format == "csv":
+            # Los CSV comprimidos llevan la extensión del codec en local y en remoto;
+            # Parquet y Arrow comprimen internamente
+            path = with_extension(path, output_codec)
+        return path
+
+    output_file = output_name(output_file)
+    remote_path = output_name(remote_path, remote=True)
+    sftp_config = {
+        "host": sftp_host,
+        "username": sftp_user,
+        "password": sftp_pass,
+        "port": sftp_default_port
+    }
+
+    from sftp.SFTPHandler import SFTPHandler  # paramiko solo se importa cuando hay algo que subir
+
+    sftp_handler = SFTPHandler(**sftp_config, session_cache=sftp_session_cache)
+    metrics = RunMetrics(task_id, task_name)
+    batch_sizer = fetch_batch_sizer(task_id)
+
+    try:
+        logging.info(f"Starting task {task_name} (ID: {task_id})")
+        metadata_store.connect()
+        destinations = [{"id": None, "sftp_host": sftp_host, "sftp_port": sftp_default_port, "sftp_user": sftp_user,
+                         "sftp_password": sftp_pass, "remote_path": remote_path}] if sftp_host else []
+        for destination in metadata_store.get_destinations(task_id):
+            destination["remote_path"] = output_name(destination["remote_path"], remote=True)
+            destinations.append(destination)
+        # La salida por partes solo genera CSV y tiene prioridad sobre el modo pipeline y las particiones
+        split = bool(part_max_rows or part_max_bytes) and output_format == "csv"
+        # El modo pipeline solo genera CSV y sube a un único destino
+        pipelined = pipelined_upload and output_format == "csv" and len(destinations) == 1 and not split
+
+        query_params = None
+        new_watermark = None
+        nothing_to_export = False
+        skipped = False
+        if watermark_column:
+            with borrow_connection(metrics) as db_handler, metrics.stage("watermark"):
+                query, query_params, new_watermark = prepare_incremental(db_handler, task_id, query,
+                                                                         watermark_column)
+            nothing_to_export = new_watermark is None
+
+        if nothing_to_export:
+            logging.info(f"Task {task_name} has no rows past its watermark. Nothing to export.")
+        elif split:
+            with metrics.stage("export"):
+                metrics.rows, metrics.bytes = export_and_upload_parts(
+                    task_id, query, output_file, destinations, output_codec, codec_level, query_params,
+                    part_max_rows, part_max_bytes, metrics, batch_sizer)
+        elif pipelined:
+            with borrow_connection(metrics) as db_handler:
+                with sftp_host_limiter.limit_for((sftp_host, sftp_config["port"])):
+                    metrics.rows, metrics.bytes = export_and_upload_pipelined(
+                        db_handler, sftp_handler, query, remote_path, output_codec, codec_level, query_params, metrics,
+                        batch_sizer)
+        else:
+            with metrics.stage("export"):
+                if query_result_cache and not watermark_column:
+                    metrics.rows = export_cached(query, output_file, output_format, output_codec, codec_level,
+                                                 partition_column, partitions, metrics, batch_sizer)
+                else:
+                    # Un delta incremental va ordenado por su watermark
+                    metrics.rows = export_to_file(query, output_file, output_format, output_codec, codec_level,
+                                                  query_params, partition_column, partitions,
+                                                  order_by=watermark_column, metrics=metrics,
+                                                  batch_sizer=batch_sizer)
+            metrics.bytes = os.path.getsize(output_file)
+            if not watermark_column:
+                # Los deltas incrementales siempre son archivos nuevos; el resto se compara con la última subida
+                with metrics.stage("hash"):
+                    metrics.content_hash = output_fingerprint(metrics.content_hash or file_sha256(output_file),
+                                                              output_format, output_codec, codec_level, destinations)
+                unchanged = metrics.content_hash == metadata_store.get_content_hash(task_id)
+            else:
+                unchanged = False
+            if unchanged and not force_upload:
+                skipped = True
+                logging.info(f"Output of task {task_name} did not change since the last upload. Upload skipped.")
+            else:
+                if metrics.content_hash:
+                    # Si la subida falla a medias, la próxima ejecución vuelve a subir aunque el contenido coincida
+                    metadata_store.update_content_hash(task_id, None)
+                with metrics.stage("upload"):
+                    failures = upload_to_destinations(task_id, output_file, destinations, metadata_store)
+                if failures:
+                    raise Exception(f"Upload failed for {failures} of {len(destinations)} destinations.")
+                if metrics.content_hash:
+                    metadata_store.update_content_hash(task_id, metrics.content_hash)
+
+        # Update task status to "completed" on success
+        if new_watermark is not None:
+            # El watermark solo avanza cuando el delta ya está en el servidor
+            metadata_store.update_watermark(task_id, new_watermark)
+        if batch_sizer and batch_sizer.batches:
+            # La próxima ejecución empieza con el tamaño de lote aprendido en esta
+            batch_sizer.log_summary(task_name)
+            metadata_store.update_fetch_batch_size(task_id, batch_sizer.size)
+        metadata_store.queue_task_status(task_id, "completed")
+        metrics.finish("skipped" if skipped else "completed")
+        logging.info(f"Task {task_name} executed successfully.")
+    except Exception as e:
+        # Update task status to "error" on failure
+        metrics.finish("error", str(e))
+        metadata_store.queue_task_status(task_id, "error")
+        logging.error(f"Error executing task {task_name}: {e}")
+    finally:
+        sftp_handler.close_connection()
+        record_run(metadata_store, metrics)
+        logging.debug(f"Firebird pool stats: {firebird_pool.stats()}")
+
+def job_arguments(task):
+    """
+    :return: Tuple ``(args, kwargs)`` that run ``job`` for a task row
+    """
+    args = [
+        task.get("id"),
+        task.get("task_name"),
+        task.get("query"),
+        task.get("output_file"),
+        task.get("remote_path"),
+        task.get("sftp_host"),
+        task.get("sftp_user"),
+        task.get("sftp_password")
+    ]
+    kwargs = {
+        "output_codec": task.get("output_codec") or "none",
+        "codec_level": task.get("codec_level"),
+        "output_format": task.get("output_format") or "csv",
+        "watermark_column": task.get("watermark_column"),
+        "partition_column": task.get("partition_column"),
+        "partitions": task.get("partitions") or 1,
+        "part_max_rows": task.get("part_max_rows"),
+        "part_max_bytes": task.get("part_max_bytes"),
+        "force_upload": bool(task.get("force_upload"))
+    }
+    return args, kwargs
+
+def run_task_now(task_id, force_upload=False):
+    """
+    Runs a task once in the calling thread, outside its schedule.
+
+    :param force_upload: Upload the output even if it did not change since the last upload
+    :return: False if the task does not exist
+    """
+    metadata_store.connect()
+    task = metadata_store.get_task(task_id)
+    if task is None:
+        return False
+    args, kwargs = job_arguments(task)
+    kwargs["force_upload"] = kwargs["force_upload"] or force_upload
+    job(*args, **kwargs)
+    metadata_store.flush()
+    return True
+
+def schedule_task(task, reschedule=False):
+    """
+    Schedule a task based on its cron expression, if not already scheduled.
+
+    :param reschedule: Replace the job of a task that is already scheduled with its current definition.
+        A run in progress finishes with the old definition.
+    """
+    logging.info(f"Attempting to schedule task: {task['task_name']} (ID: {task['id']})")
+    cron_expression = task.get("cron_expression")
+    if cron_expression:
+        if scheduler.get_job(str(task["id"])) and not reschedule:
+            logging.info(f"Task {task['task_name']} (ID: {task['id']}) is already scheduled. Skipping.")
+            return
+
+        try:
+            logging.info(f"Parsing cron expression: {cron_expression}")
+            cron_parts = cron_expression.split()
+            logging.info(f"Cron parts: {cron_parts}")
+
+            args, kwargs = job_arguments(task)
+            scheduler.add_job(
+                job,
+                trigger=CronTrigger(
+                    minute=cron_parts[0],
+                    hour=cron_parts[1],
+                    day=cron_parts[2],
+                    month=cron_parts[3],
+                    day_of_week=cron_parts[4],
+                    jitter=scheduler_jitter
+                ),
+                args=args,
+                kwargs=kwargs,
+                id=str(task["id"]),
+                name=task.get("task_name"),
+                executor=task.get("executor") or "default",
+                replace_existing=True
+            )
+            logging.info(f"Task {task.get('task_name')} scheduled successfully.")
+        except Exception as e:
+            traceback.print_exc()
+            logging.error(f"Error scheduling task {task.get('task_name')}: {e}")
+    else:
+        logging.info("No cron expression provided; skipping task scheduling.")
+
+
+def load_and_schedule_tasks():
+    """
+    Load tasks from the database and schedule only those that are not completed.
+    """
+    global task_definitions_version
+    logging.info("Fetching tasks from the database to schedule them.")
+    # La versión se lee antes que las tareas: un cambio hecho durante la carga se vuelve a aplicar después
+    metadata_store.connect()
+    task_definitions_version = metadata_store.get_tasks_version(definitions_only=True)
+    pending_tasks = fetch_tasks_from_db(exclude_status="completed", enabled=True)
+
+    logging.info(f"Scheduling {len(pending_tasks)} pending tasks.")
+    for task in pending_tasks:
+        logging.info(f"Scheduling task: {task['task_name']} (ID: {task['id']})")
+        schedule_task(task)
+    logging.info("All pending tasks have been scheduled.")
+
+
+def reconcile_tasks():
+    """
+    Applies the task definitions changed since the last reload to the running scheduler: new tasks
+    are scheduled, edited tasks are rescheduled and deleted tasks are removed. Only the changed
+    tasks are read, so the cost does not depend on the total number of tasks.
+    """
+    global task_definitions_version
+    try:
+        metadata_store.connect()
+        version, changed_tasks, deleted_ids = metadata_store.get_task_changes(task_definitions_version)
+    except Exception as e:
+        logging.error(f"Error reading task changes: {e}")
+        return
+
+    for task_id in deleted_ids:
+        if scheduler.get_job(str(task_id)):
+            scheduler.remove_job(str(task_id))
+            logging.info(f"Task {task_id} was deleted. Job removed.")
+    for task in changed_tasks:
+        scheduled = scheduler.get_job(str(task["id"])) is not None
+        if scheduled and (not task.get("enabled") or not task.get("cron_expression")):
+            scheduler.remove_job(str(task["id"]))
+            logging.info(f"Task {task['task_name']} (ID: {task['id']}) is disabled or has no cron expression. "
+                         f"Job removed.")
+        elif not task.get("enabled"):
+            continue
+        elif scheduled or task.get("status") != "completed":
+            schedule_task(task, reschedule=True)
+    if changed_tasks or deleted_ids:
+        logging.info(f"Task definitions reloaded up to version {version}: "
+                     f"{len(changed_tasks)} changed, {len(deleted_ids)} deleted.")
+    task_definitions_version = version
+
+
+def start_scheduler():
+    """
+    Schedules the stored tasks and the maintenance jobs, and starts the scheduler and the metrics endpoint.
+    """
+    load_and_schedule_tasks()
+    scheduler.add_job(firebird_pool.evict_idle, "interval", seconds=60, id="firebird_pool_eviction")
+    if sftp_session_cache:
+        scheduler.add_job(sftp_session_cache.evict_idle, "interval", seconds=60, id="sftp_session_eviction")
+    if query_result_cache:
+        scheduler.add_job(query_result_cache.evict_expired, "interval", seconds=60, id="query_cache_eviction")
+    if task_reload_interval:
+        scheduler.add_job(reconcile_tasks, "interval", seconds=task_reload_interval, id="task_reload")
+    if task_runs_retention_days:
+        scheduler.add_job(maintain_run_history, "cron", hour=3, id="run_history_maintenance")
+    if metrics_port:
+        start_metrics_server(metrics_registry, metrics_port, os.getenv("METRICS_HOST", "0.0.0.0"))
+    scheduler.start()
+
+def stop_scheduler(wait=True):
+    """
+    Stops the scheduler and writes the queued status updates.
+
+    :param wait: Wait for the running jobs to finish
+    """
+    if scheduler.running:
+        scheduler.shutdown(wait=wait)
+    metadata_store.close()
@@ -1,11 +1,21 @@
+import hashlib
+import os
+import queue
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import paramiko
 import logging
 
+# Size of the ranges written by each channel in parallel uploads
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Bytes written between two progress checkpoints in resumable uploads
+DEFAULT_CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+RESUME_BLOCK_SIZE = 1024 * 1024
+
 
 class SFTPHandler:
-    def __init__(self, host, username, password, port=22):
+    def __init__(self, host, username, password, port=22, session_cache=None):
         """
         Initialize the SFTPHandler with the necessary connection details.
 
@@ -13,33 +23,60 @@ class SFTPHandler:
         :param username: Username for authentication
         :param password: Password for authentication
         :param port: Port for the SFTP server (default is 22)
+        :param session_cache: Optional SFTPSessionCache to reuse authenticated sessions across handlers
         """
         self.host = host
         self.username = username
         self.password = password
         self.port = port
+        self.session_cache = session_cache
         self.client = None
         self.sftp = None
 
+    @property
+    def session_key(self):
+        # La huella de la contraseña evita reutilizar una sesión autenticada con otras credenciales
+        password_digest = hashlib.sha256((self.password or "").encode("utf-8")).hexdigest()
+        return self.host, self.port, self.username, password_digest
+
     def connect(self):
         """
-        Establish a connection to the SFTP server.
+        Establish a connection to the SFTP server, reusing a cached session when available.
         """
         try:
-            self.client = paramiko.Transport((self.host, self.port))
-            self.client.connect(username=self.username, password=self.password)
-            self.sftp = paramiko.SFTPClient.from_transport(self.client)
-            logging.info("Successfully connected to the SFTP server.")
+            if self.session_cache:
+                self.client, self.sftp = self.session_cache.checkout(self.session_key, self._open_session)
+            else:
+                self.client, self.sftp = self._open_session()
         except Exception as e:
             logging.error(f"Failed to connect to the SFTP server: {e}")
             raise
 
-    def upload_file(self, local_path, remote_path):
+    def _open_session(self):
+        """
+        Open and authenticate a new SSH transport and SFTP channel.
+
+        :return: Tuple ``(transport, sftp)``
+        """
+        transport = paramiko.Transport((self.host, self.port))
+        try:
+            transport.connect(username=self.username, password=self.password)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+        except Exception:
+            transport.close()
+            raise
+        logging.info("Successfully connected to the SFTP server.")
+        return transport, sftp
+
+    def upload_file(self, local_path, remote_path, parallelism=1, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         Upload a file to the SFTP server.
 
         :param local_path: Path to the local file
         :param remote_path: Path on the SFTP server where the file will be uploaded
+        :param parallelism: Number of SFTP channels writing ranges of the file concurrently.
+            Files no bigger than ``chunk_size`` are always sent with a single ``put``
+        :param chunk_size: Size in bytes of the ranges handed to each channel
         """
         logging.info(f"Attempting to upload file. Variables: local_path={local_path}, remote_path={remote_path}")
         try:
@@ -47,7 +84,10 @@ class SFTPHandler:
                 raise ConnectionError("SFTP connection is not established.")
 
             logging.info(f"SFTP connection established. Uploading file from {local_path} to {remote_path}.")
-            self.sftp.put(local_path, remote_path)
+            if parallelism > 1 and os.path.getsize(local_path) > chunk_size:
+                self._upload_parallel(local_path, remote_path, parallelism, chunk_size)
+            else:
+                self.sftp.put(local_path, remote_path)
             logging.info(f"File '{local_path}' uploaded successfully to '{remote_path}'.")
         except FileNotFoundError as fnf_error:
             logging.error(f"Local file not found: {fnf_error}")
@@ -63,15 +103,241 @@ class SFTPHandler:
                 f"Error details: {e}, Variables: local_path={local_path}, remote_path={remote_path}, Stack trace: {traceback.format_exc()}")
             raise
 
-    def close_connection(self):
+    def upload_file_resumable(self, local_path, remote_path, checkpoint=None, on_checkpoint=None,
+                              checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Upload a file so that an interrupted transfer can continue where it stopped.
+
+        Data is written to ``<remote_path>.part``. Every ``checkpoint_interval`` bytes the server
+        is asked for the file size to confirm the writes, and ``on_checkpoint`` is called with the
+        confirmed offset and the SHA-256 of the local prefix. On retry, the partial remote file is
+        resumed from the checkpoint offset if the local file still starts with the same bytes;
+        otherwise the upload starts again from zero.
+
+        :param local_path: Path to the local file
+        :param remote_path: Path on the SFTP server where the file will be uploaded
+        :param checkpoint: Dictionary with ``offset`` and ``prefix_hash`` saved by a previous attempt
+        :param on_checkpoint: Callable ``(offset, prefix_hash)`` used to persist progress
+        :param checkpoint_interval: Bytes written between two checkpoints
+        :return: Offset the upload was resumed from
+        """
+        temp_path = f"{remote_path}.part"
+        logging.info(f"Resumable upload of '{local_path}' to '{temp_path}' (final path '{remote_path}').")
+        try:
+            if not self.sftp:
+                raise ConnectionError("SFTP connection is not established.")
+
+            file_size = os.path.getsize(local_path)
+            start_offset, prefix_hash = self._resume_offset(local_path, temp_path, checkpoint)
+
+            with open(local_path, "rb") as local_file, self.sftp.open(temp_path, "r+b" if start_offset else "wb") as remote_file:
+                if start_offset:
+                    # Descarta lo escrito después del último checkpoint confirmado
+                    remote_file.truncate(start_offset)
+                    remote_file.seek(start_offset)
+                    local_file.seek(start_offset)
+                remote_file.set_pipelined(True)
+
+                offset = start_offset
+                next_checkpoint = offset + checkpoint_interval
+                for block in iter(lambda: local_file.read(RESUME_BLOCK_SIZE), b""):
+                    remote_file.write(block)
+                    prefix_hash.update(block)
+                    offset += len(block)
+                    if on_checkpoint and offset >= next_checkpoint:
+                        # Las respuestas llegan en orden: el stat confirma las escrituras previas
+                        if remote_file.stat().st_size >= offset:
+                            on_checkpoint(offset, prefix_hash.hexdigest())
+                        next_checkpoint = offset + checkpoint_interval
+
+            remote_size = self.sftp.stat(temp_path).st_size
+            if remote_size != file_size:
+                raise IOError(f"Remote size mismatch for '{temp_path}': expected {file_size}, got {remote_size}.")
+            self._rename(temp_path, remote_path)
+            logging.info(f"File '{local_path}' uploaded to '{remote_path}' (resumed from byte {start_offset}).")
+            return start_offset
+        except Exception as e:
+            logging.error(f"Failed to upload file: {e}")
+            logging.debug(f"Stack trace: {traceback.format_exc()}")
+            raise
+
+    def _resume_offset(self, local_path, temp_path, checkpoint):
+        """
+        Decide where an upload can resume from.
+
+        :return: Tuple ``(offset, hasher)`` where ``hasher`` holds the SHA-256 state of the local
+            file up to ``offset``
+        """
+        prefix_hash = hashlib.sha256()
+        if not checkpoint or not checkpoint.get("offset"):
+            return 0, prefix_hash
+
+        offset = checkpoint["offset"]
+        try:
+            remote_size = self.sftp.stat(temp_path).st_size
+        except IOError:
+            logging.info(f"No partial file '{temp_path}' on the server. Starting from zero.")
+            return 0, prefix_hash
+        if remote_size < offset or os.path.getsize(local_path) < offset:
+            logging.info(f"Partial file '{temp_path}' is shorter than the checkpoint. Starting from zero.")
+            return 0, prefix_hash
+
+        with open(local_path, "rb") as local_file:
+            remaining = offset
+            while remaining:
+                block = local_file.read(min(RESUME_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                prefix_hash.update(block)
+                remaining -= len(block)
+
+        if prefix_hash.hexdigest() != checkpoint.get("prefix_hash"):
+            logging.info(f"Local file no longer matches the uploaded prefix of '{temp_path}'. Starting from zero.")
+            return 0, hashlib.sha256()
+
+        logging.info(f"Resuming upload of '{temp_path}' from byte {offset}.")
+        return offset, prefix_hash
+
+    def _upload_parallel(self, local_path, remote_path, parallelism, chunk_size):
         """
-        Close the SFTP connection.
+        Upload a file by writing ``chunk_size`` ranges at their offsets over several SFTP channels.
+
+        Every worker opens its own channel on the existing transport, so the per-channel request
+        window no longer caps throughput. The data goes to a temporary remote file whose size and,
+        when the server supports the ``check-file`` extension, SHA-256 are verified before it is
+        renamed to ``remote_path``.
+        """
+        file_size = os.path.getsize(local_path)
+        temp_path = f"{remote_path}.tmp"
+        offsets = queue.Queue()
+        for offset in range(0, file_size, chunk_size):
+            offsets.put(offset)
+        workers = min(parallelism, offsets.qsize())
+        logging.info(f"Uploading {file_size} bytes to '{temp_path}' over {workers} channels "
+                     f"in chunks of {chunk_size} bytes.")
+
+        # El archivo remoto debe existir antes de abrirlo en modo r+ desde cada canal
+        self.sftp.open(temp_path, "wb").close()
+
+        def write_ranges():
+            channel = paramiko.SFTPClient.from_transport(self.client)
+            try:
+                with open(local_path, "rb") as local_file, channel.open(temp_path, "r+b") as remote_file:
+                    remote_file.set_pipelined(True)
+                    while True:
+                        try:
+                            offset = offsets.get_nowait()
+                        except queue.Empty:
+                            return
+                        local_file.seek(offset)
+                        remote_file.seek(offset)
+                        remote_file.write(local_file.read(chunk_size))
+            finally:
+                channel.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(write_ranges) for _ in range(workers)]:
+                    future.result()
+            self._verify_upload(local_path, temp_path, file_size)
+            self._rename(temp_path, remote_path)
+        except Exception:
+            self._remove_quietly(temp_path)
+            raise
+
+    def _verify_upload(self, local_path, remote_path, expected_size):
+        """
+        Check that the remote file has the expected size and, if the server can compute it,
+        the same SHA-256 as the local file.
+        """
+        remote_size = self.sftp.stat(remote_path).st_size
+        if remote_size != expected_size:
+            raise IOError(f"Remote size mismatch for '{remote_path}': expected {expected_size}, got {remote_size}.")
+
+        try:
+            with self.sftp.open(remote_path, "rb") as remote_file:
+                remote_hash = remote_file.check("sha256")
+        except IOError as e:
+            logging.info(f"Server cannot checksum '{remote_path}' ({e}); verified size only.")
+            return
+
+        local_hash = hashlib.sha256()
+        with open(local_path, "rb") as local_file:
+            for block in iter(lambda: local_file.read(1024 * 1024), b""):
+                local_hash.update(block)
+        if remote_hash != local_hash.digest():
+            raise IOError(f"Checksum mismatch for '{remote_path}'.")
+        logging.info(f"Verified size and SHA-256 of '{remote_path}'.")
+
+    def upload_stream(self, chunks, remote_path):
+        """
+        Upload data to the SFTP server as it is produced, without a local copy of the file.
+
+        Chunks are written to a temporary remote file which is renamed to ``remote_path`` once
+        everything has been written, so readers never see a partial file.
+
+        :param chunks: Iterable of bytes objects
+        :param remote_path: Path on the SFTP server where the file will be stored
+        :return: Number of bytes uploaded
+        """
+        temp_path = f"{remote_path}.tmp"
+        logging.info(f"Streaming upload to '{temp_path}' (final path '{remote_path}').")
+        try:
+            if not self.sftp:
+                raise ConnectionError("SFTP connection is not established.")
+
+            total_bytes = 0
+            with self.sftp.open(temp_path, "wb") as remote_file:
+                remote_file.set_pipelined(True)
+                for chunk in chunks:
+                    remote_file.write(chunk)
+                    total_bytes += len(chunk)
+
+            self._rename(temp_path, remote_path)
+            logging.info(f"Streamed {total_bytes} bytes to '{remote_path}'.")
+            return total_bytes
+        except Exception as e:
+            logging.error(f"Failed to stream upload: {e}")
+            logging.debug(f"Stack trace: {traceback.format_exc()}")
+            self._remove_quietly(temp_path)
+            raise
+
+    def _rename(self, source_path, target_path):
+        """
+        Atomically replace ``target_path`` with ``source_path`` on the server.
+
+        Uses the ``posix-rename@openssh.com`` extension when available; plain SFTP rename fails
+        if the target exists, so in that case the old file is removed first.
         """
+        try:
+            self.sftp.posix_rename(source_path, target_path)
+        except IOError:
+            self._remove_quietly(target_path)
+            self.sftp.rename(source_path, target_path)
+
+    def _remove_quietly(self, remote_path):
         try:
             if self.sftp:
-                self.sftp.close()
-            if self.client:
-                self.client.close()
-            logging.info("SFTP connection closed.")
+                self.sftp.remove(remote_path)
+        except IOError:
+            pass
+
+    def close_connection(self):
+        """
+        Close the SFTP connection, or return it to the session cache if one is used.
+        """
+        try:
+            if self.session_cache and self.client and self.sftp:
+                self.session_cache.checkin(self.session_key, self.client, self.sftp)
+                logging.info("SFTP session returned to the cache.")
+            else:
+                if self.sftp:
+                    self.sftp.close()
+                if self.client:
+                    self.client.close()
+                logging.info("SFTP connection closed.")
         except Exception as e:
             logging.error(f"Failed to close the connection: {e}")
+        finally:
+            self.client = None
+            self.sftp = None
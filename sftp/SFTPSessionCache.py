@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+import weakref
+
+
+class SFTPSessionCache:
+    """
+    Thread-safe cache of authenticated paramiko Transport/SFTPClient pairs keyed by
+    ``(host, port, username, password digest)``.
+
+    A session is used by one SFTPHandler at a time: ``checkout`` takes it out of the cache and
+    ``checkin`` puts it back, so concurrent jobs to the same host get separate sessions.
+    """
+
+    def __init__(self, max_sessions=10, idle_timeout=300, keepalive_interval=30):
+        """
+        Initializes the cache.
+
+        :param max_sessions: Maximum number of idle sessions kept; the least recently used is closed
+        :param idle_timeout: Seconds an idle session is kept before it is closed
+        :param keepalive_interval: Seconds between SSH keepalive packets on cached transports
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._lock = threading.Lock()
+        self._idle = []  # [key, transport, sftp, last_used], el más reciente al final
+
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self._inherited = []
+
+        # Un proceso hijo creado con fork no debe usar las sesiones ni el lock del padre
+        reset_after_fork = weakref.WeakMethod(self._reset_after_fork)
+        os.register_at_fork(after_in_child=lambda: reset_after_fork() and reset_after_fork()())
+
+    def _reset_after_fork(self):
+        # Las sesiones heredadas comparten el socket con el padre: se guardan sin usarlas ni cerrarlas
+        self._inherited.extend(self._idle)
+        self._lock = threading.Lock()
+        self._idle = []
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+    def checkout(self, key, open_session):
+        """
+        Takes a live session for ``key`` out of the cache, or opens a new one.
+
+        Cached sessions whose transport has died are closed and replaced transparently.
+
+        :param key: Tuple ``(host, port, username, password digest)``
+        :param open_session: Callable returning a new ``(transport, sftp)`` pair
+        :return: Tuple ``(transport, sftp)``
+        """
+        while True:
+            with self._lock:
+                self._evict_idle_locked()
+                entry = self._pop_locked(key)
+
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                return open_session()
+
+            _, transport, sftp, _ = entry
+            if self._is_alive(transport, sftp):
+                with self._lock:
+                    self.hits += 1
+                logging.info(f"Reusing cached SFTP session for {key[2]}@{key[0]}:{key[1]}.")
+                return transport, sftp
+
+            logging.info(f"Cached SFTP session for {key[2]}@{key[0]}:{key[1]} is dead. Reconnecting.")
+            self._close_quietly(transport, sftp)
+            with self._lock:
+                self.reconnects += 1
+
+    def checkin(self, key, transport, sftp):
+        """
+        Returns a session to the cache so later jobs can reuse it.
+
+        :param key: Tuple ``(host, port, username, password digest)``
+        :param transport: Authenticated paramiko Transport
+        :param sftp: SFTPClient opened on ``transport``
+        """
+        if not transport.is_active():
+            self._close_quietly(transport, sftp)
+            return
+
+        transport.set_keepalive(self.keepalive_interval)
+        overflow = []
+        with self._lock:
+            self._idle.append([key, transport, sftp, time.monotonic()])
+            while len(self._idle) > self.max_sessions:
+                overflow.append(self._idle.pop(0))
+                self.evictions += 1
+
+        for _, old_transport, old_sftp, _ in overflow:
+            self._close_quietly(old_transport, old_sftp)
+
+    def evict_idle(self):
+        """
+        Closes sessions that have been idle for longer than ``idle_timeout``.
+        """
+        with self._lock:
+            self._evict_idle_locked()
+
+    def stats(self):
+        """
+        Returns the cache metrics.
+
+        :return: Dictionary with idle sessions, hits, misses, reconnects and evictions
+        """
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reconnects": self.reconnects,
+                "evictions": self.evictions
+            }
+
+    def close(self):
+        """
+        Closes every cached session.
+        """
+        with self._lock:
+            entries, self._idle = self._idle, []
+        for _, transport, sftp, _ in entries:
+            self._close_quietly(transport, sftp)
+        logging.info("SFTP session cache closed.")
+
+    def _pop_locked(self, key):
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index][0] == key:
+                return self._idle.pop(index)
+        return None
+
+    def _evict_idle_locked(self):
+        now = time.monotonic()
+        # Los más antiguos están al principio
+        while self._idle and now - self._idle[0][3] > self.idle_timeout:
+            _, transport, sftp, _ = self._idle.pop(0)
+            self.evictions += 1
+            self._close_quietly(transport, sftp)
+
+    @staticmethod
+    def _is_alive(transport, sftp):
+        if not transport.is_active():
+            return False
+        try:
+            # Ida y vuelta mínima para detectar sesiones cerradas por el servidor
+            sftp.normalize(".")
+            return True
+        except Exception as e:
+            logging.warning(f"SFTP session health check failed: {e}")
+            return False
+
+    @staticmethod
+    def _close_quietly(transport, sftp):
+        try:
+            sftp.close()
+            transport.close()
+        except Exception as e:
+            logging.warning(f"Error closing SFTP session: {e}")
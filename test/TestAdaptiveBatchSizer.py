@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from firebird.AdaptiveBatchSizer import AdaptiveBatchSizer
+from firebird.FirebirdHandler import FirebirdHandler
+
+
+class TestAdaptiveBatchSizer(unittest.TestCase):
+    def test_grows_while_fetches_are_fast(self):
+        """
+        Tests that the batch size doubles while full batches come back well under the target time.
+        """
+        sizer = AdaptiveBatchSizer(1000, min_size=100, max_size=8000, target_seconds=1.0)
+        for _ in range(5):
+            sizer.observe([(1, "a")] * sizer.size, 0.1)
+        self.assertEqual(sizer.size, 8000)
+
+    def test_shrinks_when_fetches_are_slow(self):
+        """
+        Tests that slow batches halve the size and that batches near the target scale it proportionally.
+        """
+        sizer = AdaptiveBatchSizer(4000, min_size=100, target_seconds=1.0)
+        sizer.observe([(1, "a")] * 4000, 3.0)
+        self.assertEqual(sizer.size, 2000)
+        sizer.observe([(1, "a")] * 2000, 1.25)
+        self.assertEqual(sizer.size, 1600)
+
+    def test_memory_bound_caps_wide_rows(self):
+        """
+        Tests that the size never exceeds the rows of the observed width that fit in max_batch_bytes.
+        """
+        sizer = AdaptiveBatchSizer(1000, min_size=10, max_size=100000, max_batch_bytes=1024 * 1024,
+                                   target_seconds=1.0)
+        wide_row = ("x" * 10000, 1)
+        sizer.observe([wide_row] * 1000, 0.01)
+        self.assertLessEqual(sizer.size * sizer.row_bytes, 1024 * 1024)
+        self.assertGreaterEqual(sizer.size, 10)
+
+    def test_last_partial_batch_does_not_change_the_size(self):
+        """
+        Tests that the short last batch of a result set is not taken as a latency signal.
+        """
+        sizer = AdaptiveBatchSizer(1000, min_size=100, target_seconds=1.0)
+        sizer.observe([(1,)] * 10, 0.001)
+        self.assertEqual(sizer.size, 1000)
+
+    @patch('fdb.Connection')
+    def test_handler_fetches_with_the_sizer(self, mock_connection):
+        """
+        Tests that a streaming export asks the sizer for every batch size and writes every row.
+        """
+        handler = FirebirdHandler('127.0.0.1', 3051, '/firebird/data/mydb.fdb', 'SYSDBA', 'masterkey')
+        batches = [[(1, "name")] * 500, [(2, "name")] * 1000, [(3, "name")] * 700, []]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = batches
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        handler.connection = mock_connection
+        sizer = AdaptiveBatchSizer(500, min_size=500, max_size=2000, target_seconds=10.0)
+
+        description, fetched = handler.execute_query_batches("SELECT * FROM employees", sizer)
+
+        self.assertEqual(sum(len(rows) for rows in fetched), 2200)
+        self.assertEqual([call.args[0] for call in mock_cursor.fetchmany.call_args_list], [500, 1000, 2000, 2000])
+        self.assertEqual(sizer.batches, 3)
+        self.assertGreater(handler.timings["fetch"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import threading
+import time
+import unittest
+
+from utils.concurrency import KeyedLimiter
+
+
+class TestKeyedLimiter(unittest.TestCase):
+    def run_jobs(self, limiter, keys):
+        """
+        Runs one short job per key and returns the peak number of jobs running at once per key.
+        """
+        running = {}
+        peaks = {}
+        lock = threading.Lock()
+
+        def work(key):
+            with limiter.limit_for(key):
+                with lock:
+                    running[key] = running.get(key, 0) + 1
+                    peaks[key] = max(peaks.get(key, 0), running[key])
+                time.sleep(0.05)
+                with lock:
+                    running[key] -= 1
+
+        threads = [threading.Thread(target=work, args=(key,)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return peaks
+
+    def test_limit_is_applied_per_key(self):
+        """
+        Tests that a key never has more holders than the limit and that keys do not block each other.
+        """
+        peaks = self.run_jobs(KeyedLimiter(2), ["a"] * 6 + ["b"] * 2)
+
+        self.assertEqual(peaks["a"], 2)
+        self.assertEqual(peaks["b"], 2)
+
+    def test_zero_disables_the_limit(self):
+        """
+        Tests that a limit of 0 lets every job run at once.
+        """
+        peaks = self.run_jobs(KeyedLimiter(0), ["a"] * 4)
+
+        self.assertEqual(peaks["a"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
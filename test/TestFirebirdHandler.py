@@ -1,11 +1,25 @@
+import base64
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import ntpath
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
 import fdb
 import pandas as pd
 
+from firebird.BlobEncoder import BlobEncoder
+from firebird.ColumnFormats import ColumnFormats
+from firebird.CSVEncoder import CSVEncoder
+from firebird.CSVPartWriter import CSVPartWriter, manifest_path, part_path, write_manifest
 from firebird.FirebirdHandler import FirebirdHandler
 from utils.errors import FirebirdConnectionError, FirebirdQueryError
+from utils.hashing import HashingWriter
 
 
 class TestFirebirdHandler(unittest.TestCase):
@@ -70,6 +84,650 @@ class TestFirebirdHandler(unittest.TestCase):
         self.assertIn('id', df.columns)
         self.assertIn('name', df.columns)
 
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_batched_matches_fetchall(self, mock_connection):
+        """
+        Tests that the batched export writes the same CSV as the fetchall path.
+        """
+        rows = [(1, 'John Doe', 10.5), (2, 'Smith, "Jane"', None), (3, 'Ana\nMaría', 7.25)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_cursor.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        mock_cursor.description = [('id',), ('name',), ('amount',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            full_file = os.path.join(tmp_dir, "full.csv")
+            batched_file = os.path.join(tmp_dir, "batched.csv")
+
+            self.handler.execute_query_to_csv("SELECT * FROM employees", full_file)
+            num_rows = self.handler.execute_query_to_csv("SELECT * FROM employees", batched_file, batch_size=2)
+
+            mock_cursor.fetchmany.assert_called_with(2)
+            self.assertEqual(num_rows, 3)
+            with open(full_file, 'rb') as full, open(batched_file, 'rb') as batched:
+                self.assertEqual(full.read(), batched.read())
+
+    def export_full_and_batched(self, mock_connection, rows, description, batch_size):
+        """
+        Exports the same rows through the fetchall path and in batches.
+
+        :return: Tuple ``(fetchall bytes, batched bytes)``
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_cursor.fetchmany.side_effect = [rows[start:start + batch_size]
+                                             for start in range(0, len(rows), batch_size)] + [[]]
+        mock_cursor.description = description
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            full_file = os.path.join(tmp_dir, "full.csv")
+            batched_file = os.path.join(tmp_dir, "batched.csv")
+
+            self.handler.execute_query_to_csv("SELECT * FROM stock", full_file)
+            self.handler.execute_query_to_csv("SELECT * FROM stock", batched_file, batch_size=batch_size)
+
+            with open(full_file, 'rb') as full, open(batched_file, 'rb') as batched:
+                return full.read(), batched.read()
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_batched_null_integers(self, mock_connection):
+        """
+        Tests that an integer column with NULLs in only the first batch is written as floats in
+        every batch, as pandas writes the whole column.
+        """
+        rows = [(1, None), (2, 5), (3, 7)]
+        description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 11, 4, 10, 0, True)]
+
+        full, batched = self.export_full_and_batched(mock_connection, rows, description, batch_size=2)
+
+        self.assertEqual(full, batched)
+        self.assertEqual(full.decode('utf-8').splitlines(), ['id,qty', '1,', '2,5.0', '3,7.0'])
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_batched_late_null_integers(self, mock_connection):
+        """
+        Tests that the rows written before the first NULL of an integer column are rewritten as floats.
+        """
+        rows = [(1, 4), (2, 5), (3, None), (4, 2 ** 60)]
+        description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 20, 8, 18, 0, True)]
+
+        full, batched = self.export_full_and_batched(mock_connection, rows, description, batch_size=2)
+
+        self.assertEqual(full, batched)
+        self.assertEqual(full.decode('utf-8').splitlines(),
+                         ['id,qty', '1,4.0', '2,5.0', '3,', '4,1.152921504606847e+18'])
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_batched_timestamp_precision(self, mock_connection):
+        """
+        Tests that a timestamp column gets the precision of the whole column, even when the finer
+        values only arrive in later batches.
+        """
+        timestamp = datetime.datetime
+        description = [('id', int, 11, 4, 10, 0, False), ('created', timestamp, 24, 8, 0, 0, True)]
+        cases = {
+            'date only': [(1, timestamp(2024, 1, 1)), (2, None), (3, timestamp(2024, 1, 3))],
+            'seconds': [(1, timestamp(2024, 1, 1)), (2, timestamp(2024, 1, 2)), (3, timestamp(2024, 1, 3, 8, 30))],
+            'milliseconds': [(1, timestamp(2024, 1, 1)), (2, timestamp(2024, 1, 2, 8)),
+                             (3, timestamp(2024, 1, 3, 8, 30, 5, 250000))],
+            'microseconds': [(1, timestamp(2024, 1, 1, 8, 0, 0, 500000)), (2, None),
+                             (3, timestamp(2024, 1, 3, 8, 30, 5, 250100))],
+            'out of range': [(1, timestamp(2024, 1, 1)), (2, timestamp(2024, 1, 2, 8, 0, 0, 500000)),
+                             (3, timestamp(1200, 1, 1))]
+        }
+        for name, rows in cases.items():
+            with self.subTest(name):
+                full, batched = self.export_full_and_batched(MagicMock(), rows, description, batch_size=2)
+                self.assertEqual(full, batched)
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_batched_empty_result(self, mock_connection):
+        """
+        Tests that the batched export writes the header when the query returns no rows.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.return_value = []
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "empty.csv")
+            num_rows = self.handler.execute_query_to_csv("SELECT * FROM employees", output_file, batch_size=100)
+
+            self.assertEqual(num_rows, 0)
+            df = pd.read_csv(output_file)
+            self.assertEqual(list(df.columns), ['id', 'name'])
+            self.assertEqual(len(df), 0)
+
+    @patch('fdb.Connection')
+    def test_execute_query_batches_encodes_like_csv_export(self, mock_connection):
+        """
+        Tests that encoding the fetched batches produces the same bytes as the CSV export.
+        """
+        rows = [(1, 'John Doe'), (2, 'Smith, "Jane"'), (3, None)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_cursor.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        description, batches = self.handler.execute_query_batches("SELECT * FROM employees", 2)
+        encoder = CSVEncoder(description)
+        encoded = encoder.encode([], header=True).encode('utf-8')
+        encoded += b"".join(encoder.encode(batch).encode('utf-8') for batch in batches)
+        mock_cursor.close.assert_called_once()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "full.csv")
+            self.handler.execute_query_to_csv("SELECT * FROM employees", output_file)
+            with open(output_file, 'rb') as csv_file:
+                self.assertEqual(csv_file.read(), encoded)
+
+    def test_csv_encoder_matches_pandas(self):
+        """
+        Tests that the typed CSV encoder writes what pandas wrote for the same rows, including an
+        integer column with NULLs and a timestamp column with mixed precision.
+        """
+        rows = [(1, 'John Doe', decimal.Decimal('10.50'), 0.1 + 0.2, datetime.date(2024, 1, 31),
+                 datetime.datetime(2024, 1, 31, 10, 30, 15), datetime.time(8, 0), True, 4),
+                (2, 'Smith, "Jane"\nJr.', None, float('nan'), None,
+                 datetime.datetime(2024, 2, 1, 23, 59, 59, 250000), None, False, None)]
+        description = [
+            ('ID', int, 11, 4, 0, 0, False),
+            ('NAME', str, 50, 50, 0, 0, True),
+            ('AMOUNT', decimal.Decimal, 20, 8, 18, -2, True),
+            ('RATIO', float, 17, 8, 0, 0, True),
+            ('HIRED', datetime.date, 10, 4, 0, 0, True),
+            ('UPDATED', datetime.datetime, 22, 8, 0, 0, True),
+            ('START', datetime.time, 11, 4, 0, 0, True),
+            ('ACTIVE', bool, 5, 1, 0, 0, True),
+            ('QTY', int, 11, 4, 0, 0, True),
+        ]
+        columns = [desc[0] for desc in description]
+
+        encoder = CSVEncoder(description)
+        encoder.observe(rows)
+        encoded = encoder.encode(rows, header=True)
+
+        self.assertEqual(encoded, pd.DataFrame(rows, columns=columns).to_csv(index=False))
+        self.assertIn('2024-01-31 10:30:15.000', encoded)
+        self.assertIn('4.0', encoded)
+
+    def test_csv_encoder_formats_each_value(self):
+        """
+        Tests that without column formats every value is written on its own, so a NULL in one batch
+        does not change how the integers of the other batches are written.
+        """
+        description = [('id', int, 11, 4, 0, 0, False), ('qty', int, 11, 4, 0, 0, True),
+                       ('created', datetime.datetime, 22, 8, 0, 0, True)]
+        batches = [[(1, 4, datetime.datetime(2024, 1, 1))],
+                   [(2, None, datetime.datetime(2024, 1, 2, 8, 30, 5, 250000))]]
+        encoder = CSVEncoder(description, column_formats=False)
+
+        encoded = encoder.encode([], header=True)
+        encoded += "".join(encoder.encode(batch) for batch in batches)
+
+        self.assertEqual(encoded.splitlines(),
+                         ['id,qty,created', '1,4,2024-01-01 00:00:00', '2,,2024-01-02 08:30:05.250000'])
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_compressed(self, mock_connection):
+        """
+        Tests that compressed exports decompress to the same CSV as the plain export.
+        """
+        rows = [(1, 'John Doe'), (2, 'Jane Smith')]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plain_file = os.path.join(tmp_dir, "plain.csv")
+            gzip_file = os.path.join(tmp_dir, "report.csv.gz")
+            self.handler.execute_query_to_csv("SELECT * FROM employees", plain_file)
+            mock_cursor.fetchmany.side_effect = [rows, []]
+            self.handler.execute_query_to_csv("SELECT * FROM employees", gzip_file, codec="gzip", codec_level=9)
+
+            with open(plain_file, 'rb') as plain, gzip.open(gzip_file, 'rb') as compressed:
+                self.assertEqual(plain.read(), compressed.read())
+
+    def test_execute_query_to_csv_unknown_codec(self):
+        """
+        Tests that an unsupported codec is rejected before the query runs.
+        """
+        self.handler.connection = MagicMock()
+        with self.assertRaises(ValueError):
+            self.handler.execute_query_to_csv("SELECT * FROM employees", "output.csv", codec="lzma")
+        self.handler.connection.cursor.assert_not_called()
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_compressed_batched_rewrite(self, mock_connection):
+        """
+        Tests that a compressed batched export is rewritten compressed when a later batch widens a column.
+        """
+        rows = [(1, 4), (2, 5), (3, None)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        mock_cursor.description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 20, 8, 18, 0, True)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.csv.gz")
+            self.handler.execute_query_to_csv("SELECT * FROM employees", output_file, batch_size=2, codec="gzip")
+
+            with gzip.open(output_file, 'rb') as compressed:
+                self.assertEqual(compressed.read().decode('utf-8').splitlines(),
+                                 ['id,qty', '1,4.0', '2,5.0', '3,'])
+            self.assertEqual(os.listdir(tmp_dir), ['report.csv.gz'])
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_parquet_typed_row_groups(self, mock_connection):
+        """
+        Tests that the Parquet export maps Firebird types and writes one row group per batch.
+        """
+        pq = self._import_parquet()
+        rows = [(1, 'John Doe', decimal.Decimal('10.50'), datetime.date(2024, 1, 31)),
+                (2, 'Jane Smith', None, datetime.date(2024, 2, 29)),
+                (3, 'John Doe', decimal.Decimal('-1.25'), None)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        mock_cursor.description = [
+            ('ID', int, 11, 4, 0, 0, False),
+            ('NAME', str, 50, 50, 0, 0, True),
+            ('AMOUNT', decimal.Decimal, 20, 8, 18, -2, True),
+            ('HIRED', datetime.date, 10, 4, 0, 0, True),
+        ]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.parquet")
+            num_rows = self.handler.execute_query_to_parquet("SELECT * FROM employees", output_file,
+                                                             batch_size=2, compression="zstd")
+
+            parquet_file = pq.ParquetFile(output_file)
+            table = parquet_file.read()
+            self.assertEqual(num_rows, 3)
+            self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+            self.assertEqual(str(table.schema.field('ID').type), 'int32')
+            self.assertEqual(str(table.schema.field('AMOUNT').type), 'decimal128(18, 2)')
+            self.assertEqual(str(table.schema.field('HIRED').type), 'date32[day]')
+            self.assertEqual([tuple(row.values()) for row in table.to_pylist()], rows)
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_arrow(self, mock_connection):
+        """
+        Tests the Arrow IPC export when the description carries no type information.
+        """
+        self._import_parquet()
+        import pyarrow as pa
+        rows = [(1, 'John Doe'), (2, None)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows, []]
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.arrow")
+            self.handler.execute_query_to_arrow("SELECT * FROM employees", output_file)
+
+            with pa.ipc.open_file(output_file) as reader:
+                table = reader.read_all()
+            self.assertEqual(table.column_names, ['id', 'name'])
+            self.assertEqual(table.to_pydict(), {'id': [1, 2], 'name': ['John Doe', None]})
+
+    def _import_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        return pq
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_without_header(self, mock_connection):
+        """
+        Tests that partial outputs can be written without the header line.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [[(3, 'Ann')], []]
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "part.csv")
+            self.handler.execute_query_to_csv("SELECT * FROM employees WHERE id >= ? AND id < ?", output_file,
+                                              batch_size=10, params=(3, 5), include_header=False)
+            with open(output_file, newline='') as csv_file:
+                self.assertEqual(csv_file.read(), f"3,Ann{os.linesep}")
+
+    @staticmethod
+    def blob_reader(data, is_text):
+        """
+        Builds a stand-in for fdb.BlobReader that returns ``data`` in reads of the requested size.
+        """
+        reader = MagicMock(spec=fdb.BlobReader)
+        reader.is_text = is_text
+        position = [0]
+
+        def read(size=-1):
+            end = len(data) if size < 0 else position[0] + size
+            chunk = data[position[0]:end]
+            position[0] += len(chunk)
+            return chunk
+        reader.read.side_effect = read
+        return reader
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_streams_large_blobs(self, mock_connection):
+        """
+        Tests that BLOBs returned as BlobReader are copied to the CSV in chunks, matching small BLOBs.
+        """
+        text = 'Línea "uno"\nmañana, ' * 50
+        binary = bytes(range(256)) * 4
+        description = [('ID', int, 11, 4, 0, 0, False), ('NOTES', str, 0, 8, 0, 1, True),
+                       ('IMAGE', str, 0, 8, 0, 0, True)]
+        readers = (self.blob_reader(text.encode('utf-8'), True), self.blob_reader(binary, False))
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [[(1, text.encode('utf-8'), binary), (2,) + readers], []]
+        mock_cursor.description = description
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "blobs.csv")
+            self.handler.execute_query_to_csv("SELECT * FROM documents", output_file, batch_size=10,
+                                              blob_encoder=BlobEncoder("base64", chunk_size=7))
+
+            mock_cursor.set_stream_blob_treshold.assert_called_once()
+            df = pd.read_csv(output_file)
+            self.assertEqual(list(df['NOTES']), [text, text])
+            self.assertEqual([base64.b64decode(value) for value in df['IMAGE']], [binary, binary])
+            # Cada BLOB se leyó en trozos y se cerró
+            self.assertGreater(readers[0].read.call_count, 100)
+            readers[0].close.assert_called_once()
+            readers[1].close.assert_called_once()
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_blob_stream_threshold(self, mock_connection):
+        """
+        Tests that the stream threshold of the BlobEncoder is the one set on the cursor.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.description = [('NOTES', str, 0, 8, 0, 1, True)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.handler.execute_query_to_csv("SELECT * FROM documents", os.path.join(tmp_dir, "blobs.csv"),
+                                              blob_encoder=BlobEncoder(stream_threshold=1024 * 1024))
+
+        mock_cursor.set_stream_blob_treshold.assert_called_once_with(1024 * 1024)
+        with self.assertRaises(ValueError):
+            BlobEncoder(stream_threshold=-2)
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_rewrite_keeps_large_blobs(self, mock_connection):
+        """
+        Tests that the end-of-run rewrite reads back BLOB fields larger than the csv module's default limit.
+        """
+        text = 'x' * (256 * 1024)
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [[(1, self.blob_reader(text.encode('utf-8'), True))], [(None, b'y')], []]
+        mock_cursor.description = [('QTY', int, 11, 4, 0, 0, True), ('NOTES', str, 0, 8, 0, 1, True)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "blobs.csv")
+            self.handler.execute_query_to_csv("SELECT * FROM documents", output_file, batch_size=1)
+
+            with open(output_file, newline='') as csv_file:
+                self.assertEqual(csv_file.read().split(os.linesep), ['QTY,NOTES', f'1.0,{text}', ',y', ''])
+
+    def test_csv_encoder_quotes_blobs_whatever_their_size(self):
+        """
+        Tests that a BLOB read from a BlobReader is quoted exactly like the same value materialized.
+        """
+        description = [('ID', int, 11, 4, 0, 0, False), ('NOTES', str, 0, 8, 0, 1, True)]
+        encoder = CSVEncoder(description, blob_encoder=BlobEncoder(chunk_size=4))
+        for text in ('plain text', 'comma, inside', 'a "quote"', 'two\nlines', ' leading space'):
+            materialized = encoder.encode([(1, text.encode('utf-8'))])
+            streamed = encoder.encode([(1, self.blob_reader(text.encode('utf-8'), True))])
+            self.assertEqual(streamed, materialized)
+            self.assertEqual(materialized, pd.DataFrame([(1, text)], columns=['ID', 'NOTES']).to_csv(
+                index=False, header=False))
+
+    def test_blob_encoder_hex_and_text_chunks(self):
+        """
+        Tests hex encoding of binary BLOBs and decoding of multi-byte characters split between chunks.
+        """
+        encoder = BlobEncoder("hex", chunk_size=3)
+        self.assertEqual("".join(encoder.chunks(self.blob_reader(b"\x00\xffab", False))), "00ff6162")
+        self.assertEqual("".join(encoder.chunks(self.blob_reader("ñañaña".encode("utf-8"), True))), "ñañaña")
+        self.assertEqual(encoder.to_text(b"\x01\x02", is_text=False), "0102")
+        with self.assertRaises(ValueError):
+            BlobEncoder("base32")
+
+    def test_blob_encoder_writes_binary_blobs_as_bytes_repr(self):
+        """
+        Tests that without an encoding binary BLOBs are written losslessly as pandas did, whatever their size.
+        """
+        description = [('ID', int, 11, 4, 0, 0, False), ('IMAGE', str, 0, 8, 0, 0, True)]
+        encoder = CSVEncoder(description, blob_encoder=BlobEncoder(chunk_size=3))
+        for data in (b"\x00\xff\x89PNG", b"it's", b'say "hi"', b"both ' and \"", b"a'b\"c'" * 5, bytes(range(256))):
+            materialized = encoder.encode([(1, data)])
+            streamed = encoder.encode([(1, self.blob_reader(data, False))])
+            self.assertEqual(streamed, materialized)
+            self.assertEqual(materialized, pd.DataFrame([(1, data)], columns=['ID', 'IMAGE']).to_csv(
+                index=False, header=False))
+
+    def test_blob_encoder_text_warns_once_per_column_on_replaced_bytes(self):
+        """
+        Tests that decoding binary BLOBs as text logs a warning the first time a column has invalid bytes.
+        """
+        encoder = BlobEncoder("text", chunk_size=3)
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(encoder.to_text(b"ok\xff", is_text=False, column="IMAGE"), "ok\ufffd")
+            self.assertEqual("".join(encoder.chunks(self.blob_reader(b"\xfe\xffok", False), "IMAGE")), "\ufffd\ufffdok")
+            encoder.to_text(b"\xff", is_text=False, column="THUMBNAIL")
+            self.assertEqual(encoder.to_text(b"valid", is_text=False, column="OTHER"), "valid")
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("IMAGE", logs.records[0].getMessage())
+        self.assertIn("THUMBNAIL", logs.records[1].getMessage())
+
+    @patch('fdb.Connection')
+    def test_partial_outputs_share_column_formats(self, mock_connection):
+        """
+        Tests that a part written before another part widened a column is rewritten, header
+        excluded, with the formats of the whole result.
+        """
+        description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 20, 8, 18, 0, True)]
+        parts = [[(1, None)], [(2, 4), (3, 5)]]
+        mock_connection.cursor.side_effect = [MagicMock(fetchall=MagicMock(return_value=rows), description=description)
+                                              for rows in parts]
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            part_files = [os.path.join(tmp_dir, f"report.csv.part{index}") for index in range(len(parts))]
+            part_formats = []
+            for index, part_file in enumerate(part_files):
+                self.handler.execute_query_to_csv("SELECT * FROM orders", part_file, include_header=index == 0)
+                part_formats.append(self.handler.column_formats)
+
+            formats = ColumnFormats.widest(part_formats)
+            FirebirdHandler.reformat_csv(part_files[1], formats, has_header=False)
+            merged = b""
+            for part_file in part_files:
+                with open(part_file, 'rb') as part:
+                    merged += part.read()
+
+        self.assertEqual(merged, pd.DataFrame(parts[0] + parts[1], columns=['id', 'qty']).to_csv(index=False).encode())
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_content_hash_is_reproducible(self, mock_connection):
+        """
+        Tests that the hash computed while writing matches the file and repeats for the same rows,
+        including gzip outputs.
+        """
+        rows = [(1, 'John Doe'), (2, 'Jane Smith')]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for codec in ("none", "gzip"):
+                hashes = []
+                for run in range(2):
+                    mock_cursor.fetchmany.side_effect = [rows, []]
+                    output_file = os.path.join(tmp_dir, f"report_{codec}.csv")
+                    self.handler.execute_query_to_csv("SELECT * FROM employees", output_file, codec=codec)
+                    with open(output_file, 'rb') as output:
+                        self.assertEqual(hashlib.sha256(output.read()).hexdigest(), self.handler.content_hash)
+                    hashes.append(self.handler.content_hash)
+                self.assertEqual(hashes[0], hashes[1])
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_content_hash_after_rewrite(self, mock_connection):
+        """
+        Tests that the content hash is the one of the rewritten file when a later batch widens a column.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [[(1, 4)], [(2, None)], []]
+        mock_cursor.description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 20, 8, 18, 0, True)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.csv.gz")
+            self.handler.execute_query_to_csv("SELECT * FROM orders", output_file, batch_size=1, codec="gzip")
+
+            with open(output_file, 'rb') as output:
+                data = output.read()
+        self.assertEqual(gzip.decompress(data).decode('utf-8').splitlines(), ['id,qty', '1,4.0', '2,'])
+        self.assertEqual(self.handler.content_hash, hashlib.sha256(data).hexdigest())
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_in_parts(self, mock_connection):
+        """
+        Tests that the output rolls over to a new part file at the row limit, even inside a batch,
+        and that every part is reported with its checksum as soon as it is closed.
+        """
+        rows = [(index, f'name {index}') for index in range(7)]
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows[:5], rows[5:], []]
+        mock_cursor.description = [('id',), ('name',)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+        reported = []
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.csv.gz")
+            num_rows = self.handler.execute_query_to_csv("SELECT * FROM employees", output_file, codec="gzip",
+                                                         part_max_rows=3, on_part=reported.append)
+
+            self.assertEqual(num_rows, 7)
+            self.assertEqual(reported, self.handler.parts)
+            self.assertEqual([part["rows"] for part in reported], [3, 3, 1])
+            self.assertFalse(os.path.exists(output_file))
+            exported = []
+            for part in reported:
+                self.assertEqual(part["path"], part_path(output_file, part["index"]))
+                with open(part["path"], "rb") as part_file:
+                    data = part_file.read()
+                self.assertEqual((len(data), hashlib.sha256(data).hexdigest()), (part["bytes"], part["sha256"]))
+                df = pd.read_csv(part["path"], compression="gzip")
+                exported.extend(df.itertuples(index=False, name=None))
+            self.assertEqual(exported, rows)
+
+            manifest_file = write_manifest(manifest_path(output_file), reported)
+            with open(manifest_file) as manifest:
+                content = json.load(manifest)
+            self.assertEqual(os.path.basename(manifest_file), "report.manifest.json")
+            self.assertEqual(content["rows"], 7)
+            self.assertEqual([part["name"] for part in content["parts"]],
+                             ["report.part-0001.csv.gz", "report.part-0002.csv.gz", "report.part-0003.csv.gz"])
+
+    def test_part_paths_of_remote_outputs_use_slashes(self):
+        """
+        Tests that part and manifest names of remote paths keep POSIX separators whatever the local OS.
+        """
+        with patch('firebird.CSVPartWriter.os', MagicMock(path=ntpath)):
+            self.assertEqual(part_path("/upload/daily/report.csv.gz", 2, remote=True),
+                             "/upload/daily/report.part-0002.csv.gz")
+            self.assertEqual(manifest_path("/upload/daily/report.csv.gz", remote=True),
+                             "/upload/daily/report.manifest.json")
+            self.assertEqual(part_path("C:\\exports\\report.csv", 1), "C:\\exports\\report.part-0001.csv")
+
+    @patch('fdb.Connection')
+    def test_execute_query_to_csv_parts_format_each_value(self, mock_connection):
+        """
+        Tests that part files, uploaded as soon as they are closed, are never rewritten: every value
+        is formatted on its own.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [[(1, None), (2, 4)], []]
+        mock_cursor.description = [('id', int, 11, 4, 10, 0, False), ('qty', int, 20, 8, 18, 0, True)]
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "report.csv")
+            self.handler.execute_query_to_csv("SELECT * FROM orders", output_file, part_max_rows=1)
+
+            contents = []
+            for part in self.handler.parts:
+                with open(part["path"], newline='') as part_file:
+                    contents.append(part_file.read())
+        self.assertIsNone(self.handler.column_formats)
+        self.assertEqual(contents, [f"id,qty{os.linesep}1,{os.linesep}", f"id,qty{os.linesep}2,4{os.linesep}"])
+
+    def test_csv_part_writer_closes_file_when_open_fails(self):
+        """
+        Tests that the part file is closed when the compressed stream cannot be opened on it.
+        """
+        opened = []
+
+        def hashing_writer(*args):
+            opened.append(HashingWriter(*args))
+            return opened[-1]
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('utils.hashing.HashingWriter', side_effect=hashing_writer), \
+                patch('utils.compression._ClosingGzipFile', side_effect=OSError("no space left")):
+            writer = CSVPartWriter(os.path.join(tmp_dir, "report.csv"), CSVEncoder([('id',)]), codec="gzip")
+            with self.assertRaises(OSError):
+                writer.write_rows([(1,)])
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+
+    @patch('fdb.Connection')
+    def test_execute_scalar_with_params(self, mock_connection):
+        """
+        Tests that execute_scalar passes the parameters and returns the first column.
+        """
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (42,)
+        mock_connection.cursor.return_value = mock_cursor
+        self.handler.connection = mock_connection
+        query = "SELECT MAX(id) FROM employees WHERE id > ?"
+
+        self.assertEqual(self.handler.execute_scalar(query, (10,)), 42)
+        mock_cursor.execute.assert_called_once_with(query, (10,))
+        mock_cursor.close.assert_called_once()
+
     def test_execute_query_to_csv_no_connection(self):
         """
         Tests executing a query without an established connection.
@@ -0,0 +1,145 @@
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import fdb
+
+from firebird.FirebirdPool import FirebirdPool
+from utils.errors import FirebirdConnectionError
+
+
+class TestFirebirdPool(unittest.TestCase):
+    def setUp(self):
+        """
+        Sets up the test environment.
+        """
+        self.pool = FirebirdPool(
+            host='127.0.0.1',
+            port=3051,
+            database='/firebird/data/mydb.fdb',
+            user='SYSDBA',
+            password='masterkey',
+            max_size=2,
+            acquire_timeout=0.2,
+            connect_retries=0
+        )
+
+    @patch('fdb.connect')
+    def test_reuses_idle_connection(self, mock_connect):
+        """
+        Tests that a released connection is handed out again instead of reconnecting.
+        """
+        mock_connect.side_effect = lambda **kwargs: MagicMock()
+
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        mock_connect.assert_called_once()
+        stats = self.pool.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["idle"], 1)
+
+    @patch('fdb.connect')
+    def test_reconnects_when_health_check_fails(self, mock_connect):
+        """
+        Tests that a dead idle connection is replaced on borrow.
+        """
+        dead_connection = MagicMock()
+        dead_connection.cursor.return_value.execute.side_effect = fdb.DatabaseError("connection lost")
+        mock_connect.side_effect = [dead_connection, MagicMock()]
+
+        handler = self.pool.acquire()
+        self.pool.release(handler)
+        handler = self.pool.acquire()
+
+        self.assertIsNot(handler.connection, dead_connection)
+        self.assertEqual(self.pool.stats()["reconnects"], 1)
+        self.assertEqual(self.pool.stats()["size"], 1)
+
+    @patch('fdb.connect')
+    def test_connection_error_discards_connection(self, mock_connect):
+        """
+        Tests that a FirebirdConnectionError inside the block closes the borrowed connection.
+        """
+        mock_connect.side_effect = lambda **kwargs: MagicMock()
+
+        with self.assertRaises(FirebirdConnectionError):
+            with self.pool.connection():
+                raise FirebirdConnectionError("connection lost")
+
+        self.assertEqual(self.pool.stats()["size"], 0)
+
+    @patch('fdb.connect')
+    def test_waits_when_pool_is_exhausted(self, mock_connect):
+        """
+        Tests that borrowers wait for a free connection and time out when none is released.
+        """
+        mock_connect.side_effect = lambda **kwargs: MagicMock()
+        first = self.pool.acquire()
+        self.pool.acquire()
+
+        with self.assertRaises(FirebirdConnectionError):
+            self.pool.acquire()
+
+        timer = threading.Timer(0.05, self.pool.release, args=(first,))
+        timer.start()
+        self.assertIs(self.pool.acquire(), first)
+        timer.join()
+        self.assertEqual(self.pool.stats()["waits"], 1)
+        self.assertEqual(mock_connect.call_count, 2)
+
+    @patch('fdb.connect')
+    def test_evicts_idle_connections(self, mock_connect):
+        """
+        Tests that connections idle for longer than the timeout are closed.
+        """
+        connection = MagicMock()
+        mock_connect.return_value = connection
+        self.pool.idle_timeout = 0
+
+        self.pool.release(self.pool.acquire())
+        self.pool.evict_idle()
+
+        connection.close.assert_called_once()
+        self.assertEqual(self.pool.stats()["size"], 0)
+        self.assertEqual(self.pool.stats()["evictions"], 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+    @patch('fdb.connect')
+    def test_forked_child_starts_with_empty_pool(self, mock_connect):
+        """
+        Tests that a child created with fork neither reuses nor closes the parent's connections, and
+        does not wait on a lock the parent holds.
+        """
+        connection = MagicMock()
+        mock_connect.return_value = connection
+        self.pool.release(self.pool.acquire())
+
+        read_end, write_end = os.pipe()
+        with self.pool._lock:
+            pid = os.fork()
+            if pid == 0:
+                # Proceso hijo: informa y termina sin volver al runner de unittest
+                try:
+                    if self.pool._lock.acquire(timeout=1):
+                        self.pool._lock.release()
+                        stats = self.pool.stats()
+                        os.write(write_end, f"{stats['size']},{stats['idle']},{stats['hits']}".encode())
+                finally:
+                    os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end, "rb") as child_output:
+            self.assertEqual(child_output.read(), b"0,0,0")
+
+        self.assertEqual(self.pool.stats()["idle"], 1)
+        connection.close.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import urllib.request
+
+from utils.metrics import MetricsRegistry, RunMetrics, start_metrics_server
+
+
+class TestMetrics(unittest.TestCase):
+    def finished_run(self, status="completed", rows=500):
+        run = RunMetrics(7, "report")
+        run.add("execute", 0.5)
+        run.add("fetch", 1.0)
+        run.add("fetch", 0.5)
+        run.rows, run.bytes = rows, 4096
+        run.finish(status)
+        return run
+
+    def test_run_metrics(self):
+        """
+        Tests that stage durations accumulate and the record has the task_runs columns.
+        """
+        run = self.finished_run()
+
+        self.assertEqual(run.stages, {"execute": 0.5, "fetch": 1.5})
+        self.assertGreater(run.rows_per_second, 0)
+        record = run.as_record()
+        self.assertEqual((record["task_id"], record["status"], record["rows"], record["bytes"]),
+                         (7, "completed", 500, 4096))
+        self.assertIn('"fetch": 1.5', record["stages"])
+
+    def test_render(self):
+        """
+        Tests the Prometheus text output of the registry.
+        """
+        registry = MetricsRegistry()
+        registry.observe(self.finished_run())
+        registry.observe(self.finished_run("error", rows=0))
+        registry.register_stats("firebird_pool", lambda: {"size": 5, "in_use": 1, "name": "pool"})
+
+        text = registry.render()
+
+        self.assertIn('firebird_sftp_task_runs_total{task_id="7",task="report",status="completed"} 1', text)
+        self.assertIn('firebird_sftp_task_runs_total{task_id="7",task="report",status="error"} 1', text)
+        self.assertIn('firebird_sftp_task_stage_seconds_sum{task_id="7",task="report",stage="fetch"} 3.0', text)
+        self.assertIn('firebird_sftp_task_stage_seconds_count{task_id="7",task="report",stage="fetch"} 2', text)
+        self.assertIn('firebird_sftp_task_rows_total{task_id="7",task="report"} 500', text)
+        self.assertIn("firebird_sftp_firebird_pool_in_use 1", text)
+        self.assertNotIn("firebird_pool_name", text)
+
+    def test_metrics_server(self):
+        """
+        Tests that the endpoint serves the rendered metrics.
+        """
+        registry = MetricsRegistry()
+        registry.observe(self.finished_run())
+        server = start_metrics_server(registry, 0, "127.0.0.1")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("firebird_sftp_task_runs_total", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
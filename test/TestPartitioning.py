@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from utils.partitioning import bounds_query, partition_query, partition_ranges
+
+
+class TestPartitioning(unittest.TestCase):
+    def test_integer_ranges_cover_the_bounds(self):
+        """
+        Tests that integer bounds are split into contiguous ranges that end at the maximum.
+        """
+        self.assertEqual(partition_ranges(1, 100, 4), [(1, 25), (25, 50), (50, 75), (75, 100)])
+        # Rangos más estrechos que el número de particiones se agrupan
+        self.assertEqual(partition_ranges(1, 3, 8), [(1, 2), (2, 3)])
+        self.assertEqual(partition_ranges(7, 7, 4), [(7, 7)])
+
+    def test_timestamp_ranges(self):
+        """
+        Tests that timestamp bounds are split by time.
+        """
+        ranges = partition_ranges(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 3), 2)
+
+        self.assertEqual(ranges, [(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2)),
+                                  (datetime.datetime(2024, 1, 2), datetime.datetime(2024, 1, 3))])
+
+    def test_text_columns_cannot_be_split(self):
+        with self.assertRaises(TypeError):
+            partition_ranges("A", "Z", 4)
+
+    def test_partition_query(self):
+        """
+        Tests that only the first range returns NULLs and only the last one includes its end.
+        """
+        self.assertEqual(partition_query("SELECT * FROM orders", "ID", True, False),
+                         "SELECT * FROM (SELECT * FROM orders) partition_source "
+                         "WHERE (ID >= ? AND ID < ?) OR ID IS NULL")
+        self.assertEqual(partition_query("SELECT * FROM orders", "ID", False, True),
+                         "SELECT * FROM (SELECT * FROM orders) partition_source WHERE ID >= ? AND ID <= ?")
+        self.assertEqual(partition_query("SELECT * FROM orders", "ID", False, False, ordered=True),
+                         "SELECT * FROM (SELECT * FROM orders) partition_source WHERE ID >= ? AND ID < ? ORDER BY ID")
+
+    def test_bounds_query_counts_rows(self):
+        """
+        Tests that the bounds query also counts the rows, so the parts can be checked against it.
+        """
+        self.assertEqual(bounds_query("SELECT * FROM orders", "ID"),
+                         "SELECT MIN(ID), MAX(ID), COUNT(*) FROM (SELECT * FROM orders) partition_source")
+
+
+if __name__ == "__main__":
+    unittest.main()
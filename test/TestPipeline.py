@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from utils.pipeline import run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_items_arrive_in_order(self):
+        """
+        Tests that every item goes through every stage and reaches the sink in source order.
+        """
+        result = run_pipeline(range(1000), [lambda item: item * 2, str], list, queue_size=3)
+
+        self.assertEqual(result, [str(item * 2) for item in range(1000)])
+
+    def test_queues_are_bounded(self):
+        """
+        Tests that a slow sink stops the source after a few items instead of letting them pile up.
+        """
+        produced = 0
+
+        def source():
+            nonlocal produced
+            for item in range(1000):
+                produced += 1
+                yield item
+
+        def slow_sink(items):
+            first = next(iter(items))
+            time.sleep(0.3)
+            return first, produced
+
+        first, produced_while_blocked = run_pipeline(source(), [lambda item: item], slow_sink, queue_size=2)
+
+        self.assertEqual(first, 0)
+        # Uno en el sink, dos por cola y uno esperando en cada hilo productor
+        self.assertLessEqual(produced_while_blocked, 1 + 2 * (2 + 1))
+
+    def test_source_error_is_raised_by_the_sink(self):
+        """
+        Tests that an error in the source stops the pipeline and is re-raised in the caller.
+        """
+        def source():
+            yield 1
+            yield 2
+            raise ValueError("cursor lost")
+
+        threads_before = threading.active_count()
+        with self.assertRaises(ValueError) as context:
+            run_pipeline(source(), [lambda item: item], list)
+
+        self.assertEqual(str(context.exception), "cursor lost")
+        self.assertEqual(threading.active_count(), threads_before)
+
+    def test_stage_error_stops_the_source(self):
+        """
+        Tests that an error in a stage is re-raised and the source generator is closed.
+        """
+        closed = threading.Event()
+
+        def source():
+            try:
+                for item in range(1000):
+                    yield item
+            finally:
+                closed.set()
+
+        def failing_stage(item):
+            if item == 5:
+                raise RuntimeError("encoding failed")
+            return item
+
+        with self.assertRaises(RuntimeError):
+            run_pipeline(source(), [failing_stage], list, queue_size=2)
+
+        self.assertTrue(closed.is_set())
+
+    def test_sink_error_releases_the_producers(self):
+        """
+        Tests that a failing sink does not leave the producer threads blocked on full queues.
+        """
+        def failing_sink(items):
+            next(iter(items))
+            raise IOError("connection reset")
+
+        threads_before = threading.active_count()
+        with self.assertRaises(IOError):
+            run_pipeline(iter(range(1000)), [lambda item: item], failing_sink, queue_size=1)
+
+        self.assertEqual(threading.active_count(), threads_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from firebird.QueryResultCache import QueryResultCache, normalize_sql
+
+
+class TestQueryResultCache(unittest.TestCase):
+    def setUp(self):
+        """
+        Sets up an empty cache in a temporary directory.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.cache = QueryResultCache(self.cache_dir, ttl=60, max_bytes=1024)
+        self.runs = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def produce(self, content=b"id,name\n1,John\n", delay=0):
+        def write(path):
+            self.runs += 1
+            time.sleep(delay)
+            with open(path, "wb") as output:
+                output.write(content)
+        return write
+
+    def output_path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_normalize_sql(self):
+        """
+        Tests that whitespace and case are normalized outside quoted text.
+        """
+        self.assertEqual(normalize_sql("select *\n  from employees where name = 'Ann  Lee';"),
+                         "SELECT * FROM EMPLOYEES WHERE NAME = 'Ann  Lee'")
+        self.assertEqual(QueryResultCache.make_key("select 1 from rdb$database"),
+                         QueryResultCache.make_key("SELECT 1\nFROM RDB$DATABASE"))
+        self.assertNotEqual(QueryResultCache.make_key("SELECT 1 FROM RDB$DATABASE", codec="gzip"),
+                            QueryResultCache.make_key("SELECT 1 FROM RDB$DATABASE"))
+
+    def test_concurrent_tasks_share_one_execution(self):
+        """
+        Tests that tasks with the same key firing together run the query once and all get the file.
+        """
+        key = QueryResultCache.make_key("SELECT * FROM employees")
+        outputs = [self.output_path(f"report_{index}.csv") for index in range(4)]
+        threads = [threading.Thread(target=self.cache.fetch, args=(key, output, self.produce(delay=0.05)))
+                   for output in outputs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.runs, 1)
+        for output in outputs:
+            with open(output, "rb") as result:
+                self.assertEqual(result.read(), b"id,name\n1,John\n")
+        self.assertEqual((self.cache.stats()["hits"], self.cache.stats()["misses"]), (3, 1))
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_stale_entry_is_refreshed(self):
+        """
+        Tests that an entry older than the TTL runs the query again.
+        """
+        self.cache.ttl = 0
+        key = QueryResultCache.make_key("SELECT * FROM employees")
+
+        self.assertFalse(self.cache.fetch(key, self.output_path("a.csv"), self.produce()))
+        time.sleep(0.01)
+        self.assertFalse(self.cache.fetch(key, self.output_path("b.csv"), self.produce()))
+        self.assertEqual(self.runs, 2)
+
+    def test_size_based_eviction(self):
+        """
+        Tests that the least recently used entries are deleted when the cache exceeds its size.
+        """
+        first_key = QueryResultCache.make_key("SELECT 1 FROM RDB$DATABASE")
+        second_key = QueryResultCache.make_key("SELECT 2 FROM RDB$DATABASE")
+
+        self.cache.fetch(first_key, self.output_path("first.csv"), self.produce(b"x" * 600))
+        self.cache.fetch(second_key, self.output_path("second.csv"), self.produce(b"y" * 600))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["entries"], stats["bytes"], stats["evictions"]), (1, 600, 1))
+        self.assertEqual(os.listdir(self.cache_dir), [second_key + ".csv"])
+        # El archivo de la tarea sigue disponible aunque su entrada se haya eliminado
+        self.assertEqual(os.path.getsize(self.output_path("first.csv")), 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sftp.SFTPHandler import SFTPHandler
+
+
+class MemorySFTP:
+    """
+    In-memory stand-in for ``paramiko.SFTPClient`` with the calls SFTPHandler uses.
+    """
+
+    def __init__(self, files=None):
+        self.files = files if files is not None else {}
+        self.lock = threading.Lock()
+        self.renames = []
+        # Extensión check-file: OpenSSH no la implementa
+        self.supports_check = False
+
+    def open(self, path, mode="rb"):
+        return MemoryFile(self, path, mode)
+
+    def stat(self, path):
+        if path not in self.files:
+            raise IOError(f"No such file: {path}")
+        return SimpleNamespace(st_size=len(self.files[path]))
+
+    def posix_rename(self, source_path, target_path):
+        self.files[target_path] = self.files.pop(source_path)
+        self.renames.append((source_path, target_path))
+
+    def remove(self, path):
+        if self.files.pop(path, None) is None:
+            raise IOError(f"No such file: {path}")
+
+    def close(self):
+        pass
+
+
+class MemoryFile:
+    def __init__(self, sftp, path, mode):
+        if "w" in mode:
+            sftp.files[path] = bytearray()
+        elif path not in sftp.files:
+            raise IOError(f"No such file: {path}")
+        self.sftp = sftp
+        self.data = sftp.files[path]
+        self.position = 0
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def seek(self, offset):
+        self.position = offset
+
+    def truncate(self, size):
+        del self.data[size:]
+
+    def write(self, data):
+        with self.sftp.lock:
+            if self.position > len(self.data):
+                self.data.extend(b"\0" * (self.position - len(self.data)))
+            self.data[self.position:self.position + len(data)] = data
+        self.position += len(data)
+
+    def stat(self):
+        return SimpleNamespace(st_size=len(self.data))
+
+    def check(self, hash_algorithm):
+        if not self.sftp.supports_check:
+            raise IOError("Operation unsupported")
+        return hashlib.new(hash_algorithm, bytes(self.data)).digest()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TestSFTPHandler(unittest.TestCase):
+    def setUp(self):
+        """
+        Sets up the test environment.
+        """
+        self.sftp = MemorySFTP()
+        self.handler = SFTPHandler('sftp.example.com', 'user', 'secret')
+        self.handler.client = object()
+        self.handler.sftp = self.sftp
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def local_file(self, size):
+        """
+        Writes a local file of ``size`` pseudo-random bytes.
+        """
+        path = os.path.join(self.tmp_dir.name, "report.csv")
+        with open(path, "wb") as local:
+            local.write(bytes((index * 31 + index // 251) % 256 for index in range(size)))
+        return path
+
+    def test_upload_stream_renames_temp_file(self):
+        """
+        Tests that streamed chunks are written to a temporary file that is renamed once complete.
+        """
+        uploaded = self.handler.upload_stream(iter([b"id,name\n", b"1,John\n", b"2,Jane\n"]), "/in/report.csv")
+
+        self.assertEqual(uploaded, 22)
+        self.assertEqual(self.sftp.renames, [("/in/report.csv.tmp", "/in/report.csv")])
+        self.assertEqual(bytes(self.sftp.files["/in/report.csv"]), b"id,name\n1,John\n2,Jane\n")
+
+    def test_upload_stream_failure_removes_temp_file(self):
+        """
+        Tests that a failing source leaves neither the temporary nor the final file on the server.
+        """
+        def chunks():
+            yield b"id,name\n"
+            raise RuntimeError("fetch failed")
+
+        with self.assertRaises(RuntimeError):
+            self.handler.upload_stream(chunks(), "/in/report.csv")
+
+        self.assertEqual(self.sftp.files, {})
+        self.assertEqual(self.sftp.renames, [])
+
+    def test_upload_stream_without_connection(self):
+        """
+        Tests that streaming without a connection fails before anything is consumed.
+        """
+        self.handler.sftp = None
+        chunks = iter([b"data"])
+
+        with self.assertRaises(ConnectionError):
+            self.handler.upload_stream(chunks, "/in/report.csv")
+        self.assertEqual(next(chunks), b"data")
+
+    def test_parallel_upload_reassembles_ranges(self):
+        """
+        Tests that a file is split into ranges written over several channels and reassembled in order.
+        """
+        local_path = self.local_file(10500)
+
+        with patch('sftp.SFTPHandler.paramiko.SFTPClient.from_transport', return_value=self.sftp) as open_channel:
+            self.handler.upload_file(local_path, "/in/report.csv", parallelism=3, chunk_size=1000)
+
+        self.assertEqual(open_channel.call_count, 3)
+        with open(local_path, "rb") as local:
+            self.assertEqual(bytes(self.sftp.files["/in/report.csv"]), local.read())
+        self.assertEqual(self.sftp.renames, [("/in/report.csv.tmp", "/in/report.csv")])
+
+    def test_parallel_upload_checks_sha256_when_supported(self):
+        """
+        Tests that a file with the right size but different bytes fails when the server supports check-file.
+        """
+        local_path = self.local_file(4096)
+        self.sftp.supports_check = True
+
+        class CorruptingFile(MemoryFile):
+            def write(self, data):
+                super().write(bytes(byte ^ 0xFF for byte in data) if self.position == 0 else data)
+
+        channel = MemorySFTP(self.sftp.files)
+        channel.open = lambda path, mode="rb": CorruptingFile(channel, path, mode)
+
+        with patch('sftp.SFTPHandler.paramiko.SFTPClient.from_transport', return_value=channel):
+            with self.assertRaises(IOError) as context:
+                self.handler.upload_file(local_path, "/in/report.csv", parallelism=2, chunk_size=1024)
+
+        self.assertIn("Checksum mismatch", str(context.exception))
+        self.assertEqual(self.sftp.files, {})
+
+    def test_parallel_upload_size_mismatch_removes_temp_file(self):
+        """
+        Tests that a range lost on the way fails the size check and leaves nothing on the server.
+        """
+        local_path = self.local_file(2500)
+
+        class LossyFile(MemoryFile):
+            def write(self, data):
+                if len(data) == 1000:
+                    super().write(data)
+
+        channel = MemorySFTP(self.sftp.files)
+        channel.open = lambda path, mode="rb": LossyFile(channel, path, mode)
+
+        with patch('sftp.SFTPHandler.paramiko.SFTPClient.from_transport', return_value=channel):
+            with self.assertRaises(IOError) as context:
+                self.handler.upload_file(local_path, "/in/report.csv", parallelism=2, chunk_size=1000)
+
+        self.assertIn("size mismatch", str(context.exception))
+        self.assertEqual(self.sftp.files, {})
+
+    def test_resumable_upload_continues_from_checkpoint(self):
+        """
+        Tests that a valid checkpoint resumes the upload, dropping what was written after it.
+        """
+        local_path = self.local_file(5000)
+        with open(local_path, "rb") as local:
+            content = local.read()
+        self.sftp.files["/in/report.csv.part"] = bytearray(content[:3000] + b"unconfirmed")
+        checkpoint = {"offset": 3000, "prefix_hash": hashlib.sha256(content[:3000]).hexdigest()}
+
+        resumed_from = self.handler.upload_file_resumable(local_path, "/in/report.csv", checkpoint=checkpoint)
+
+        self.assertEqual(resumed_from, 3000)
+        self.assertEqual(bytes(self.sftp.files["/in/report.csv"]), content)
+        self.assertNotIn("/in/report.csv.part", self.sftp.files)
+
+    def test_resumable_upload_restarts_when_prefix_changed(self):
+        """
+        Tests that the upload starts again from zero when the local file no longer has the checkpointed prefix.
+        """
+        local_path = self.local_file(5000)
+        with open(local_path, "rb") as local:
+            content = local.read()
+        self.sftp.files["/in/report.csv.part"] = bytearray(b"x" * 3000)
+        checkpoint = {"offset": 3000, "prefix_hash": hashlib.sha256(b"x" * 3000).hexdigest()}
+
+        resumed_from = self.handler.upload_file_resumable(local_path, "/in/report.csv", checkpoint=checkpoint)
+
+        self.assertEqual(resumed_from, 0)
+        self.assertEqual(bytes(self.sftp.files["/in/report.csv"]), content)
+
+    def test_resumable_upload_restarts_without_partial_file(self):
+        """
+        Tests that a checkpoint whose partial file is gone on the server starts from zero.
+        """
+        local_path = self.local_file(5000)
+        with open(local_path, "rb") as local:
+            content = local.read()
+        checkpoint = {"offset": 3000, "prefix_hash": hashlib.sha256(content[:3000]).hexdigest()}
+
+        resumed_from = self.handler.upload_file_resumable(local_path, "/in/report.csv", checkpoint=checkpoint)
+
+        self.assertEqual(resumed_from, 0)
+        self.assertEqual(bytes(self.sftp.files["/in/report.csv"]), content)
+
+    def test_resumable_upload_checkpoint_cadence(self):
+        """
+        Tests that progress is reported once per checkpoint interval with the hash of the confirmed prefix.
+        """
+        local_path = self.local_file(1000)
+        with open(local_path, "rb") as local:
+            content = local.read()
+        checkpoints = []
+
+        with patch('sftp.SFTPHandler.RESUME_BLOCK_SIZE', 100):
+            self.handler.upload_file_resumable(local_path, "/in/report.csv", checkpoint_interval=250,
+                                               on_checkpoint=lambda *args: checkpoints.append(args))
+
+        self.assertEqual(checkpoints, [(offset, hashlib.sha256(content[:offset]).hexdigest())
+                                       for offset in (300, 600, 900)])
+
+
+if __name__ == '__main__':
+    unittest.main()
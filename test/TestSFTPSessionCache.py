@@ -0,0 +1,128 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sftp.SFTPHandler import SFTPHandler
+from sftp.SFTPSessionCache import SFTPSessionCache
+
+
+def make_session(active=True):
+    transport = MagicMock()
+    transport.is_active.return_value = active
+    return transport, MagicMock()
+
+
+class TestSFTPSessionCache(unittest.TestCase):
+    def setUp(self):
+        """
+        Sets up the test environment.
+        """
+        self.cache = SFTPSessionCache(max_sessions=2, idle_timeout=300, keepalive_interval=15)
+        self.key = ('sftp.example.com', 22, 'user')
+
+    def test_checkout_reuses_checked_in_session(self):
+        """
+        Tests that a returned session is reused and keepalives are enabled on it.
+        """
+        transport, sftp = make_session()
+        open_session = MagicMock(return_value=(transport, sftp))
+
+        self.cache.checkin(self.key, *self.cache.checkout(self.key, open_session))
+        reused = self.cache.checkout(self.key, open_session)
+
+        self.assertEqual(reused, (transport, sftp))
+        open_session.assert_called_once()
+        transport.set_keepalive.assert_called_once_with(15)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_dead_session_is_replaced(self):
+        """
+        Tests that a cached session that fails the health check is closed and reopened.
+        """
+        dead_transport, dead_sftp = make_session()
+        dead_sftp.normalize.side_effect = EOFError("server closed the session")
+        fresh = make_session()
+        self.cache.checkin(self.key, dead_transport, dead_sftp)
+
+        session = self.cache.checkout(self.key, MagicMock(return_value=fresh))
+
+        self.assertEqual(session, fresh)
+        dead_transport.close.assert_called_once()
+        self.assertEqual(self.cache.stats()["reconnects"], 1)
+
+    def test_sessions_are_keyed_by_host_and_user(self):
+        """
+        Tests that a session for one user is not handed to another.
+        """
+        self.cache.checkin(self.key, *make_session())
+        other = make_session()
+
+        session = self.cache.checkout(('sftp.example.com', 22, 'other'), MagicMock(return_value=other))
+
+        self.assertEqual(session, other)
+        self.assertEqual(self.cache.stats()["idle"], 1)
+
+    def test_max_sessions_closes_least_recently_used(self):
+        """
+        Tests that the oldest idle session is closed when the cache is full.
+        """
+        sessions = [make_session() for _ in range(3)]
+        for transport, sftp in sessions:
+            self.cache.checkin(self.key, transport, sftp)
+
+        sessions[0][0].close.assert_called_once()
+        self.assertEqual(self.cache.stats()["idle"], 2)
+
+    def test_idle_sessions_are_evicted(self):
+        """
+        Tests that sessions idle for longer than the timeout are closed.
+        """
+        transport, sftp = make_session()
+        self.cache.idle_timeout = 0
+        self.cache.checkin(self.key, transport, sftp)
+
+        self.cache.evict_idle()
+
+        transport.close.assert_called_once()
+        self.assertEqual(self.cache.stats()["idle"], 0)
+
+    @patch('paramiko.SFTPClient.from_transport')
+    @patch('paramiko.Transport')
+    def test_handler_returns_session_to_cache(self, mock_transport, mock_from_transport):
+        """
+        Tests that SFTPHandler keeps its session in the cache instead of closing it.
+        """
+        handler = SFTPHandler('sftp.example.com', 'user', 'secret', session_cache=self.cache)
+
+        handler.connect()
+        handler.close_connection()
+        handler.connect()
+
+        mock_transport.assert_called_once_with(('sftp.example.com', 22))
+        mock_transport.return_value.close.assert_not_called()
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+    def test_forked_child_starts_with_empty_cache(self):
+        """
+        Tests that a child created with fork does not reuse the parent's sessions.
+        """
+        transport, sftp = make_session()
+        self.cache.checkin(self.key, transport, sftp)
+
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_end, str(self.cache.stats()["idle"]).encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end, "rb") as child_output:
+            self.assertEqual(child_output.read(), b"0")
+        self.assertEqual(self.cache.stats()["idle"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
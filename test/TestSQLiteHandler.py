@@ -0,0 +1,398 @@
+import datetime
+import importlib.util
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from db.SQLiteHandler import SQLiteHandler
+from utils.metrics import RunMetrics
+
+# create-db.py is a script, so it is loaded by path
+_spec = importlib.util.spec_from_file_location(
+    "create_db", os.path.join(os.path.dirname(os.path.dirname(__file__)), "create-db.py"))
+create_db = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(create_db)
+
+
+class TestSQLiteHandler(unittest.TestCase):
+    def setUp(self):
+        """
+        Sets up a fresh database with the application schema.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp_dir.name, "scheduled_tasks.db")
+        create_db.create_database(self.database_path)
+        self.handler = SQLiteHandler(self.database_path)
+        self.handler.connect()
+
+    def tearDown(self):
+        self.handler.close()
+        self.tmp_dir.cleanup()
+
+    def insert_task(self, task_name="report"):
+        return self.handler.insert_task(
+            task_name=task_name,
+            query="SELECT * FROM employees",
+            output_file="report.csv",
+            remote_path="/upload/report.csv",
+            sftp_host="sftp.example.com",
+            sftp_user="user",
+            sftp_password="secret",
+            cron_expression="0 * * * *"
+        )
+
+    def test_insert_and_get_tasks(self):
+        """
+        Tests that inserted tasks are returned as dictionaries.
+        """
+        task_id = self.insert_task()
+
+        tasks = self.handler.get_tasks()
+
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(tasks[0]["id"], task_id)
+        self.assertEqual(tasks[0]["status"], "pending")
+
+    def test_get_tasks_projected_and_paginated(self):
+        """
+        Tests column projection, status filters and keyset pagination of the task list.
+        """
+        task_ids = [self.insert_task(f"report_{index}") for index in range(5)]
+        self.handler.update_task_status(task_ids[1], "completed")
+        self.handler.update_task_status(task_ids[3], "error")
+
+        page = self.handler.get_tasks(columns=("task_name", "status"), limit=2)
+        self.assertEqual(page, [{"id": task_ids[0], "task_name": "report_0", "status": "pending"},
+                                {"id": task_ids[1], "task_name": "report_1", "status": "completed"}])
+        next_page = self.handler.get_tasks(columns=("task_name",), after_id=page[-1]["id"], limit=2)
+        self.assertEqual([task["id"] for task in next_page], task_ids[2:4])
+        self.assertEqual([task["id"] for task in self.handler.get_tasks(exclude_status="completed")],
+                         [task_ids[0], task_ids[2], task_ids[3], task_ids[4]])
+        self.assertEqual([task["id"] for task in self.handler.get_tasks(status=("completed", "error"))],
+                         [task_ids[1], task_ids[3]])
+        self.assertEqual([task["id"] for task in self.handler.iter_tasks(page_size=2, columns=("id",))], task_ids)
+        with self.assertRaises(ValueError):
+            self.handler.get_tasks(columns=("id", "password; DROP TABLE scheduled_tasks"))
+
+    def test_tasks_version_changes_with_the_table(self):
+        """
+        Tests that the change counter moves on inserts, updates and deletes only.
+        """
+        initial_version = self.handler.get_tasks_version()
+        task_id = self.insert_task()
+        after_insert = self.handler.get_tasks_version()
+        self.handler.get_tasks()
+        self.assertEqual(self.handler.get_tasks_version(), after_insert)
+
+        self.handler.update_task_status(task_id, "completed")
+        after_update = self.handler.get_tasks_version()
+        self.handler.connection.execute("DELETE FROM scheduled_tasks WHERE id = ?", (task_id,))
+        self.handler.connection.commit()
+
+        self.assertLess(initial_version, after_insert)
+        self.assertLess(after_insert, after_update)
+        self.assertLess(after_update, self.handler.get_tasks_version())
+
+    def test_task_changes(self):
+        """
+        Tests that only definition changes and deletions since a version are reported.
+        """
+        kept_id = self.insert_task("kept")
+        edited_id = self.insert_task("edited")
+        deleted_id = self.insert_task("deleted")
+        version, changed_tasks, deleted_ids = self.handler.get_task_changes(0)
+        self.assertEqual(([task["id"] for task in changed_tasks], deleted_ids), ([kept_id, edited_id, deleted_id], []))
+
+        self.handler.update_task_status(kept_id, "completed")
+        self.assertEqual(self.handler.get_task_changes(version), (version, [], []))
+
+        self.handler.connection.execute("UPDATE scheduled_tasks SET cron_expression = '*/5 * * * *' WHERE id = ?",
+                                        (edited_id,))
+        self.handler.connection.execute("DELETE FROM scheduled_tasks WHERE id = ?", (deleted_id,))
+        self.handler.connection.commit()
+
+        new_version, changed_tasks, deleted_ids = self.handler.get_task_changes(version)
+        self.assertEqual([(task["id"], task["cron_expression"]) for task in changed_tasks],
+                         [(edited_id, "*/5 * * * *")])
+        self.assertEqual(deleted_ids, [deleted_id])
+        self.assertEqual(self.handler.get_tasks_version(definitions_only=True), new_version)
+
+    def test_disable_task(self):
+        """
+        Tests disabling a task, which hides it from the enabled tasks and counts as a definition change.
+        """
+        task_id = self.insert_task()
+        other_id = self.insert_task("other")
+        version = self.handler.get_tasks_version(definitions_only=True)
+
+        self.assertTrue(self.handler.set_task_enabled(task_id, False))
+        self.assertFalse(self.handler.set_task_enabled(999, False))
+
+        self.assertEqual([task["id"] for task in self.handler.get_tasks(enabled=True)], [other_id])
+        self.assertEqual([task["id"] for task in self.handler.get_tasks(enabled=False)], [task_id])
+        self.assertEqual(self.handler.get_task(task_id)["enabled"], 0)
+        self.assertIsNone(self.handler.get_task(999))
+        _, changed_tasks, _ = self.handler.get_task_changes(version)
+        self.assertEqual([task["id"] for task in changed_tasks], [task_id])
+
+    def test_create_database_upgrades_existing_schema(self):
+        """
+        Tests that running create_database on an old database adds the new task columns.
+        """
+        old_database = os.path.join(self.tmp_dir.name, "old.db")
+        connection = sqlite3.connect(old_database)
+        connection.execute(
+            "CREATE TABLE scheduled_tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, task_name TEXT NOT NULL, "
+            "query TEXT NOT NULL, output_file TEXT NOT NULL, remote_path TEXT, sftp_host TEXT, sftp_user TEXT, "
+            "sftp_password TEXT, cron_expression TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+            "status TEXT DEFAULT 'pending', last_execution TIMESTAMP DEFAULT NULL, next_execution TIMESTAMP DEFAULT NULL)")
+        connection.close()
+
+        create_db.create_database(old_database)
+
+        connection = sqlite3.connect(old_database)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(scheduled_tasks)")}
+        connection.close()
+        for column_name, _ in create_db.SCHEDULED_TASKS_MIGRATIONS:
+            self.assertIn(column_name, columns)
+
+    def test_insert_task_with_codec(self):
+        """
+        Tests that the output codec settings are stored with the task.
+        """
+        task_id = self.handler.insert_task("report", "SELECT 1 FROM RDB$DATABASE", "report.csv", "/upload/report.csv",
+                                           "sftp.example.com", "user", "secret", "0 * * * *",
+                                           output_codec="zstd", codec_level=19)
+
+        task = self.handler.get_tasks()[0]
+
+        self.assertEqual(task["id"], task_id)
+        self.assertEqual((task["output_codec"], task["codec_level"]), ("zstd", 19))
+
+    def test_upload_checkpoint_lifecycle(self):
+        """
+        Tests saving, updating and deleting an upload checkpoint.
+        """
+        task_id = self.insert_task()
+        self.assertIsNone(self.handler.get_upload_checkpoint(task_id, "/upload/report.csv"))
+
+        self.handler.save_upload_checkpoint(task_id, "/upload/report.csv", 1024, "aaa")
+        self.handler.save_upload_checkpoint(task_id, "/upload/report.csv", 2048, "bbb")
+        self.assertEqual(self.handler.get_upload_checkpoint(task_id, "/upload/report.csv"),
+                         {"offset": 2048, "prefix_hash": "bbb"})
+
+        self.handler.delete_upload_checkpoint(task_id, "/upload/report.csv")
+        self.assertIsNone(self.handler.get_upload_checkpoint(task_id, "/upload/report.csv"))
+
+    def test_watermark_lifecycle(self):
+        """
+        Tests storing the watermark of an incremental task.
+        """
+        task_id = self.handler.insert_task("orders", "SELECT * FROM orders", "orders.csv", "/upload/orders.csv",
+                                           "sftp.example.com", "user", "secret", "0 * * * *",
+                                           watermark_column="UPDATED_AT")
+        self.assertIsNone(self.handler.get_watermark(task_id))
+
+        self.handler.update_watermark(task_id, "datetime:2024-01-31 08:00:00")
+
+        task = self.handler.get_tasks()[0]
+        self.assertEqual((task["watermark_column"], task["last_watermark"]), ("UPDATED_AT", "datetime:2024-01-31 08:00:00"))
+        self.assertEqual(self.handler.get_watermark(task_id), "datetime:2024-01-31 08:00:00")
+
+    def test_fetch_batch_size_is_not_a_definition_change(self):
+        """
+        Tests storing the learned batch size of a task without reporting it as a definition change.
+        """
+        task_id = self.insert_task()
+        version = self.handler.get_tasks_version(definitions_only=True)
+        self.assertIsNone(self.handler.get_fetch_batch_size(task_id))
+
+        self.handler.update_fetch_batch_size(task_id, 40000)
+
+        self.assertEqual(self.handler.get_fetch_batch_size(task_id), 40000)
+        self.assertEqual(self.handler.get_task_changes(version), (version, [], []))
+
+    def test_content_hash_and_skipped_runs(self):
+        """
+        Tests storing the hash of the last upload and recording a skipped run with its hash.
+        """
+        task_id = self.handler.insert_task("daily", "SELECT * FROM sales", "daily.csv", "/upload/daily.csv",
+                                           "sftp.example.com", "user", "secret", "0 * * * *", force_upload=True)
+        version = self.handler.get_tasks_version(definitions_only=True)
+        self.assertIsNone(self.handler.get_content_hash(task_id))
+
+        self.handler.update_content_hash(task_id, "ab12")
+        run = RunMetrics(task_id, "daily")
+        run.content_hash = "ab12"
+        run.finish("skipped")
+        self.handler.insert_task_run(run.as_record())
+
+        self.assertEqual(self.handler.get_content_hash(task_id), "ab12")
+        self.assertEqual(self.handler.get_task(task_id)["force_upload"], 1)
+        self.assertEqual(self.handler.get_task_changes(version), (version, [], []))
+        self.assertEqual([(run["status"], run["content_hash"]) for run in self.handler.get_last_runs(task_id)],
+                         [("skipped", "ab12")])
+
+    def test_destination_status(self):
+        """
+        Tests adding extra destinations to a task and recording the outcome of each upload.
+        """
+        task_id = self.insert_task()
+        first_id = self.handler.add_destination(task_id, "partner-a.example.com", "user", "secret", "/in/report.csv")
+        second_id = self.handler.add_destination(task_id, "partner-b.example.com", "user", "secret", "/in/report.csv",
+                                                 sftp_port=2222)
+
+        self.handler.update_destination_status(first_id, "completed", 1, 0.5)
+        self.handler.update_destination_status(second_id, "error", 3, 12.0, "Authentication failed.")
+
+        destinations = self.handler.get_destinations(task_id)
+        self.assertEqual([destination["id"] for destination in destinations], [first_id, second_id])
+        self.assertEqual((destinations[0]["status"], destinations[0]["attempts"]), ("completed", 1))
+        self.assertEqual((destinations[1]["sftp_port"], destinations[1]["status"], destinations[1]["last_error"]),
+                         (2222, "error", "Authentication failed."))
+
+    def test_insert_task_run(self):
+        """
+        Tests storing the metrics of a job run.
+        """
+        task_id = self.insert_task()
+        run = RunMetrics(task_id, "report")
+        run.add_timings({"execute": 0.25, "fetch": 1.5})
+        run.rows, run.bytes = 1000, 20480
+        run.finish("completed")
+
+        run_id = self.handler.insert_task_run(run.as_record())
+
+        row = self.handler.connection.execute(
+            "SELECT task_id, status, rows, bytes, stages FROM task_runs WHERE id = ?", (run_id,)).fetchone()
+        self.assertEqual(row[:4], (task_id, "completed", 1000, 20480))
+        self.assertEqual(json.loads(row[4]), {"execute": 0.25, "fetch": 1.5})
+
+    def insert_runs(self, task_id, runs):
+        for started_at, status, duration in runs:
+            self.handler.insert_task_run({
+                "task_id": task_id, "task_name": "report", "started_at": started_at, "finished_at": started_at,
+                "status": status, "duration_seconds": duration, "rows": 0, "bytes": 0, "rows_per_second": 0.0,
+                "stages": "{}", "error": None
+            })
+
+    def test_run_history_queries(self):
+        """
+        Tests the last runs, failure rate and duration percentile of a task.
+        """
+        task_id = self.insert_task()
+        other_id = self.insert_task("other")
+        self.insert_runs(task_id, [(f"2024-01-{day:02d} 08:00:00", "error" if day % 5 == 0 else "completed", day)
+                                   for day in range(1, 21)])
+        self.insert_runs(other_id, [("2024-01-10 08:00:00", "error", 99.0)])
+
+        last_runs = self.handler.get_last_runs(task_id, limit=3)
+        self.assertEqual([run["started_at"] for run in last_runs],
+                         ["2024-01-20 08:00:00", "2024-01-19 08:00:00", "2024-01-18 08:00:00"])
+        self.assertEqual(self.handler.get_failure_rate(task_id),
+                         {"runs": 20, "failures": 4, "failure_rate": 0.2})
+        self.assertEqual(self.handler.get_failure_rate(task_id, since=datetime.datetime(2024, 1, 11))["runs"], 10)
+        # 16 ejecuciones correctas: el p95 es la 16.ª duración ordenada
+        self.assertEqual(self.handler.get_duration_percentile(task_id), 19)
+        self.assertEqual(self.handler.get_duration_percentile(task_id, 0.5, status=None), 10)
+        self.assertIsNone(self.handler.get_duration_percentile(task_id, since="2025-01-01"))
+
+    def test_purge_and_compact_task_runs(self):
+        """
+        Tests that old runs are deleted, keeping the most recent ones of each task.
+        """
+        task_id = self.insert_task()
+        recent = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+        self.insert_runs(task_id, [(f"2020-01-{day:02d} 08:00:00", "completed", 1.0) for day in range(1, 11)])
+        self.insert_runs(task_id, [(recent, "completed", 1.0)])
+
+        self.assertEqual(self.handler.purge_task_runs(30, keep_last=3, batch_size=2), 8)
+
+        started = [run["started_at"] for run in self.handler.get_last_runs(task_id)]
+        self.assertEqual(started, [recent, "2020-01-10 08:00:00", "2020-01-09 08:00:00"])
+        self.assertEqual(self.handler.purge_task_runs(30), 2)
+        self.assertIsInstance(self.handler.compact(), bool)
+
+    def test_purge_and_compact_release_the_shared_lock(self):
+        """
+        Tests that purging takes the shared lock once per batch and that compacting does not need it.
+        """
+        task_id = self.insert_task()
+        self.insert_runs(task_id, [(f"2020-01-{day:02d} 08:00:00", "completed", 1.0) for day in range(1, 9)])
+        acquisitions = []
+        lock = self.handler.lock
+
+        class CountingLock:
+            def __enter__(self):
+                lock.acquire()
+                acquisitions.append(threading.current_thread().name)
+
+            def __exit__(self, *args):
+                lock.release()
+
+        self.handler.lock = CountingLock()
+        self.assertEqual(self.handler.purge_task_runs(30, batch_size=2), 8)
+        self.handler.lock = lock
+        # Lista de tareas + 5 lotes de borrado (el último no borra nada)
+        self.assertEqual(len(acquisitions), 6)
+
+        result = []
+        with self.handler.lock:
+            worker = threading.Thread(target=lambda: result.append(self.handler.compact(min_free_ratio=0)))
+            worker.start()
+            worker.join(timeout=10)
+        self.assertEqual(result, [True])
+
+    def test_shared_connection_uses_wal(self):
+        """
+        Tests that the connection is opened in WAL mode and that connecting again reuses it.
+        """
+        connection = self.handler.connection
+
+        self.handler.connect()
+
+        self.assertIs(self.handler.connection, connection)
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_queued_writes_from_many_threads(self):
+        """
+        Tests that status updates and runs queued by concurrent threads are written in one flush.
+        """
+        task_ids = [self.insert_task(f"report_{index}") for index in range(20)]
+
+        def complete(task_id):
+            run = RunMetrics(task_id, "report")
+            run.finish("completed")
+            self.handler.queue_task_run(run.as_record())
+            self.handler.queue_task_status(task_id, "completed")
+
+        threads = [threading.Thread(target=complete, args=(task_id,)) for task_id in task_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({task["status"] for task in self.handler.get_tasks()}, {"pending"})
+
+        self.assertEqual(self.handler.flush(), 40)
+
+        self.assertEqual({task["status"] for task in self.handler.get_tasks()}, {"completed"})
+        self.assertEqual(self.handler.get_failure_rate(task_ids[0])["runs"], 1)
+        self.assertEqual(self.handler.flush(), 0)
+
+    def test_close_writes_queued_updates(self):
+        """
+        Tests that closing the handler writes the updates still queued.
+        """
+        task_id = self.insert_task()
+        self.handler.queue_task_status(task_id, "error")
+
+        self.handler.close()
+        self.handler.connect()
+
+        self.assertEqual(self.handler.get_tasks()[0]["status"], "error")
+
+if __name__ == "__main__":
+    unittest.main()
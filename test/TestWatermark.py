@@ -0,0 +1,48 @@
+import datetime
+import decimal
+import unittest
+
+from utils.watermark import decode_watermark, delta_path, encode_watermark, incremental_query
+
+
+class TestWatermark(unittest.TestCase):
+    def test_incremental_query(self):
+        """
+        Tests that the delta query is bounded on both sides once the task has a watermark.
+        """
+        first_run = incremental_query("SELECT * FROM orders", "ID", has_lower_bound=False)
+        next_run = incremental_query("SELECT * FROM orders", "ID", has_lower_bound=True)
+
+        self.assertEqual(first_run, "SELECT * FROM (SELECT * FROM orders) incremental_source WHERE ID <= ? ORDER BY ID")
+        self.assertEqual(next_run, "SELECT * FROM (SELECT * FROM orders) incremental_source "
+                                   "WHERE ID > ? AND ID <= ? ORDER BY ID")
+
+    def test_watermark_round_trip(self):
+        """
+        Tests that stored watermarks come back with a type Firebird can compare.
+        """
+        for value in (125, datetime.datetime(2024, 1, 31, 8, 0, 0, 123000), datetime.date(2024, 1, 31),
+                      decimal.Decimal("10.50"), decimal.Decimal("7"), "2024-01", "125"):
+            decoded = decode_watermark(encode_watermark(value))
+            self.assertEqual(decoded, value)
+            self.assertIs(type(decoded), type(value))
+        self.assertIsNone(decode_watermark(encode_watermark(None)))
+
+    def test_decode_watermark_unknown_type(self):
+        """
+        Tests that a watermark stored without a known type is rejected instead of guessed.
+        """
+        with self.assertRaises(ValueError):
+            decode_watermark("125")
+
+    def test_delta_path(self):
+        """
+        Tests that the run time is added before the extension.
+        """
+        run_time = datetime.datetime(2024, 1, 31, 8, 0, 0)
+
+        self.assertEqual(delta_path("/upload/orders.csv", run_time, remote=True), "/upload/orders_20240131T080000.csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
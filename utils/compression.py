@@ -0,0 +1,124 @@
+import gzip
+import zlib
+
+# Output codecs a task can use, with the extension appended to its file names
+CODECS = ("none", "gzip", "zstd")
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The 'zstd' output codec requires the zstandard package: pip install zstandard")
+    return zstandard
+
+
+def validate_codec(codec):
+    """
+    Normalizes a codec name, treating empty values as ``none``.
+
+    :raises ValueError: If the codec is not supported
+    """
+    codec = (codec or "none").lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported output codec '{codec}'. Expected one of: {', '.join(CODECS)}.")
+    return codec
+
+
+def with_extension(path, codec):
+    """
+    Appends the codec extension (``.gz``, ``.zst``) to a path that does not already have it.
+    """
+    extension = EXTENSIONS.get(validate_codec(codec), "")
+    if not path or path.endswith(extension):
+        return path
+    return path + extension
+
+
+def open_output(path, codec="none", level=None, fileobj=None):
+    """
+    Opens a binary file for writing that compresses the data as it is written.
+
+    :param path: Path of the output file
+    :param codec: One of ``CODECS``
+    :param level: Compression level, or None for the codec default
+    :param fileobj: Binary file object the compressed data is written to instead of opening ``path``;
+        it is closed with the returned object, or before the error if the codec cannot be set up
+    :return: Writable binary file object. gzip headers carry no timestamp, so the same content
+        always produces the same bytes
+    """
+    codec = validate_codec(codec)
+    level = level if level is not None else DEFAULT_LEVELS.get(codec)
+    fileobj = fileobj or open(path, "wb")
+    try:
+        if codec == "gzip":
+            return _ClosingGzipFile(filename=path, mode="wb", compresslevel=level, fileobj=fileobj, mtime=0)
+        if codec == "zstd":
+            return _zstandard().ZstdCompressor(level=level).stream_writer(fileobj, closefd=True)
+        return fileobj
+    except Exception:
+        # Sin el flujo comprimido nadie más cerraría el archivo
+        fileobj.close()
+        raise
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    # GzipFile no cierra el fileobj que recibe; aquí se cierra junto con el archivo comprimido
+    def close(self):
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def open_input(path, codec="none"):
+    """
+    Opens a file written by ``open_output`` for reading, decompressing it as it is read.
+
+    :param path: Path of the file
+    :param codec: One of ``CODECS``
+    :return: Readable binary file object
+    """
+    codec = validate_codec(codec)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "zstd":
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+class Compressor:
+    """
+    Incremental compressor for data that is produced in chunks, e.g. while streaming an upload.
+    """
+
+    def __init__(self, codec="none", level=None):
+        """
+        :param codec: One of ``CODECS``
+        :param level: Compression level, or None for the codec default
+        """
+        self.codec = validate_codec(codec)
+        level = level if level is not None else DEFAULT_LEVELS.get(self.codec)
+        if self.codec == "gzip":
+            # wbits=31 produce el formato gzip (cabecera y CRC) en lugar de zlib
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif self.codec == "zstd":
+            self._compressor = _zstandard().ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = None
+
+    def compress(self, data):
+        """
+        :return: Compressed bytes available so far (possibly empty)
+        """
+        return self._compressor.compress(data) if self._compressor else data
+
+    def flush(self):
+        """
+        :return: The remaining compressed bytes; the compressor cannot be used afterwards
+        """
+        return self._compressor.flush() if self._compressor else b""
@@ -0,0 +1,54 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+
+class KeyedLimiter:
+    """
+    Caps how many jobs work against the same target (e.g. an SFTP host) at the same time.
+
+    Every key gets its own semaphore, created the first time the key is used.
+    """
+
+    def __init__(self, limit):
+        """
+        :param limit: Maximum concurrent holders per key; 0 or less disables the limit
+        """
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+        # Un proceso hijo creado con fork empieza sin los huecos que ocupaban los trabajos del padre
+        reset_after_fork = weakref.WeakMethod(self._reset_after_fork)
+        os.register_at_fork(after_in_child=lambda: reset_after_fork() and reset_after_fork()())
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @contextmanager
+    def limit_for(self, key):
+        """
+        Context manager that waits until fewer than ``limit`` jobs hold ``key``.
+
+        :param key: Hashable identifier of the target
+        """
+        if self.limit <= 0:
+            yield
+            return
+
+        with self._lock:
+            semaphore = self._semaphores.setdefault(key, threading.BoundedSemaphore(self.limit))
+
+        if not semaphore.acquire(blocking=False):
+            start_time = time.monotonic()
+            logging.info(f"Concurrency limit of {self.limit} reached for {key}. Waiting for a free slot.")
+            semaphore.acquire()
+            logging.info(f"Got a slot for {key} after {time.monotonic() - start_time:.2f} seconds.")
+        try:
+            yield
+        finally:
+            semaphore.release()
@@ -0,0 +1,55 @@
+import hashlib
+import io
+
+from utils.compression import open_output
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    Binary file object that feeds everything written to it into a hash before passing it on, so a
+    file can be hashed while it is written instead of being read again afterwards.
+    """
+
+    def __init__(self, fileobj, hasher=None):
+        """
+        :param fileobj: Binary file object the data is written to; it is closed with this one
+        :param hasher: hashlib object to update; a new SHA-256 by default
+        """
+        self._fileobj = fileobj
+        self.hasher = hasher if hasher is not None else hashlib.sha256()
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.bytes += len(data)
+        return self._fileobj.write(data)
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.close()
+        super().close()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    :return: Hex SHA-256 of a file, read in chunks
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def open_hashed_output(path, codec="none", level=None, hasher=None):
+    """
+    Opens ``path`` with ``open_output``, hashing the bytes that reach the disk.
+
+    :param hasher: hashlib object to update; a new SHA-256 by default
+    :return: Tuple ``(output, hashing_writer)``; closing ``output`` closes the file
+    """
+    hashing_writer = HashingWriter(open(path, "wb"), hasher)
+    return open_output(path, codec, level, fileobj=hashing_writer), hashing_writer
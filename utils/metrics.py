@@ -0,0 +1,213 @@
+import datetime
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prefijo de todas las métricas expuestas
+METRIC_PREFIX = "firebird_sftp"
+
+
+class RunMetrics:
+    """
+    Timings, rows and bytes of a single job run.
+
+    Stage durations are accumulated, so a stage that runs several times (retries, partitions)
+    reports its total time. Safe to update from the threads of one run.
+    """
+
+    def __init__(self, task_id, task_name):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.started_at = datetime.datetime.now()
+        self.stages = {}
+        self.rows = 0
+        self.bytes = 0
+        self.status = None
+        self.error = None
+        self.duration_seconds = None
+        # Hash of the generated output, used to skip uploads of unchanged results
+        self.content_hash = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that adds the time spent inside it to stage ``name``.
+        """
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - stage_start)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_timings(self, timings):
+        """
+        Adds a dictionary of stage durations, such as ``FirebirdHandler.timings``.
+        """
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.duration_seconds = time.perf_counter() - self._start
+
+    @property
+    def rows_per_second(self):
+        if not self.duration_seconds:
+            return 0.0
+        return self.rows / self.duration_seconds
+
+    def as_record(self):
+        """
+        :return: Dictionary with the columns of a ``task_runs`` row
+        """
+        return {
+            "task_id": self.task_id,
+            "task_name": self.task_name,
+            "started_at": self.started_at.isoformat(sep=" ", timespec="seconds"),
+            "finished_at": (self.started_at + datetime.timedelta(seconds=self.duration_seconds or 0)).isoformat(
+                sep=" ", timespec="seconds"),
+            "status": self.status,
+            "duration_seconds": self.duration_seconds,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rows_per_second": self.rows_per_second,
+            "stages": json.dumps({name: round(seconds, 6) for name, seconds in self.stages.items()}),
+            "error": self.error,
+            "content_hash": self.content_hash
+        }
+
+
+class MetricsRegistry:
+    """
+    Aggregates finished runs and renders them in the Prometheus text exposition format.
+
+    Components that keep their own counters (connection pool, caches) are added with
+    ``register_stats`` and read when the metrics are scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}  # (task_id, task_name, status) -> count
+        self._stages = {}  # (task_id, task_name, stage) -> [count, seconds]
+        self._totals = {}  # (task_id, task_name) -> {"rows", "bytes", last run values}
+        self._stats = {}  # name -> callable returning a dictionary of numbers
+
+    def observe(self, run):
+        """
+        Adds a finished run.
+
+        :param run: RunMetrics after ``finish``
+        """
+        task = (str(run.task_id), run.task_name or "")
+        with self._lock:
+            run_key = task + (run.status,)
+            self._runs[run_key] = self._runs.get(run_key, 0) + 1
+            for name, seconds in run.stages.items():
+                stage = self._stages.setdefault(task + (name,), [0, 0.0])
+                stage[0] += 1
+                stage[1] += seconds
+            totals = self._totals.setdefault(task, {"rows": 0, "bytes": 0})
+            totals["rows"] += run.rows
+            totals["bytes"] += run.bytes
+            totals["last_duration_seconds"] = run.duration_seconds or 0.0
+            totals["last_rows_per_second"] = run.rows_per_second
+            totals["last_run_timestamp_seconds"] = run.started_at.timestamp()
+
+    def register_stats(self, name, stats):
+        """
+        Exposes the numeric entries of ``stats()`` as gauges named ``<prefix>_<name>_<entry>``.
+        """
+        with self._lock:
+            self._stats[name] = stats
+
+    def render(self):
+        """
+        :return: Metrics in the Prometheus text format
+        """
+        lines = []
+        with self._lock:
+            runs = dict(self._runs)
+            stages = {key: list(value) for key, value in self._stages.items()}
+            totals = {key: dict(value) for key, value in self._totals.items()}
+            stats = dict(self._stats)
+
+        self._family(lines, "task_runs_total", "counter", "Finished task runs by status.",
+                     [({"task_id": key[0], "task": key[1], "status": key[2]}, count) for key, count in runs.items()])
+        self._family(lines, "task_stage_seconds", "summary", "Time spent per stage of the task runs.",
+                     [({"task_id": key[0], "task": key[1], "stage": key[2]}, value[1]) for key, value in stages.items()],
+                     suffix="_sum")
+        self._family(lines, "task_stage_seconds", None, None,
+                     [({"task_id": key[0], "task": key[1], "stage": key[2]}, value[0]) for key, value in stages.items()],
+                     suffix="_count")
+        for field, metric_type, description in (
+                ("rows", "counter", "Rows exported."),
+                ("bytes", "counter", "Bytes of the generated files."),
+                ("last_duration_seconds", "gauge", "Duration of the last run."),
+                ("last_rows_per_second", "gauge", "Throughput of the last run."),
+                ("last_run_timestamp_seconds", "gauge", "Start time of the last run.")):
+            name = f"task_{field}_total" if metric_type == "counter" else f"task_{field}"
+            self._family(lines, name, metric_type, description,
+                         [({"task_id": key[0], "task": key[1]}, value[field]) for key, value in totals.items()])
+
+        for stats_name, read_stats in stats.items():
+            try:
+                values = read_stats()
+            except Exception as e:
+                logging.warning(f"Could not read {stats_name} stats: {e}")
+                continue
+            for entry, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._family(lines, f"{stats_name}_{entry}", "gauge", None, [({}, value)])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _family(lines, name, metric_type, description, samples, suffix=""):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        if description:
+            lines.append(f"# HELP {full_name} {description}")
+        if metric_type:
+            lines.append(f"# TYPE {full_name} {metric_type}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+            lines.append(f"{full_name}{suffix}{{{label_text}}} {value}" if label_text else f"{full_name}{suffix} {value}")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def start_metrics_server(registry, port, host="0.0.0.0"):
+    """
+    Serves ``registry`` on ``http://host:port/metrics`` from a daemon thread.
+
+    :return: The running ThreadingHTTPServer; call ``shutdown()`` to stop it
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Metrics request: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Metrics available on http://{host}:{server.server_address[1]}/metrics")
+    return server
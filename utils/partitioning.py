@@ -0,0 +1,62 @@
+import datetime
+import decimal
+
+# Tipos de columna que se pueden dividir en rangos
+_SPLITTABLE_TYPES = (int, float, decimal.Decimal, datetime.date, datetime.datetime)
+
+
+def bounds_query(query, partition_column):
+    """
+    :return: SQL that reads the lowest and highest value of the partition column and the number of
+        rows of the query, NULLs included
+    """
+    return (f"SELECT MIN({partition_column}), MAX({partition_column}), COUNT(*) "
+            f"FROM ({query}) partition_source")
+
+
+def partition_ranges(low, high, partitions):
+    """
+    Splits ``[low, high]`` into up to ``partitions`` contiguous ranges of similar width.
+
+    :param low: Lowest value of the partition column
+    :param high: Highest value of the partition column
+    :param partitions: Number of ranges wanted
+    :return: List of ``(start, end)`` tuples; every range includes ``start`` and excludes ``end``,
+        except the last one, which includes ``high``. Narrow ranges are merged, so fewer ranges
+        than requested can be returned.
+    :raises TypeError: If the column type cannot be split into ranges
+    """
+    if not isinstance(low, _SPLITTABLE_TYPES) or not isinstance(high, _SPLITTABLE_TYPES):
+        raise TypeError(f"Cannot split a partition column of type {type(low).__name__} into ranges.")
+
+    width = high - low
+    boundaries = [low]
+    for index in range(1, partitions):
+        if isinstance(low, int):
+            boundary = low + width * index // partitions
+        else:
+            boundary = low + width * index / partitions
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    boundaries.append(high)
+    if len(boundaries) == 2 and low == high:
+        return [(low, high)]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def partition_query(query, partition_column, is_first, is_last, ordered=False):
+    """
+    Restricts a task query to one range of the partition column.
+
+    The first range also returns the rows where the column is NULL, so no row is lost.
+
+    :param ordered: Whether the range is sorted by the partition column, so the parts joined in
+        range order keep the whole result sorted
+    :return: SQL with two parameters, the start and the end of the range
+    """
+    upper_operator = "<=" if is_last else "<"
+    condition = f"{partition_column} >= ? AND {partition_column} {upper_operator} ?"
+    if is_first:
+        condition = f"({condition}) OR {partition_column} IS NULL"
+    order_by = f" ORDER BY {partition_column}" if ordered else ""
+    return f"SELECT * FROM ({query}) partition_source WHERE {condition}{order_by}"
@@ -0,0 +1,93 @@
+import logging
+import queue
+import threading
+
+# Marca de fin de datos entre etapas
+_END = object()
+
+
+class _StageError:
+    """Carries an exception raised in a stage thread to the consumer side."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, item, cancelled):
+    """
+    Puts an item on a bounded queue, giving up if the pipeline has been cancelled.
+
+    :return: False if the pipeline was cancelled while waiting for room
+    """
+    while not cancelled.is_set():
+        try:
+            out_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(in_queue, cancelled):
+    """
+    Yields items from a queue until the end marker, re-raising errors from upstream stages.
+    """
+    while not cancelled.is_set():
+        try:
+            item = in_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+def _run_stage(items, transform, out_queue, cancelled):
+    try:
+        for item in items:
+            if not _put(out_queue, transform(item) if transform else item, cancelled):
+                return
+        _put(out_queue, _END, cancelled)
+    except Exception as e:
+        logging.error(f"Pipeline stage failed: {e}")
+        _put(out_queue, _StageError(e), cancelled)
+    finally:
+        # Cierra el generador de origen (y su cursor) en el mismo hilo que lo consumía
+        if hasattr(items, "close"):
+            items.close()
+
+
+def run_pipeline(source, stages, sink, queue_size=4):
+    """
+    Runs a producer/consumer pipeline where every step works concurrently.
+
+    The source is consumed in its own thread, each stage runs in its own thread and the sink runs
+    in the calling thread. Steps are connected by queues of ``queue_size`` items, so a slow sink
+    applies back-pressure instead of letting items pile up in memory.
+
+    :param source: Iterable producing the input items
+    :param stages: List of callables, each turning one item into the next step's item
+    :param sink: Callable receiving an iterable with the output of the last stage
+    :param queue_size: Maximum number of items waiting between two steps
+    :return: Whatever the sink returns
+    """
+    cancelled = threading.Event()
+    threads = []
+
+    items = source
+    for transform in [None] + list(stages):
+        out_queue = queue.Queue(maxsize=queue_size)
+        thread = threading.Thread(target=_run_stage, args=(items, transform, out_queue, cancelled), daemon=True)
+        thread.start()
+        threads.append(thread)
+        items = _drain(out_queue, cancelled)
+
+    try:
+        return sink(items)
+    finally:
+        # Si el consumidor termina antes (o falla) se liberan los productores bloqueados
+        cancelled.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,95 @@
+import datetime
+import decimal
+import os
+import posixpath
+
+
+def incremental_query(query, watermark_column, has_lower_bound):
+    """
+    Wraps a task query so it only returns the rows past the last exported watermark.
+
+    The result is bounded above by the watermark read at the start of the run, so rows committed
+    while the export is running are left for the next run instead of being skipped.
+
+    :param query: Query stored in the task
+    :param watermark_column: Column of the query result that only grows (timestamp, generator ID)
+    :param has_lower_bound: Whether the task already has a watermark; the first run exports everything
+    :return: SQL whose parameters are ``(lower bound, upper bound)``, or only the upper bound on the
+        first run
+    """
+    conditions = [f"{watermark_column} <= ?"]
+    if has_lower_bound:
+        conditions.insert(0, f"{watermark_column} > ?")
+    return (f"SELECT * FROM ({query}) incremental_source WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {watermark_column}")
+
+
+def max_watermark_query(query, watermark_column):
+    """
+    :return: SQL that reads the current highest watermark of the task query
+    """
+    return f"SELECT MAX({watermark_column}) FROM ({query}) incremental_source"
+
+
+# Tipos de marca de agua: nombre guardado en SQLite y cómo se reconstruye el valor
+WATERMARK_TYPES = {
+    "int": int,
+    "decimal": decimal.Decimal,
+    "float": float,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "str": str
+}
+
+
+def _watermark_type(value):
+    # datetime antes que date: datetime es una subclase de date
+    for type_name, value_type in (("datetime", datetime.datetime), ("date", datetime.date),
+                                  ("time", datetime.time), ("decimal", decimal.Decimal),
+                                  ("int", int), ("float", float)):
+        if isinstance(value, value_type):
+            return type_name
+    return "str"
+
+
+def encode_watermark(value):
+    """
+    Converts a watermark read from Firebird to the text stored in SQLite, prefixed with its type
+    (``int:125``, ``datetime:2024-01-31 08:00:00``) so it is decoded back to the same type.
+    """
+    if value is None:
+        return None
+    type_name = _watermark_type(value)
+    text = value.isoformat(sep=" ") if type_name == "datetime" else str(value)
+    return f"{type_name}:{text}"
+
+
+def decode_watermark(text):
+    """
+    Converts a stored watermark back to the value Firebird returned for the column, using the type
+    stored with it.
+
+    :raises ValueError: If the text does not start with a known type
+    """
+    if text is None:
+        return None
+    type_name, _, value = text.partition(":")
+    if type_name not in WATERMARK_TYPES:
+        raise ValueError(f"Unknown watermark type in {text!r}")
+    return WATERMARK_TYPES[type_name](value)
+
+
+def delta_path(path, run_time, remote=False):
+    """
+    Adds the run timestamp to a file name, so every incremental run produces its own delta file.
+
+    ``report.csv`` becomes ``report_20240131T080000.csv``.
+
+    :param path: Local or remote path of the task output
+    :param run_time: Datetime of the run
+    :param remote: Whether the path is a remote (POSIX) path
+    """
+    path_module = posixpath if remote else os.path
+    root, extension = path_module.splitext(path)
+    return f"{root}_{run_time.strftime('%Y%m%dT%H%M%S')}{extension}"